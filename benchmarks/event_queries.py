@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+"""
+Compares the query plans of the exposure and goal achievement queries
+this package issues with and without the composite event indexes.
+
+Seeds a throwaway test database and prints, for every query, the
+execution time and the top of the plan under both schemas:
+
+    python benchmarks/event_queries.py --exposures 500000
+"""
+from __future__ import unicode_literals, absolute_import
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # NOQA
+
+
+# Single column indexes the event tables had before the composite ones
+BASELINE_INDEXES = [
+    ('Exposure', ['experiment']),
+    ('Exposure', ['variation']),
+    ('GoalAchievement', ['goal']),
+]
+
+
+def seed(exposures, achievements, experiments, variations, users):
+    from django.db import connection
+    from django.contrib.auth.models import User
+
+    from planout_experiments.models import Experiment, Exposure, Goal, GoalAchievement, Variation
+
+    User.objects.bulk_create([User(username='user_{}'.format(i)) for i in range(users)])
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    goal = Goal.objects.create(name='purchase', description='benchmark goal')
+
+    for index in range(experiments):
+        experiment = Experiment.objects.create(name='Benchmark {}'.format(index))
+        experiment.goals.add(goal)
+        Variation.objects.bulk_create([
+            Variation(experiment=experiment, key='arm', value=str(value)) for value in range(variations)
+        ])
+
+    variation_rows = list(Variation.objects.values_list('pk', 'experiment_id'))
+
+    exposure_table = Exposure._meta.db_table
+    achievement_table = GoalAchievement._meta.db_table
+
+    with connection.cursor() as cursor:
+        # Half the events belong to django users, half to device ids
+        cursor.execute(
+            """
+            INSERT INTO {table} (created, modified, seen_at, data_meta, experiment_id, variation_id, hits, sample_rate,
+                event_user_id, event_user_identifier, event_user_identifier_type)
+            SELECT now(), now(), now() - (n %% 2160) * interval '1 hour', '{{}}', v.experiment_id, v.id, 1, 1.0,
+                CASE WHEN n %% 2 = 0 THEN (%s::int[])[1 + n %% %s] END,
+                CASE WHEN n %% 2 = 1 THEN 'device-' || (n %% %s) END,
+                CASE WHEN n %% 2 = 0 THEN 'django_user_db_id' ELSE 'device_id' END
+            FROM generate_series(1, %s) n
+            JOIN unnest(%s::int[], %s::int[]) WITH ORDINALITY AS v (id, experiment_id, position)
+                ON v.position = 1 + n %% %s
+            """.format(table=exposure_table),
+            [
+                user_ids, len(user_ids), users, exposures,
+                [pk for pk, _ in variation_rows], [experiment_id for _, experiment_id in variation_rows],
+                len(variation_rows)
+            ]
+        )
+        cursor.execute(
+            """
+            INSERT INTO {table} (created, modified, seen_at, data_meta, goal_id, value,
+                event_user_id, event_user_identifier, event_user_identifier_type)
+            SELECT now(), now(), now() - (n %% 2160) * interval '1 hour', '{{}}', %s, 1.0,
+                CASE WHEN n %% 2 = 0 THEN (%s::int[])[1 + n %% %s] END,
+                CASE WHEN n %% 2 = 1 THEN 'device-' || (n %% %s) END,
+                CASE WHEN n %% 2 = 1 THEN 'device_id' END
+            FROM generate_series(1, %s) n
+            """.format(table=achievement_table),
+            [goal.pk, user_ids, len(user_ids), users, achievements]
+        )
+        cursor.execute("ANALYZE {}".format(exposure_table))
+        cursor.execute("ANALYZE {}".format(achievement_table))
+
+    return goal
+
+
+def benchmark_queries(goal):
+    """
+    (label, callable) pairs issuing the package's queries
+    """
+    from datetime import timedelta
+
+    from django.utils.timezone import now
+
+    from planout_experiments.attribution import goal_attribution
+    from planout_experiments.models import Experiment, Exposure, GoalAchievement
+
+    experiment = Experiment.objects.order_by('pk').first()
+    variation = experiment.variations.order_by('pk').first()
+    user_id = GoalAchievement.objects.filter(event_user__isnull=False).values_list('event_user_id', flat=True)[0]
+    since = now() - timedelta(days=7)
+
+    return [
+        (
+            'exposures for experiment and variation',
+            lambda: Exposure.objects.filter(experiment=experiment, variation=variation).count()
+        ),
+        (
+            'exposures for experiment since T',
+            lambda: Exposure.objects.filter(experiment=experiment, seen_at__gte=since).count()
+        ),
+        (
+            'achievements for goal by event_user since T',
+            lambda: GoalAchievement.objects.filter(goal=goal, event_user_id=user_id, seen_at__gte=since).count()
+        ),
+        (
+            'achievements for goal by identifier since T',
+            lambda: GoalAchievement.objects.filter(
+                goal=goal,
+                event_user_identifier_type='device_id',
+                event_user_identifier='device-7',
+                seen_at__gte=since
+            ).count()
+        ),
+        (
+            'Variation.goal_achievements',
+            lambda: variation.goal_achievements(goal).count()
+        ),
+        (
+            'goal_attribution',
+            lambda: goal_attribution(experiment.pk, goal.pk)
+        ),
+    ]
+
+
+def explain(query):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as captured:
+        query()
+
+    sql = captured.captured_queries[-1]['sql']
+
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql)
+        plan = [row[0] for row in cursor.fetchall()]
+
+    execution = next(line for line in plan if line.startswith('Execution Time'))
+    return float(execution.split(':')[1].split()[0]), plan
+
+
+def use_baseline_schema():
+    """
+    Swaps the composite event indexes for the single column foreign key
+    indexes the tables used to have
+    """
+    from django.apps import apps
+    from django.db import connection, models
+
+    from planout_experiments.partitioning import get_partitioned_models
+
+    with connection.schema_editor(atomic=False) as schema_editor:
+        for model in get_partitioned_models():
+            for index in model._meta.indexes:
+                if len(index.fields) > 1:
+                    schema_editor.remove_index(model, index)
+
+        for model_name, fields in BASELINE_INDEXES:
+            model = apps.get_model('planout_experiments', model_name)
+            index = models.Index(fields=fields, name='baseline_{}_{}'.format(model_name.lower(), fields[0]))
+            schema_editor.add_index(model, index)
+
+    with connection.cursor() as cursor:
+        for model in get_partitioned_models():
+            cursor.execute("ANALYZE {}".format(model._meta.db_table))
+
+
+def run(options):
+    from django.db import connection, transaction
+
+    goal = seed(options.exposures, options.achievements, options.experiments, options.variations, options.users)
+    queries = benchmark_queries(goal)
+    results = {}
+
+    for schema in ('baseline', 'composite'):
+        with transaction.atomic():
+            if schema == 'baseline':
+                use_baseline_schema()
+
+            for label, query in queries:
+                timings = []
+
+                for _ in range(options.repeat):
+                    timing, plan = explain(query)
+                    timings.append(timing)
+
+                results.setdefault(label, {})[schema] = (min(timings), plan)
+
+            transaction.set_rollback(True)
+
+    print("{:<48} {:>12} {:>12}".format('query', 'baseline ms', 'composite ms'))
+
+    for label, _ in queries:
+        print("{:<48} {:>12.3f} {:>12.3f}".format(
+            label,
+            results[label]['baseline'][0],
+            results[label]['composite'][0]
+        ))
+
+    if options.plans:
+        for label, _ in queries:
+            for schema in ('baseline', 'composite'):
+                print("\n{} ({})".format(label, schema))
+                print('\n'.join(results[label][schema][1]))
+
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exposures', type=int, default=200000)
+    parser.add_argument('--achievements', type=int, default=20000)
+    parser.add_argument('--experiments', type=int, default=20)
+    parser.add_argument('--variations', type=int, default=4)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--plans', action='store_true', help="Print the full query plans")
+    options = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    django.setup()
+
+    from django.db import connection
+
+    # Everything happens in a test database that is dropped afterwards
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    try:
+        run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 from django.apps import AppConfig
 
 
-class ExperimentsConfig(AppConfig):
-    name = 'experiments'
+class PlanoutExperimentsConfig(AppConfig):
+    name = 'planout_experiments'
+
+    def ready(self):
+        from . import signals  # NOQA
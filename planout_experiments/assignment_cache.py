@@ -0,0 +1,178 @@
+"""
+Optional assignment cache shared by every process through a django
+cache backend. Set PLANOUT_EXPERIMENTS_ASSIGNMENT_CACHE to a cache alias
+and trials store their parameters and whether their exposure was logged
+under keys versioned by the experiment's script and salt, so other
+workers neither reassign the unit nor log its exposure again. Editing an
+experiment's script or salt moves it to new keys, the old ones expire.
+"""
+import json
+import hashlib
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .conf import get_setting
+
+
+KEY_PREFIX = 'planout_experiments'
+
+
+def get_cache():
+    """
+    The configured cache backend, None when the cache is disabled
+    """
+    alias = get_setting('ASSIGNMENT_CACHE')
+
+    if alias is None:
+        return None
+
+    return caches[alias]
+
+
+def experiment_version(experiment, salt):
+    compiled_script = experiment.get_compiled_script()
+    return hashlib.sha1('{}:{}'.format(compiled_script.content_hash, salt).encode('utf-8')).hexdigest()[:12]
+
+
+def unit_hash(inputs):
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def experiment_key_prefix(experiment, salt):
+    return '{}:{}:{}'.format(KEY_PREFIX, experiment.pk, experiment_version(experiment, salt))
+
+
+def unit_keys(prefix, inputs):
+    """
+    (assignment key, exposure key) of the unit described by ``inputs``
+    """
+    base = '{}:{}'.format(prefix, unit_hash(inputs))
+    return base + ':params', base + ':exposed'
+
+
+def trial_keys(trial):
+    """
+    (assignment key, exposure key) of a trial, None when its assignment
+    can't be shared because overrides are set
+    """
+    if trial._assignment.get_overrides():
+        return None
+
+    return unit_keys(experiment_key_prefix(trial.db_experiment, trial.salt), trial.inputs)
+
+
+def get_cached(keys):
+    """
+    The cached values of ``keys`` with a single get_many, empty when the
+    cache is disabled
+    """
+    cache = get_cache()
+
+    if cache is None or not keys:
+        return {}
+
+    return cache.get_many(keys)
+
+
+def set_assignments(values):
+    """
+    Caches {assignment key: (params, in_experiment)} with one set_many
+    """
+    cache = get_cache()
+
+    if cache is not None and values:
+        cache.set_many(values, timeout=get_setting('ASSIGNMENT_CACHE_TIMEOUT', 86400))
+
+
+def set_exposed(keys):
+    """
+    Marks exposure keys as logged once the surrounding transaction
+    commits, with one set_many
+    """
+    cache = get_cache()
+
+    if cache is not None and keys:
+        timeout = get_setting('ASSIGNMENT_CACHE_TIMEOUT', 86400)
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, True), timeout=timeout))
+
+
+def load_assignments(trials):
+    """
+    Applies cached assignments and exposure markers to ``trials`` with a
+    single get_many, returns the trials that were not found
+    """
+    if get_cache() is None:
+        return list(trials)
+
+    keyed = [(trial, trial_keys(trial)) for trial in trials]
+    found = get_cached([key for _, keys in keyed if keys is not None for key in keys])
+    missing = []
+
+    for trial, keys in keyed:
+        # Misses are assigned without looking them up again
+        trial._assignment_cache_checked = True
+
+        if keys is None:
+            missing.append(trial)
+            continue
+
+        if keys[1] in found:
+            trial._exposure_logged = True
+
+        if keys[0] not in found:
+            missing.append(trial)
+            continue
+
+        params, in_experiment = found[keys[0]]
+        trial.loadScript()
+        trial._assignment.update(params)
+        trial._in_experiment = in_experiment
+        trial._checksum = trial.checksum()
+        trial._assigned = True
+
+    return missing
+
+
+def store_assignments(trials):
+    if get_cache() is None:
+        return
+
+    values = {}
+
+    for trial in trials:
+        keys = trial_keys(trial)
+
+        if keys is not None:
+            values[keys[0]] = (dict(trial._assignment), trial._in_experiment)
+
+    set_assignments(values)
+
+
+def mark_exposed(trials):
+    """
+    Records that the exposures of ``trials`` were logged, once the
+    surrounding transaction commits
+    """
+    if get_cache() is None:
+        return
+
+    set_exposed([keys[1] for keys in map(trial_keys, trials) if keys is not None])
+
+
+class AssignmentBatch(object):
+    """
+    Collects the trials a request assigns and exposes so the cache is
+    written with one set_many each on ``flush``, instead of once per
+    trial
+    """
+    def __init__(self):
+        self.assigned = []
+        self.exposed = []
+
+    def flush(self):
+        assigned, self.assigned = self.assigned, []
+        exposed, self.exposed = self.exposed, []
+
+        store_assignments(assigned)
+        mark_exposed(exposed)
@@ -0,0 +1,103 @@
+from collections import namedtuple
+
+from django.db import connection
+
+
+VariationGoalStats = namedtuple(
+    'VariationGoalStats',
+    ['variation_id', 'exposed_units', 'achieving_units', 'success_value', 'estimated_units']
+)
+
+
+def unit_key_sql(model, alias):
+    """
+    SQL for the (unit type, unit id) pair identifying who an event
+    belongs to, django users and fuzzy identifiers share one key space
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    user = '{}.{}'.format(alias, qn(opts.get_field('event_user').column))
+    identifier = '{}.{}'.format(alias, qn(opts.get_field('event_user_identifier').column))
+    identifier_type = '{}.{}'.format(alias, qn(opts.get_field('event_user_identifier_type').column))
+
+    return (
+        "CASE WHEN {user} IS NOT NULL THEN %s ELSE {identifier_type} END".format(
+            user=user,
+            identifier_type=identifier_type
+        ),
+        "COALESCE(CAST({user} AS varchar), {identifier})".format(user=user, identifier=identifier)
+    )
+
+
+def goal_attribution(experiment_id, goal_id, variation_ids=None):
+    """
+    Computes, for every variation of an experiment with exposures, the
+    number of distinct exposed units, how many of them achieved the goal
+    and the summed value of their achievements, in a single grouped
+    query. Units are matched by django user or by fuzzy identifier and
+    each unit counts once however many exposures or achievements it has.
+    Estimated units weight each unit by the inverse of the highest sample
+    rate it was logged with. Returns a dict of variation id to
+    VariationGoalStats.
+    """
+    from .models import DJANGO_USER_DB_ID, Exposure, GoalAchievement
+
+    qn = connection.ops.quote_name
+    exposure_opts = Exposure._meta
+    achievement_opts = GoalAchievement._meta
+    exposure_type, exposure_unit = unit_key_sql(Exposure, 'e')
+    achievement_type, achievement_unit = unit_key_sql(GoalAchievement, 'a')
+    variation_column = qn(exposure_opts.get_field('variation').column)
+
+    params = [DJANGO_USER_DB_ID, experiment_id]
+    variation_filter = ''
+
+    if variation_ids is not None:
+        variation_ids = list(variation_ids)
+
+        if not variation_ids:
+            return {}
+
+        variation_filter = ' AND e.{} IN ({})'.format(variation_column, ', '.join(['%s'] * len(variation_ids)))
+        params.extend(variation_ids)
+
+    params.extend([DJANGO_USER_DB_ID, goal_id])
+
+    sql = """
+        WITH exposed AS (
+            SELECT e.{variation} AS variation_id, {exposure_type} AS unit_type, {exposure_unit} AS unit_id,
+                1.0 / MAX(e.{sample_rate}) AS weight
+            FROM {exposure_table} e
+            WHERE e.{experiment} = %s{variation_filter}
+            GROUP BY 1, 2, 3
+        ), achieved AS (
+            SELECT {achievement_type} AS unit_type, {achievement_unit} AS unit_id, SUM(a.{value}) AS value
+            FROM {achievement_table} a
+            WHERE a.{goal} = %s
+            GROUP BY 1, 2
+        )
+        SELECT exposed.variation_id, COUNT(*), COUNT(achieved.unit_id), COALESCE(SUM(achieved.value), 0),
+            SUM(exposed.weight)
+        FROM exposed
+        LEFT JOIN achieved ON achieved.unit_type = exposed.unit_type AND achieved.unit_id = exposed.unit_id
+        GROUP BY exposed.variation_id
+    """.format(
+        variation=variation_column,
+        exposure_type=exposure_type,
+        exposure_unit=exposure_unit,
+        exposure_table=qn(exposure_opts.db_table),
+        experiment=qn(exposure_opts.get_field('experiment').column),
+        sample_rate=qn(exposure_opts.get_field('sample_rate').column),
+        variation_filter=variation_filter,
+        achievement_type=achievement_type,
+        achievement_unit=achievement_unit,
+        value=qn(achievement_opts.get_field('value').column),
+        achievement_table=qn(achievement_opts.db_table),
+        goal=qn(achievement_opts.get_field('goal').column)
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return {row[0]: VariationGoalStats(*row) for row in rows}
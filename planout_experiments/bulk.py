@@ -0,0 +1,144 @@
+import re
+
+from collections import namedtuple
+from itertools import islice
+
+from .assignment_cache import experiment_key_prefix, get_cache, get_cached, set_assignments, set_exposed, unit_keys
+from .registry import variation_ids
+from .sampling import exposure_sample_rate
+from .sinks import write_exposures
+
+
+UnitAssignment = namedtuple('UnitAssignment', ['unit', 'params', 'in_experiment'])
+
+
+def trial_salt(experiment):
+    """
+    The salt a SingleTrial for ``experiment`` hashes with, planout falls
+    back to the whitespace normalized name when no salt is set
+    """
+    return experiment.salt or re.sub(r'\s+', '-', experiment.name)
+
+
+def assign_units(
+        experiment,
+        units,
+        user_identifier_type,
+        inputs=None,
+        unit_input='user_id',
+        log_exposures=False,
+        batch_size=1000
+):
+    """
+    Lazily assigns every unit in ``units`` against one compiled script,
+    yielding a UnitAssignment per unit. Units are read ``batch_size`` at a
+    time, each batch makes one round trip to the shared assignment cache
+    to read and one to write. When ``log_exposures`` is set exposures are
+    written with one bulk insert per ``batch_size`` exposures, pending
+    exposures are written when the generator is exhausted or closed.
+    Units whose exposures another process already logged are skipped,
+    exposures are sampled and rate limited like SingleTrial.log_exposure.
+    """
+    from .models import DJANGO_USER_DB_ID, Exposure
+
+    compiled_script = experiment.get_compiled_script()
+    salt = trial_salt(experiment)
+    base_inputs = dict(inputs or {}, user_identifier_type=user_identifier_type)
+    key_prefix = experiment_key_prefix(experiment, salt) if get_cache() is not None else None
+    local_variation_ids = {}
+    exposures = []
+    exposed_keys = []
+    units = iter(units)
+
+    def variation_id_for(key, value):
+        cache_key = (key, str(value))
+
+        try:
+            return local_variation_ids[cache_key]
+        except KeyError:
+            pass
+
+        if not local_variation_ids:
+            local_variation_ids.update(variation_ids.get_variations(experiment.pk))
+
+        if cache_key not in local_variation_ids:
+            local_variation_ids[cache_key] = variation_ids.create_variation_id(experiment.pk, key, value)
+
+        return local_variation_ids[cache_key]
+
+    def assign_batch(batch):
+        """
+        (unit, params, in_experiment, exposure key, exposure logged) for
+        every unit of ``batch``
+        """
+        keyed = []
+
+        for unit in batch:
+            unit_inputs = dict(base_inputs)
+            unit_inputs[unit_input] = unit
+            keyed.append((unit, unit_inputs, unit_keys(key_prefix, unit_inputs) if key_prefix else (None, None)))
+
+        found = get_cached([key for _, _, keys in keyed if keys[0] is not None for key in keys])
+        assigned = {}
+        results = []
+
+        for unit, unit_inputs, (params_key, exposed_key) in keyed:
+            if params_key in found:
+                params, in_experiment = found[params_key]
+            else:
+                params = {}
+                in_experiment = compiled_script.execute(params, salt, unit_inputs)
+
+                if params_key is not None:
+                    assigned[params_key] = (dict(params), in_experiment)
+
+            results.append((unit, params, in_experiment, exposed_key, exposed_key in found))
+
+        set_assignments(assigned)
+        return results
+
+    def write_pending():
+        write_exposures(exposures)
+        set_exposed(exposed_keys)
+        del exposures[:]
+        del exposed_keys[:]
+
+    try:
+        while True:
+            batch = list(islice(units, batch_size))
+
+            if not batch:
+                break
+
+            for unit, params, in_experiment, exposed_key, logged in assign_batch(batch):
+                if log_exposures and in_experiment and not logged:
+                    sample_rate = exposure_sample_rate(experiment, salt, unit, count=len(params))
+                else:
+                    sample_rate = 0
+
+                if sample_rate:
+                    for key, value in params.items():
+                        exposure = Exposure(
+                            experiment_id=experiment.pk,
+                            variation_id=variation_id_for(key, value),
+                            event_user_identifier_type=user_identifier_type,
+                            sample_rate=sample_rate
+                        )
+
+                        if user_identifier_type == DJANGO_USER_DB_ID:
+                            exposure.event_user_id = unit
+                        else:
+                            exposure.event_user_identifier = unit
+
+                        exposures.append(exposure)
+
+                    if exposed_key is not None:
+                        exposed_keys.append(exposed_key)
+
+                    if len(exposures) >= batch_size:
+                        write_pending()
+
+                yield UnitAssignment(unit, params, in_experiment)
+    finally:
+        if exposures:
+            write_pending()
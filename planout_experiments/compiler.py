@@ -0,0 +1,436 @@
+"""
+Compiles planout scripts into trees of closures so evaluating a unit
+walks no JSON and instantiates no operator objects. Operators the
+compiler doesn't understand fall back to the stock planout Interpreter
+for the whole script, results are identical either way.
+"""
+import copy
+import json
+import hashlib
+
+from types import MappingProxyType
+
+from planout.assignment import Assignment
+from planout.interpreter import Interpreter
+from planout.ops.base import PlanOutOpSimple
+from planout.ops.random import PlanOutOpRandom
+from planout.ops.utils import Operators, StopPlanOutException
+
+from .conf import get_setting
+from .registry import TTLCache
+
+
+LONG_SCALE = PlanOutOpRandom.LONG_SCALE
+
+
+class NotCompilable(Exception):
+    pass
+
+
+def script_content_hash(script):
+    return hashlib.sha1(json.dumps(script, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def planout_hash(full_salt, unit):
+    """
+    The hash planout's random operators draw from, ``full_salt`` already
+    includes the trailing separator
+    """
+    if type(unit) is not list:
+        unit = [unit]
+
+    hash_str = '%s%s' % (full_salt, '.'.join(map(str, unit)))
+    return int(hashlib.sha1(hash_str.encode('ascii')).hexdigest()[:15], 16)
+
+
+class EvaluationContext(object):
+    """
+    Stands in for the planout Interpreter while a compiled script runs,
+    random operators read ``experiment_salt`` and ``salt_sep`` from it
+    """
+    __slots__ = ('params', 'inputs', 'overrides', 'experiment_salt', 'salt_sep')
+
+    def __init__(self, params, experiment_salt, inputs):
+        self.params = params
+        self.inputs = inputs
+        self.experiment_salt = experiment_salt
+        self.salt_sep = getattr(params, 'salt_sep', '.')
+
+        get_overrides = getattr(params, 'get_overrides', None)
+        self.overrides = get_overrides() if get_overrides is not None else {}
+
+    def get(self, name):
+        return self.params.get(name, self.inputs.get(name))
+
+    def full_salt(self, args):
+        if 'full_salt' in args:
+            full_salt = args['full_salt']
+            assert isinstance(full_salt, str), "full_salt must be a string."
+            return full_salt + '.'
+
+        salt = args['salt']
+        assert isinstance(salt, str), "salt must be a string."
+        return '%s.%s%s' % (self.experiment_salt, salt, self.salt_sep)
+
+    def hash(self, args):
+        return planout_hash(self.full_salt(args), args['unit'])
+
+
+def _is_operator(node):
+    return type(node) is dict and 'op' in node
+
+
+def _compile_args(node):
+    return [(name, _compile(value)) for name, value in node.items()]
+
+
+def _evaluate_args(arg_fns, ctx):
+    return {name: fn(ctx) for name, fn in arg_fns}
+
+
+def _compile_literal_value(value):
+    if type(value) in (dict, list):
+        return lambda ctx: copy.deepcopy(value)
+
+    return lambda ctx: value
+
+
+def _compile_literal(node):
+    return _compile_literal_value(node['value'])
+
+
+def _compile_get(node):
+    var = node['var']
+
+    if not isinstance(var, str):
+        raise NotCompilable("get: var must be a string")
+
+    return lambda ctx: ctx.get(var)
+
+
+def _compile_seq(node):
+    fns = [_compile(op) for op in _get_list(node, 'seq')]
+
+    def run(ctx):
+        for fn in fns:
+            fn(ctx)
+
+    return run
+
+
+def _compile_set(node):
+    var, value = node['var'], node['value']
+
+    if not isinstance(var, str):
+        raise NotCompilable("set: var must be a string")
+
+    # The interpreter salts random operators with the variable name they
+    # are assigned to unless the script provides a salt
+    if _is_operator(value) and 'salt' not in value:
+        value = dict(value, salt=var)
+
+    fn = _compile(value)
+    sets_experiment_salt = var == 'experiment_salt'
+
+    def run(ctx):
+        if var in ctx.overrides:
+            return
+
+        if sets_experiment_salt:
+            ctx.experiment_salt = value
+
+        ctx.params[var] = fn(ctx)
+
+    return run
+
+
+def _compile_return(node):
+    fn = _compile(node['value'])
+
+    def run(ctx):
+        raise StopPlanOutException(True if fn(ctx) else False)
+
+    return run
+
+
+def _compile_array(node):
+    fns = [_compile(value) for value in _get_list(node, 'values')]
+    return lambda ctx: [fn(ctx) for fn in fns]
+
+
+def _compile_cond(node):
+    clauses = [(_compile(clause['if']), _compile(clause['then'])) for clause in _get_list(node, 'cond')]
+
+    def run(ctx):
+        for if_fn, then_fn in clauses:
+            if if_fn(ctx):
+                return then_fn(ctx)
+
+    return run
+
+
+def _compile_and(node):
+    fns = [_compile(value) for value in _get_list(node, 'values')]
+    return lambda ctx: all(fn(ctx) for fn in fns)
+
+
+def _compile_or(node):
+    fns = [_compile(value) for value in _get_list(node, 'values')]
+    return lambda ctx: any(fn(ctx) for fn in fns)
+
+
+def _compile_coalesce(node):
+    fns = [_compile(value) for value in _get_list(node, 'values')]
+
+    def run(ctx):
+        for fn in fns:
+            value = fn(ctx)
+
+            if value is not None:
+                return value
+
+    return run
+
+
+def _compile_random(execute):
+    def compile_random(node):
+        arg_fns = _compile_args(node)
+        return lambda ctx: execute(ctx, _evaluate_args(arg_fns, ctx))
+
+    return compile_random
+
+
+def _check_list(args, name):
+    value = args[name]
+    assert isinstance(value, (list, tuple)), "%s must be a list." % name
+    return value
+
+
+def _check_probability(args):
+    p = args['p']
+    assert isinstance(p, (int, float)), "p must be a numeric."
+    assert p >= 0 and p <= 1.0, 'p must be a number between 0.0 and 1.0, not %s!' % p
+    return p
+
+
+def _uniform_choice(ctx, args):
+    choices = _check_list(args, 'choices')
+
+    if len(choices) == 0:
+        return []
+
+    return choices[ctx.hash(args) % len(choices)]
+
+
+def _weighted_choice(ctx, args):
+    choices = _check_list(args, 'choices')
+    weights = _check_list(args, 'weights')
+
+    if len(choices) == 0:
+        return []
+
+    cum_weights = []
+    cum_sum = 0.0
+
+    for weight in weights:
+        cum_sum += weight
+        cum_weights.append(cum_sum)
+
+    stop_value = 0.0 + (cum_sum - 0.0) * (ctx.hash(args) / LONG_SCALE)
+
+    for index, cum_weight in enumerate(cum_weights):
+        if stop_value <= cum_weight:
+            return choices[index]
+
+
+def _bernoulli_trial(ctx, args):
+    p = _check_probability(args)
+    return 1 if ctx.hash(args) / LONG_SCALE <= p else 0
+
+
+def _random_integer(ctx, args):
+    min_val, max_val = args['min'], args['max']
+    assert isinstance(min_val, int) and isinstance(max_val, int), "min and max must be ints."
+    return min_val + ctx.hash(args) % (max_val - min_val + 1)
+
+
+def _random_float(ctx, args):
+    min_val, max_val = args['min'], args['max']
+    assert isinstance(min_val, (int, float)) and isinstance(max_val, (int, float)), "min and max must be numbers."
+    min_val, max_val = float(min_val), float(max_val)
+    return min_val + (max_val - min_val) * (ctx.hash(args) / LONG_SCALE)
+
+
+def _compile_simple(op_class):
+    """
+    Operators that evaluate all of their arguments up front reuse the
+    planout implementation, only the argument evaluation is compiled
+    """
+    def compile_simple(node):
+        arg_fns = _compile_args(node)
+
+        def run(ctx):
+            op = op_class(**_evaluate_args(arg_fns, ctx))
+            op.mapper = ctx
+            return op.simpleExecute()
+
+        return run
+
+    return compile_simple
+
+
+def _get_list(node, name):
+    value = node[name]
+
+    if not isinstance(value, (list, tuple)):
+        raise NotCompilable("%s must be a list" % name)
+
+    return value
+
+
+OP_COMPILERS = {
+    'literal': _compile_literal,
+    'get': _compile_get,
+    'seq': _compile_seq,
+    'set': _compile_set,
+    'return': _compile_return,
+    'array': _compile_array,
+    'cond': _compile_cond,
+    'and': _compile_and,
+    'or': _compile_or,
+    'coalesce': _compile_coalesce,
+    'uniformChoice': _compile_random(_uniform_choice),
+    'weightedChoice': _compile_random(_weighted_choice),
+    'bernoulliTrial': _compile_random(_bernoulli_trial),
+    'randomInteger': _compile_random(_random_integer),
+    'randomFloat': _compile_random(_random_float),
+}
+
+
+def _compile(node):
+    if _is_operator(node):
+        op = node['op']
+        compile_op = OP_COMPILERS.get(op)
+
+        if compile_op is None:
+            op_class = Operators.operators.get(op)
+
+            if op_class is None or not issubclass(op_class, PlanOutOpSimple):
+                raise NotCompilable("Unsupported operator: %s" % op)
+
+            compile_op = _compile_simple(op_class)
+
+        return compile_op(node)
+
+    if type(node) is list:
+        fns = [_compile(value) for value in node]
+        return lambda ctx: [fn(ctx) for fn in fns]
+
+    return _compile_literal_value(node)
+
+
+CONSTANT_TYPES = (str, int, float, bool, type(None))
+
+
+def constant_params(script):
+    """
+    The parameters of a script made only of ``set`` ops with scalar
+    literal values, as a read only mapping, None for any other script
+    """
+    if not _is_operator(script) or script['op'] != 'seq' or not isinstance(script.get('seq'), list):
+        return None
+
+    params = {}
+
+    for node in script['seq']:
+        if not _is_operator(node) or node['op'] != 'set' or not isinstance(node.get('var'), str):
+            return None
+
+        value = node.get('value')
+
+        if _is_operator(value):
+            if value['op'] != 'literal':
+                return None
+
+            value = value.get('value')
+
+        if not isinstance(value, CONSTANT_TYPES):
+            return None
+
+        params[node['var']] = value
+
+    return MappingProxyType(params)
+
+
+class CompiledScript(object):
+    """
+    Immutable, reusable form of an experiment's planout script, safe to
+    share between every trial in the process
+    """
+    def __init__(self, script):
+        # Keep a private copy, the interpreter fallback annotates the
+        # script with salts as it runs
+        self.script = copy.deepcopy(script)
+        self.content_hash = script_content_hash(self.script)
+        self.checksum = hashlib.sha1(json.dumps(self.script).encode('ascii')).hexdigest()[:8]
+
+        # Every unit gets the same parameters, see Experiment.get_experiment_value
+        self.constant_params = constant_params(self.script)
+
+        try:
+            self._run = _compile(self.script)
+        except (NotCompilable, KeyError, TypeError):
+            self._run = None
+
+    @property
+    def interpreted(self):
+        return self._run is None
+
+    def execute(self, params, experiment_salt, inputs):
+        """
+        Evaluates the script for ``inputs`` storing parameters in
+        ``params``, returns whether the unit is in the experiment
+        """
+        if self._run is None:
+            # The interpreter needs an Assignment to read overrides from
+            environment = params if hasattr(params, 'get_overrides') else Assignment(experiment_salt)
+            interpreter = Interpreter(self.script, experiment_salt, inputs, environment)
+            results = interpreter.get_params()
+
+            if environment is not params:
+                params.update(results)
+
+            return interpreter.in_experiment
+
+        try:
+            self._run(EvaluationContext(params, experiment_salt, inputs))
+        except StopPlanOutException as e:
+            return e.in_experiment
+
+        return True
+
+
+class CompiledScriptCache(TTLCache):
+    """
+    Process wide cache of compiled scripts keyed by (experiment id,
+    script content hash), an edited script is simply a new key
+    """
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def max_size(self):
+        return get_setting('COMPILED_SCRIPT_CACHE_SIZE', 1000)
+
+    def get_or_compile(self, experiment_id, script):
+        key = (experiment_id, script_content_hash(script))
+        compiled = self.get(key)
+
+        if compiled is None:
+            compiled = CompiledScript(script)
+            self.set(key, compiled)
+
+        return compiled
+
+
+compiled_scripts = CompiledScriptCache()
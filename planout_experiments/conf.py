@@ -0,0 +1,12 @@
+from django.conf import settings
+
+
+SETTINGS_PREFIX = 'PLANOUT_EXPERIMENTS_'
+
+
+def get_setting(name, default=None):
+    """
+    Looks up ``PLANOUT_EXPERIMENTS_<name>`` in the django settings, read
+    on every call so override_settings works in tests
+    """
+    return getattr(settings, SETTINGS_PREFIX + name, default)
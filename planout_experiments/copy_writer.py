@@ -0,0 +1,210 @@
+"""
+Bulk loading of event rows with PostgreSQL ``COPY FROM STDIN``. Rows are
+plain mappings of field name (or attname) to value, they're encoded
+straight into an in memory text buffer without instantiating models,
+missing fields get their model defaults. Used by backfills through the
+``copy_events`` command and by BufferedExposureSink with ``use_copy``.
+
+COPY bypasses ``INSERT ... ON CONFLICT``, rows are never deduplicated
+and a duplicate ``uuid`` or ``dedup_key`` fails the whole batch.
+"""
+import io
+import json
+
+from datetime import date, datetime
+
+from django.contrib.postgres.fields import JSONField
+from django.db import connections, transaction
+from django.utils.timezone import now
+
+from .conf import get_setting
+from .sampling import exposure_counts
+
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+COPY_NULL = '\\N'
+
+
+def get_copy_models():
+    from .models import ExperimentLog, Exposure, GoalAchievement
+
+    return {model._meta.model_name: model for model in (Exposure, GoalAchievement, ExperimentLog)}
+
+
+def encode_value(value):
+    """
+    A value in COPY's text format
+    """
+    if value is None:
+        return COPY_NULL
+
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif not isinstance(value, str):
+        value = str(value)
+
+    return value.translate(COPY_ESCAPES)
+
+
+def json_encoder(field):
+    """
+    Encodes values of the JSON ``field`` in COPY's text format, any
+    value but None is a JSON document, including plain strings
+    """
+    def encode(value):
+        if value is None:
+            return COPY_NULL
+
+        return json.dumps(value, cls=field.encoder).translate(COPY_ESCAPES)
+
+    return encode
+
+
+class CopyWriter(object):
+    """
+    Streams rows of one model into its table, one COPY per ``write``
+    """
+    def __init__(self, model, using='default'):
+        self.model = model
+        self.using = using
+        self.fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+
+        # The encoding follows the column type, not the value's, JSON
+        # columns take strings and numbers as documents too
+        self.encoders = [
+            json_encoder(field) if isinstance(field, JSONField) else encode_value for field in self.fields
+        ]
+
+        # Rows may name foreign keys by field name or attname
+        self._aliases = {}
+
+        for field in self.fields:
+            self._aliases[field.name] = field.attname
+            self._aliases[field.attname] = field.attname
+
+    def defaults(self):
+        """
+        Values for fields a row leaves out, creation and modification
+        times share one timestamp per batch
+        """
+        timestamp = now()
+        defaults = {}
+
+        for field in self.fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                defaults[field.attname] = timestamp
+            elif field.has_default():
+                defaults[field.attname] = field.get_default()
+            else:
+                defaults[field.attname] = None
+
+        return defaults
+
+    def encode(self, rows):
+        """
+        Builds the COPY buffer for ``rows``, returns it with the row count
+        """
+        defaults = self.defaults()
+        attnames = [field.attname for field in self.fields]
+        buffer = io.StringIO()
+        count = 0
+
+        for row in rows:
+            values = dict(defaults)
+
+            for name, value in row.items():
+                try:
+                    values[self._aliases[name]] = value
+                except KeyError:
+                    raise ValueError("{} has no field {}".format(self.model.__name__, name))
+
+            buffer.write('\t'.join(encode(values[attname]) for encode, attname in zip(self.encoders, attnames)))
+            buffer.write('\n')
+            count += 1
+
+        buffer.seek(0)
+        return buffer, count
+
+    def copy_sql(self):
+        connection = connections[self.using]
+        qn = connection.ops.quote_name
+
+        return "COPY {} ({}) FROM STDIN".format(
+            qn(self.model._meta.db_table),
+            ', '.join(qn(field.column) for field in self.fields)
+        )
+
+    def write(self, rows):
+        """
+        Copies ``rows`` into the table, returns the number of rows written
+        """
+        buffer, count = self.encode(rows)
+
+        if count:
+            with connections[self.using].cursor() as cursor:
+                cursor.copy_expert(self.copy_sql(), buffer)
+
+        return count
+
+
+def exposure_rows(exposures):
+    """
+    Rows for unsaved Exposure instances, e.g. those a sink receives
+    """
+    for exposure in exposures:
+        yield {
+            'seen_at': exposure.seen_at,
+            'experiment_id': exposure.experiment_id,
+            'variation_id': exposure.variation_id,
+            'event_user_id': exposure.event_user_id,
+            'event_user_identifier': exposure.event_user_identifier,
+            'event_user_identifier_type': exposure.event_user_identifier_type,
+            'uuid': exposure.uuid,
+            'data_source': exposure.data_source,
+            'data_meta': exposure.data_meta,
+            'app_version': exposure.app_version,
+            'sample_rate': exposure.sample_rate,
+        }
+
+
+def copy_exposures(rows, using='default'):
+    """
+    Copies exposure rows and, unless PLANOUT_EXPERIMENTS_COUNT_EXPOSURES
+    is disabled, adds them to their variations' exposure counters in the
+    same transaction. Returns the number of rows written.
+    """
+    from .models import Exposure, Variation
+
+    rows = list(rows)
+    writer = CopyWriter(Exposure, using=using)
+
+    if not get_setting('COUNT_EXPOSURES', True):
+        return writer.write(rows)
+
+    counts, estimates = exposure_counts(
+        (row.get('variation_id', row.get('variation')), float(row.get('sample_rate', 1.0))) for row in rows
+    )
+
+    with transaction.atomic(using=using, savepoint=False):
+        count = writer.write(rows)
+        Variation.increment_exposure_counts(counts, estimates, using=using)
+
+    return count
+
+
+def copy_rows(model, rows, using='default'):
+    """
+    Copies rows of any of the copyable event models, exposures keep
+    their variation counters current
+    """
+    from .models import Exposure
+
+    if model is Exposure:
+        return copy_exposures(rows, using=using)
+
+    return CopyWriter(model, using=using).write(rows)
@@ -0,0 +1,152 @@
+import hashlib
+
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+from .conf import get_setting
+from .registry import TTLCache
+
+
+def exposure_dedup_key(exposure):
+    """
+    Identifies the (variation, unit) pair an exposure records, None when
+    the exposure has no unit
+    """
+    from .models import DJANGO_USER_DB_ID
+
+    if exposure.event_user_id is not None:
+        unit_type, unit_id = DJANGO_USER_DB_ID, str(exposure.event_user_id)
+    elif exposure.event_user_identifier is not None and exposure.event_user_identifier_type is not None:
+        unit_type, unit_id = exposure.event_user_identifier_type, exposure.event_user_identifier
+    else:
+        return None
+
+    key = '{}\x1f{}\x1f{}'.format(exposure.variation_id, unit_type, unit_id)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class ExposureDedupCache(TTLCache):
+    """
+    Process wide set of dedup keys known to be stored, lets repeat
+    exposures skip the database entirely when hits aren't tracked
+    """
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def max_size(self):
+        return get_setting('EXPOSURE_DEDUP_CACHE_SIZE', 10000)
+
+
+dedup_cache = ExposureDedupCache()
+
+# Set once the exposure table was found unpartitioned, tables are only
+# converted during maintenance
+_table_checked = False
+
+
+def check_dedup_supported():
+    """
+    Raises ImproperlyConfigured when the exposure table is partitioned,
+    its dedup key index is then no longer unique and can't back ON
+    CONFLICT
+    """
+    global _table_checked
+    from .models import Exposure
+    from .partitioning import is_partitioned
+
+    if _table_checked:
+        return
+
+    if is_partitioned(Exposure):
+        raise ImproperlyConfigured(
+            "PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP can't be used once the exposure table is partitioned"
+        )
+
+    _table_checked = True
+
+
+def write_deduplicated_exposures(exposures):
+    """
+    Stores the first exposure of every (variation, unit) pair with
+    INSERT ... ON CONFLICT on the dedup key. With
+    PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP_TRACK_HITS repeats bump the stored
+    row's hit counter and last seen time, otherwise they are dropped and
+    remembered in the dedup cache. Returns (variation id, sample rate) of
+    the rows actually inserted.
+    """
+    from .models import Exposure
+
+    check_dedup_supported()
+
+    track_hits = get_setting('EXPOSURE_DEDUP_TRACK_HITS', False)
+    pending = OrderedDict()
+    inserted_rows = []
+
+    for exposure in exposures:
+        exposure.dedup_key = exposure_dedup_key(exposure)
+        exposure.last_seen_at = exposure.seen_at
+
+        if exposure.dedup_key is None:
+            pending[id(exposure)] = exposure
+            continue
+
+        if not track_hits and exposure.dedup_key in dedup_cache:
+            continue
+
+        canonical = pending.setdefault(exposure.dedup_key, exposure)
+
+        if canonical is not exposure:
+            canonical.hits += exposure.hits
+            canonical.last_seen_at = max(canonical.last_seen_at, exposure.seen_at)
+
+    if not pending:
+        return inserted_rows
+
+    opts = Exposure._meta
+    qn = connection.ops.quote_name
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    rows = []
+    params = []
+
+    for exposure in pending.values():
+        rows.append('({})'.format(', '.join(['%s'] * len(fields))))
+        params.extend(field.get_db_prep_save(field.pre_save(exposure, True), connection) for field in fields)
+
+    dedup_key = qn(opts.get_field('dedup_key').column)
+    hits = qn(opts.get_field('hits').column)
+    last_seen_at = qn(opts.get_field('last_seen_at').column)
+
+    if track_hits:
+        conflict = "DO UPDATE SET {hits} = e.{hits} + EXCLUDED.{hits}, {last_seen_at} = GREATEST(e.{last_seen_at}, " \
+            "EXCLUDED.{last_seen_at})".format(hits=hits, last_seen_at=last_seen_at)
+    else:
+        conflict = "DO NOTHING"
+
+    sql = "INSERT INTO {table} AS e ({columns}) VALUES {rows} ON CONFLICT ({dedup_key}) {conflict} " \
+        "RETURNING e.{variation}, e.{sample_rate}, e.xmax = 0".format(
+            table=qn(opts.db_table),
+            columns=', '.join(qn(field.column) for field in fields),
+            rows=', '.join(rows),
+            dedup_key=dedup_key,
+            conflict=conflict,
+            variation=qn(opts.get_field('variation').column),
+            sample_rate=qn(opts.get_field('sample_rate').column)
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        inserted_rows = [(variation_id, rate) for variation_id, rate, inserted in cursor.fetchall() if inserted]
+
+    if not track_hits:
+        keys = [key for key in pending if isinstance(key, str)]
+
+        def remember():
+            for key in keys:
+                dedup_cache.set(key, True)
+
+        transaction.on_commit(remember)
+
+    return inserted_rows
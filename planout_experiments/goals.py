@@ -0,0 +1,131 @@
+import uuid
+import zlib
+
+from collections import namedtuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, connection, transaction
+from django.utils.timezone import now
+
+from .registry import goal_registry
+
+
+Achievement = namedtuple('Achievement', [
+    'goal_name',
+    'user',
+    'user_identifier',
+    'user_identifier_type',
+    'value',
+    'seen_at',
+    'related_instance',
+    'uuid',
+    'data_source',
+    'data_meta',
+])
+Achievement.__new__.__defaults__ = (None, None, None, 1.0, None, None, None, None, None)
+
+
+def build_achievement(record, goal_id, default_seen_at):
+    from .models import GoalAchievement
+
+    achievement = GoalAchievement(
+        goal_id=goal_id,
+        value=record.value,
+        seen_at=record.seen_at or default_seen_at,
+        # Webhooks pass uuids as strings, the replay check compares UUIDs
+        uuid=uuid.UUID(str(record.uuid)) if record.uuid is not None else None,
+        data_source=record.data_source,
+        data_meta=record.data_meta if record.data_meta is not None else {}
+    )
+
+    if record.user is not None:
+        # Accept user ids so pipelines don't have to load users
+        if isinstance(record.user, int):
+            achievement.event_user_id = record.user
+        else:
+            achievement.event_user = record.user
+    else:
+        achievement.event_user_identifier = record.user_identifier
+        achievement.event_user_identifier_type = record.user_identifier_type
+
+    if record.related_instance is not None:
+        achievement.content_type = ContentType.objects.get_for_model(record.related_instance)
+        achievement.object_id = record.related_instance.pk
+
+    return achievement
+
+
+def _without_logged(achievements):
+    """
+    Drops achievements whose uuid repeats within the batch or was already
+    stored
+    """
+    from .models import GoalAchievement
+
+    uuids = {achievement.uuid for achievement in achievements if achievement.uuid is not None}
+    seen = set(GoalAchievement.objects.filter(uuid__in=uuids).values_list('uuid', flat=True)) if uuids else set()
+    pending = []
+
+    for achievement in achievements:
+        if achievement.uuid is not None:
+            if achievement.uuid in seen:
+                continue
+
+            seen.add(achievement.uuid)
+
+        pending.append(achievement)
+
+    return pending
+
+
+def _lock_replays():
+    """
+    Serializes idempotent ingestion once the achievement table is
+    partitioned, its uuid index is no longer unique and can't catch a
+    concurrent delivery of the same uuid
+    """
+    from .models import GoalAchievement
+    from .partitioning import is_partitioned
+
+    if is_partitioned(GoalAchievement):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s)",
+                [zlib.crc32(GoalAchievement._meta.db_table.encode('utf-8'))]
+            )
+
+
+def log_achievements(records, idempotent=False, batch_size=1000):
+    """
+    Stores goal achievements for ``records``, Achievement tuples or dicts
+    of their fields, with one bulk insert per ``batch_size`` rows. Goal
+    names are resolved through the process wide goal registry. With
+    ``idempotent`` achievements whose uuid was already stored are
+    skipped, so retried deliveries can be replayed safely. Returns the
+    GoalAchievement instances written.
+    """
+    from .models import GoalAchievement
+
+    records = [record if isinstance(record, Achievement) else Achievement(**record) for record in records]
+
+    if not records:
+        return []
+
+    goals = goal_registry.get_goal_ids({record.goal_name for record in records})
+    seen_at = now()
+    achievements = [build_achievement(record, goals[record.goal_name], seen_at) for record in records]
+
+    if not idempotent:
+        return GoalAchievement.objects.bulk_create(achievements, batch_size=batch_size)
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                _lock_replays()
+                pending = _without_logged(achievements)
+                return GoalAchievement.objects.bulk_create(pending, batch_size=batch_size)
+        except IntegrityError:
+            # A concurrent delivery stored some of the uuids between the
+            # check and the insert, check again
+            if attempt:
+                raise
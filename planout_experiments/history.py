@@ -0,0 +1,157 @@
+"""
+Per model control over the history rows django-simple-history writes.
+PLANOUT_EXPERIMENTS_HISTORY maps model names to a mode:
+
+``on``
+    history rows are written in the saving transaction (the default)
+``buffered``
+    history rows are queued once the transaction commits and written
+    with bulk inserts of PLANOUT_EXPERIMENTS_HISTORY_BUFFER_SIZE rows,
+    or when ``history_buffer.flush()`` runs and at process exit
+``off``
+    no history rows are written
+"""
+import atexit
+import threading
+
+from collections import OrderedDict
+
+from simple_history.models import HistoricalRecords
+from structlog import get_logger
+
+from django.db import transaction
+from django.utils.timezone import now
+
+from .conf import get_setting
+
+
+logger = get_logger(__name__)
+
+HISTORY_ON = 'on'
+HISTORY_BUFFERED = 'buffered'
+HISTORY_OFF = 'off'
+HISTORY_MODES = (HISTORY_ON, HISTORY_BUFFERED, HISTORY_OFF)
+
+
+def get_history_mode(model):
+    mode = get_setting('HISTORY', {}).get(model.__name__, HISTORY_ON)
+
+    if mode not in HISTORY_MODES:
+        raise ValueError("history mode for {} must be one of {}, not {}".format(
+            model.__name__,
+            ', '.join(HISTORY_MODES),
+            mode
+        ))
+
+    return mode
+
+
+def build_historical_record(instance, history_type, history_user=None):
+    """
+    Unsaved history row capturing ``instance`` as it is now
+    """
+    manager = instance.__class__.history
+
+    return manager.model(
+        history_date=getattr(instance, '_history_date', now()),
+        history_user=history_user or getattr(instance, '_history_user', None),
+        history_change_reason=getattr(instance, 'changeReason', None),
+        history_type=history_type,
+        **{
+            field.attname: getattr(instance, field.attname)
+            for field in instance._meta.fields
+            if field.name not in manager.model._history_excluded_fields
+        }
+    )
+
+
+class HistoryBuffer(object):
+    """
+    Process wide queue of committed history rows written in bulk
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = []
+
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, records):
+        transaction.on_commit(lambda: self._append(records))
+
+    def _append(self, records):
+        with self._lock:
+            self._records.extend(records)
+            full = len(self._records) >= get_setting('HISTORY_BUFFER_SIZE', 500)
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            records, self._records = self._records, []
+
+        by_model = OrderedDict()
+
+        for record in records:
+            by_model.setdefault(record.__class__, []).append(record)
+
+        for model, model_records in by_model.items():
+            try:
+                model.objects.bulk_create(model_records)
+            except Exception:
+                logger.exception("failed to write buffered history", model=model.__name__, count=len(model_records))
+
+
+history_buffer = HistoryBuffer()
+
+
+def record_history(instances, history_type='+'):
+    """
+    Records history for rows written without ``save``, following each
+    model's history mode
+    """
+    instances = list(instances)
+
+    if not instances:
+        return
+
+    mode = get_history_mode(instances[0].__class__)
+    records = [build_historical_record(instance, history_type) for instance in instances]
+
+    if mode == HISTORY_ON:
+        records[0].__class__.objects.bulk_create(records)
+    elif mode == HISTORY_BUFFERED:
+        history_buffer.add(records)
+
+
+class ConfigurableHistoricalRecords(HistoricalRecords):
+    """
+    HistoricalRecords that skips or buffers history rows according to
+    PLANOUT_EXPERIMENTS_HISTORY. Buffered rows don't send the
+    pre/post_create_historical_record signals.
+    """
+    def post_save(self, instance, created, using=None, **kwargs):
+        mode = get_history_mode(instance.__class__)
+
+        if mode == HISTORY_ON:
+            return super().post_save(instance, created, using=using, **kwargs)
+
+        if mode == HISTORY_OFF or kwargs.get('raw', False):
+            return
+
+        if created or not hasattr(instance, 'skip_history_when_saving'):
+            history_buffer.add([
+                build_historical_record(instance, '+' if created else '~', self.get_history_user(instance))
+            ])
+
+    def post_delete(self, instance, using=None, **kwargs):
+        mode = get_history_mode(instance.__class__)
+
+        if mode == HISTORY_ON or self.cascade_delete_history:
+            return super().post_delete(instance, using=using, **kwargs)
+
+        if mode == HISTORY_BUFFERED:
+            history_buffer.add([build_historical_record(instance, '-', self.get_history_user(instance))])
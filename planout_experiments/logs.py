@@ -0,0 +1,257 @@
+"""
+Destinations for the events PlanOut logs through ``SingleTrial.log``.
+PLANOUT_EXPERIMENTS_LOG_BACKEND is the dotted path of one of:
+
+``DatabaseLogBackend``
+    inserts an ExperimentLog row in the calling transaction (the default)
+``BufferedLogBackend``
+    queues rows once the transaction commits and writes them with COPY
+    from a background thread
+``JSONLinesLogBackend``
+    appends rows to size rotated JSON lines files, which ``manage.py
+    copy_events experimentlog`` can load later
+``NullLogBackend``
+    drops them
+
+ExperimentLog rows older than PLANOUT_EXPERIMENTS_LOG_COMPACT_AFTER_DAYS
+are folded into one row of event counts per experiment and day, rows
+older than PLANOUT_EXPERIMENTS_LOG_RETENTION_DAYS are deleted, see
+``manage.py prune_experiment_logs``.
+"""
+import os
+import json
+import logging
+import logging.handlers
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from .conf import get_setting
+from .copy_writer import CopyWriter
+from .sinks import BackgroundBatchWriter
+
+
+DEFAULT_LOG_BACKEND = 'planout_experiments.logs.DatabaseLogBackend'
+
+
+def log_row(experiment, data):
+    """
+    The ExperimentLog row backends receive for one logged event
+    """
+    return {
+        'experiment_id': experiment.pk,
+        'data': data,
+        'created': now(),
+    }
+
+
+class ExperimentLogBackend(object):
+    """
+    Receives ExperimentLog rows, dicts of field name to value, and is
+    responsible for persisting them
+    """
+    def submit(self, rows):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class DatabaseLogBackend(ExperimentLogBackend):
+    """
+    Inserts rows on the calling thread, in the calling transaction
+    """
+    def submit(self, rows):
+        from .models import ExperimentLog
+
+        if rows:
+            ExperimentLog.objects.bulk_create([ExperimentLog(**row) for row in rows])
+
+
+class BufferedLogBackend(BackgroundBatchWriter, ExperimentLogBackend):
+    """
+    Writes rows from a background thread with one COPY per batch, see
+    BackgroundBatchWriter for the batching and backpressure options
+    """
+    thread_name = 'planout-log-backend'
+    description = 'log backend'
+    item_name = 'log'
+
+    def write_batch(self, batch):
+        from .models import ExperimentLog
+
+        CopyWriter(ExperimentLog).write(batch)
+
+
+class JSONLinesLogBackend(ExperimentLogBackend):
+    """
+    Appends committed rows to ``path`` as JSON lines, rotating it once it
+    reaches ``max_bytes`` and keeping ``backup_count`` older segments.
+    ``{pid}`` in the path is replaced by the process id, processes must
+    not share a file they rotate.
+    """
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, backup_count=10):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._logger = None
+
+    def _get_logger(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                if self._logger is not None:
+                    self._close_handlers()
+
+                handler = logging.handlers.RotatingFileHandler(
+                    self.path.format(pid=os.getpid()),
+                    maxBytes=self.max_bytes,
+                    backupCount=self.backup_count,
+                    encoding='utf-8',
+                    delay=True
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+
+                # Kept out of the logging hierarchy so configured
+                # handlers never see the rows
+                self._logger = logging.Logger(__name__)
+                self._logger.propagate = False
+                self._logger.addHandler(handler)
+                self._pid = os.getpid()
+
+            return self._logger
+
+    def _close_handlers(self):
+        for handler in list(self._logger.handlers):
+            handler.close()
+            self._logger.removeHandler(handler)
+
+    def submit(self, rows):
+        if rows:
+            transaction.on_commit(lambda: self._append(rows))
+
+    def _append(self, rows):
+        file_logger = self._get_logger()
+
+        for row in rows:
+            file_logger.info(json.dumps(row, cls=DjangoJSONEncoder))
+
+    def flush(self):
+        if self._logger is not None and self._pid == os.getpid():
+            for handler in self._logger.handlers:
+                handler.flush()
+
+    def close(self):
+        with self._lock:
+            if self._logger is not None and self._pid == os.getpid():
+                self._close_handlers()
+
+            self._pid = None
+            self._logger = None
+
+
+class NullLogBackend(ExperimentLogBackend):
+    def submit(self, rows):
+        pass
+
+
+_backends = {}
+
+
+def get_log_backend():
+    """
+    Returns the backend configured by PLANOUT_EXPERIMENTS_LOG_BACKEND (a
+    dotted path) built with PLANOUT_EXPERIMENTS_LOG_BACKEND_OPTIONS, one
+    instance per process
+    """
+    path = get_setting('LOG_BACKEND', DEFAULT_LOG_BACKEND)
+
+    try:
+        return _backends[path]
+    except KeyError:
+        backend_class = import_string(path)
+        return _backends.setdefault(path, backend_class(**get_setting('LOG_BACKEND_OPTIONS', {})))
+
+
+def compact_experiment_logs(before, using='default'):
+    """
+    Replaces the rows created before midnight (UTC) of ``before`` with
+    one row per experiment and day holding the number of logged events
+    by event type, in a single statement. Compacted rows look like
+    ``{"compacted": true, "count": 12, "events": {"exposure": 10,
+    "conversion": 2}}`` and are created at the start of their day.
+    Returns (rows removed, compacted rows written).
+    """
+    from .models import ExperimentLog
+
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    fields = {field.name: qn(field.column) for field in ExperimentLog._meta.concrete_fields}
+
+    sql = """
+        WITH removed AS (
+            DELETE FROM {table}
+            WHERE {created} < date_trunc('day', %s AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+            AND NOT ({data} ? 'compacted')
+            RETURNING {experiment}, {created}, {data}->>'event' AS event
+        ), counts AS (
+            SELECT
+                {experiment},
+                date_trunc('day', {created} AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS day,
+                COALESCE(event, 'unknown') AS event,
+                count(*) AS total
+            FROM removed
+            GROUP BY 1, 2, 3
+        ), compacted AS (
+            INSERT INTO {table} ({created}, {modified}, {experiment}, {data})
+            SELECT
+                day,
+                now(),
+                {experiment},
+                jsonb_build_object('compacted', true, 'count', sum(total), 'events', jsonb_object_agg(event, total))
+            FROM counts
+            GROUP BY {experiment}, day
+            RETURNING 1
+        )
+        SELECT (SELECT count(*) FROM removed), (SELECT count(*) FROM compacted)
+    """.format(
+        table=qn(ExperimentLog._meta.db_table),
+        created=fields['created'],
+        modified=fields['modified'],
+        experiment=fields['experiment'],
+        data=fields['data']
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [before])
+        return cursor.fetchone()
+
+
+def prune_experiment_logs(before, batch_size=10000):
+    """
+    Deletes rows created before ``before``, compacted or not, in batches
+    of ``batch_size`` so no single transaction holds many row locks.
+    Returns the number of rows deleted.
+    """
+    from .models import ExperimentLog
+
+    deleted = 0
+
+    while True:
+        ids = list(
+            ExperimentLog.objects.filter(created__lt=before).values_list('pk', flat=True)[:batch_size]
+        )
+
+        if ids:
+            deleted += ExperimentLog.objects.filter(pk__in=ids).delete()[0]
+
+        if len(ids) < batch_size:
+            return deleted
@@ -0,0 +1,51 @@
+import sys
+import json
+
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from planout_experiments.copy_writer import copy_rows, get_copy_models
+
+
+class Command(BaseCommand):
+    help = "Loads exposures, goal achievements or experiment logs from a JSON lines file with COPY"
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(get_copy_models()))
+        parser.add_argument('path', help="JSON lines file of rows keyed by field name, - reads stdin")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows per COPY")
+
+    def read_rows(self, lines):
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise CommandError("Line {} is not valid JSON: {}".format(number, e))
+
+    def handle(self, *args, **options):
+        model = get_copy_models()[options['model']]
+        lines = sys.stdin if options['path'] == '-' else open(options['path'])
+        total = 0
+
+        try:
+            rows = self.read_rows(lines)
+
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+
+                if not batch:
+                    break
+
+                try:
+                    total += copy_rows(model, batch)
+                except ValueError as e:
+                    raise CommandError(str(e))
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+
+        self.stdout.write("Copied {} {} rows".format(total, model._meta.verbose_name))
@@ -0,0 +1,42 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from planout_experiments.partitioning import convert_to_partitioned, ensure_future_partitions, get_partitioned_models
+
+
+class Command(BaseCommand):
+    help = "Creates upcoming monthly partitions of the event tables, or converts them to partitioned tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help="Rewrite Exposure and GoalAchievement as tables partitioned by month of seen_at"
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=3,
+            help="Number of future months to create partitions for"
+        )
+
+    def handle(self, *args, **options):
+        if options['convert']:
+            for model in get_partitioned_models():
+                try:
+                    converted = convert_to_partitioned(model, options['months_ahead'])
+                except ImproperlyConfigured as e:
+                    raise CommandError(str(e))
+
+                if converted:
+                    self.stdout.write("Partitioned {}".format(model._meta.db_table))
+                    self.stdout.write(self.style.WARNING(
+                        "{}.uuid is no longer unique, only idempotent goal ingestion checks it".format(
+                            model._meta.db_table
+                        )
+                    ))
+                else:
+                    self.stdout.write("{} is already partitioned".format(model._meta.db_table))
+
+        for name in ensure_future_partitions(options['months_ahead']):
+            self.stdout.write("Created partition {}".format(name))
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from planout_experiments.conf import get_setting
+from planout_experiments.logs import compact_experiment_logs, prune_experiment_logs
+
+
+class Command(BaseCommand):
+    help = "Compacts old experiment logs into daily event counts and deletes logs past retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compact-after',
+            type=int,
+            default=get_setting('LOG_COMPACT_AFTER_DAYS'),
+            help="Compact logs older than this many days, defaults to PLANOUT_EXPERIMENTS_LOG_COMPACT_AFTER_DAYS"
+        )
+        parser.add_argument(
+            '--delete-after',
+            type=int,
+            default=get_setting('LOG_RETENTION_DAYS'),
+            help="Delete logs older than this many days, defaults to PLANOUT_EXPERIMENTS_LOG_RETENTION_DAYS"
+        )
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows deleted per statement")
+
+    def handle(self, *args, **options):
+        compact_after = options['compact_after']
+        delete_after = options['delete_after']
+
+        if compact_after is None and delete_after is None:
+            raise CommandError("Nothing to do, set --compact-after or --delete-after")
+
+        if compact_after is not None:
+            removed, compacted = compact_experiment_logs(now() - timedelta(days=compact_after))
+            self.stdout.write("Compacted {} experiment logs into {} daily rows".format(removed, compacted))
+
+        if delete_after is not None:
+            deleted = prune_experiment_logs(now() - timedelta(days=delete_after), batch_size=options['batch_size'])
+            self.stdout.write("Deleted {} experiment logs".format(deleted))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from planout_experiments.models import Experiment, Variation
+
+
+class Command(BaseCommand):
+    help = "Recounts exposures and corrects the stored exposure count of each variation"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--experiment',
+            help="Name of the experiment to reconcile, defaults to every experiment"
+        )
+
+    def handle(self, *args, **options):
+        experiment = None
+
+        if options['experiment'] is not None:
+            try:
+                experiment = Experiment.objects.get(name=options['experiment'])
+            except Experiment.DoesNotExist:
+                raise CommandError("Experiment '{}' does not exist".format(options['experiment']))
+
+        updated = Variation.reconcile_exposure_counts(experiment)
+
+        self.stdout.write("Reconciled exposure counts for {} variations".format(updated))
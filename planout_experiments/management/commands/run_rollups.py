@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+
+from planout_experiments.rollups import get_rollups
+
+
+class Command(BaseCommand):
+    help = "Processes exposures and achievements created since the last run into the precomputed rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help="Rollups to run, defaults to every registered rollup"
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help="Discard the stored aggregates and process every event again"
+        )
+        parser.add_argument(
+            '--until',
+            help=(
+                "ISO 8601 timestamp to process up to, in the current time zone unless it has an offset, "
+                "defaults to now minus PLANOUT_EXPERIMENTS_ROLLUP_LAG"
+            )
+        )
+
+    def handle(self, *args, **options):
+        until = None
+
+        if options['until'] is not None:
+            until = parse_datetime(options['until'])
+
+            if until is None:
+                raise CommandError("Invalid --until timestamp '{}'".format(options['until']))
+
+            if is_naive(until):
+                until = make_aware(until)
+
+        try:
+            rollups = get_rollups(options['names'] or None)
+        except KeyError as e:
+            raise CommandError("Unknown rollup {}".format(e))
+
+        for rollup in rollups:
+            watermark = rollup.run(until=until, rebuild=options['rebuild'])
+            self.stdout.write("{} processed up to {}".format(rollup.name, watermark.isoformat()))
@@ -0,0 +1,116 @@
+from django.utils.deprecation import MiddlewareMixin
+
+from .assignment_cache import AssignmentBatch, load_assignments
+from .models import Experiment, SingleTrial, get_unit_inputs, log_constant_exposure
+from .registry import TrialCache
+from .sinks import CollectingExposureSink
+
+
+class AssignmentContext(object):
+    """
+    Request scoped view of experiment assignments for a single unit.
+    Experiments are resolved through the registry and each experiment
+    gets one trial per set of inputs. Exposures are collected without
+    duplicates and written once when ``flush`` is called, as are the
+    shared assignment cache entries of every trial. ``prefetch`` reads
+    the cached assignments of known experiments in one round trip.
+    """
+    def __init__(self, user=None, user_identifier=None, user_identifier_type=None):
+        self.user = user
+        self.user_identifier = user_identifier
+        self.user_identifier_type = user_identifier_type
+        self.exposure_sink = CollectingExposureSink()
+        self.assignment_batch = AssignmentBatch()
+        self._trials = {}
+
+    def get_trial(self, experiment_name, control_dict=None, inputs=None):
+        """
+        Returns this request's trial for the named experiment, or None
+        when the request has no unit to assign
+        """
+        inputs = get_unit_inputs(self.user, self.user_identifier, self.user_identifier_type, inputs)
+
+        if inputs is None:
+            return None
+
+        inputs_key = TrialCache.key_for(inputs)
+        trial = self._trials.get((experiment_name, inputs_key)) if inputs_key is not None else None
+
+        if trial is None:
+            trial = SingleTrial(
+                db_experiment=Experiment.get_experiment(experiment_name, control_dict or {}),
+                event_user=self.user,
+                exposure_sink=self.exposure_sink,
+                assignment_batch=self.assignment_batch,
+                **inputs
+            )
+
+            if inputs_key is not None:
+                self._trials[(experiment_name, inputs_key)] = trial
+
+        return trial
+
+    def prefetch(self, experiments, inputs=None):
+        """
+        Creates the trials of ``experiments``, a mapping of experiment
+        name to control dict, and loads their cached assignments with a
+        single get_many
+        """
+        trials = [self.get_trial(name, control_dict, inputs) for name, control_dict in experiments.items()]
+        load_assignments([trial for trial in trials if trial is not None and not trial._assignment_cache_checked])
+
+    def get_value(self, experiment_name, key, control_value=None, inputs=None):
+        """
+        Request scoped equivalent of Experiment.get_experiment_value
+        """
+        if get_unit_inputs(self.user, self.user_identifier, self.user_identifier_type) is None:
+            return control_value
+
+        constant_params = Experiment.get_experiment(experiment_name, {key: control_value}).get_constant_params()
+
+        if constant_params is not None and not log_constant_exposure():
+            return constant_params.get(key)
+
+        trial = self.get_trial(experiment_name, {key: control_value}, inputs)
+
+        return trial.get(key)
+
+    def flush(self):
+        if len(self.exposure_sink):
+            self.exposure_sink.flush()
+
+        self.assignment_batch.flush()
+
+
+class ExperimentAssignmentMiddleware(MiddlewareMixin):
+    """
+    Attaches an AssignmentContext to ``request.experiments`` and writes
+    the exposures it collected once the response is ready. Authenticated
+    users are the unit by default, override ``get_context`` to identify
+    anonymous visitors. Experiments named in ``prefetch_experiments``
+    (name to control dict) have their cached assignments read up front
+    in one round trip.
+    """
+    prefetch_experiments = {}
+
+    def get_context(self, request):
+        user = getattr(request, 'user', None)
+
+        if user is not None and user.is_authenticated:
+            return AssignmentContext(user=user)
+
+        return AssignmentContext()
+
+    def process_request(self, request):
+        request.experiments = self.get_context(request)
+
+        if self.prefetch_experiments:
+            request.experiments.prefetch(self.prefetch_experiments)
+
+    def process_response(self, request, response):
+        context = getattr(request, 'experiments', None)
+
+        if context is not None:
+            context.flush()
+
+        return response
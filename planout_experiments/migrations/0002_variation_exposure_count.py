@@ -0,0 +1,39 @@
+# Generated by Django 2.1.11 on 2026-10-16 22:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_exposures(apps, schema_editor):
+    Variation = apps.get_model('planout_experiments', 'Variation')
+    Exposure = apps.get_model('planout_experiments', 'Exposure')
+
+    exposure_counts = Exposure.objects.filter(
+        variation=OuterRef('pk')
+    ).order_by().values('variation').annotate(count=Count('*')).values('count')
+
+    Variation.objects.update(
+        exposure_count=Coalesce(Subquery(exposure_counts, output_field=models.PositiveIntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalvariation',
+            name='exposure_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of exposures, incremented as exposures are written and corrected by reconcile_exposure_counts'),
+        ),
+        migrations.AddField(
+            model_name='variation',
+            name='exposure_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of exposures, incremented as exposures are written and corrected by reconcile_exposure_counts'),
+        ),
+        migrations.RunPython(count_exposures, migrations.RunPython.noop),
+    ]
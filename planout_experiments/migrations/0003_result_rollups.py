@@ -0,0 +1,88 @@
+# Generated by Django 2.1.11 on 2026-10-16 22:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0002_variation_exposure_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AchievingUnit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('unit_type', models.CharField(max_length=140)),
+                ('unit_id', models.CharField(max_length=140)),
+                ('value', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExposedUnit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('unit_type', models.CharField(max_length=140)),
+                ('unit_id', models.CharField(max_length=140)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('name', models.CharField(max_length=140, unique=True)),
+                ('watermark', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='exposure',
+            index=models.Index(fields=['created'], name='planout_exp_created_5cd5fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goalachievement',
+            index=models.Index(fields=['created'], name='planout_exp_created_0e95c4_idx'),
+        ),
+        migrations.AddField(
+            model_name='exposedunit',
+            name='experiment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='planout_experiments.Experiment'),
+        ),
+        migrations.AddField(
+            model_name='exposedunit',
+            name='variation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='planout_experiments.Variation'),
+        ),
+        migrations.AddField(
+            model_name='achievingunit',
+            name='goal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='planout_experiments.Goal'),
+        ),
+        migrations.AddIndex(
+            model_name='exposedunit',
+            index=models.Index(fields=['unit_type', 'unit_id'], name='planout_exp_unit_ty_7ff460_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='exposedunit',
+            unique_together={('variation', 'unit_type', 'unit_id')},
+        ),
+        migrations.AddIndex(
+            model_name='achievingunit',
+            index=models.Index(fields=['unit_type', 'unit_id'], name='planout_exp_unit_ty_6c65a5_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='achievingunit',
+            unique_together={('goal', 'unit_type', 'unit_id')},
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.1.11 on 2026-10-16 22:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0003_result_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExposureRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour or day')),
+                ('exposures', models.PositiveIntegerField(default=0)),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exposure_rollups', to='planout_experiments.Experiment')),
+                ('variation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exposure_rollups', to='planout_experiments.Variation')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GoalRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour or day')),
+                ('achievements', models.PositiveIntegerField(default=0)),
+                ('value', models.FloatField(default=0)),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='goal_rollups', to='planout_experiments.Experiment')),
+                ('goal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='planout_experiments.Goal')),
+                ('variation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='goal_rollups', to='planout_experiments.Variation')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='goalrollup',
+            index=models.Index(fields=['experiment', 'goal', 'granularity', 'bucket'], name='planout_exp_experim_692739_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='goalrollup',
+            unique_together={('granularity', 'bucket', 'variation', 'goal')},
+        ),
+        migrations.AddIndex(
+            model_name='exposurerollup',
+            index=models.Index(fields=['experiment', 'granularity', 'bucket'], name='planout_exp_experim_06bb28_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='exposurerollup',
+            unique_together={('granularity', 'bucket', 'variation')},
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.1.11 on 2026-10-16 22:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0004_time_series_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exposure',
+            name='experiment',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='exposures', to='planout_experiments.Experiment'),
+        ),
+        migrations.AlterField(
+            model_name='exposure',
+            name='variation',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='exposures', to='planout_experiments.Variation'),
+        ),
+        migrations.AlterField(
+            model_name='goalachievement',
+            name='goal',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='achivements', to='planout_experiments.Goal'),
+        ),
+        migrations.AddIndex(
+            model_name='exposure',
+            index=models.Index(fields=['experiment', 'seen_at'], name='planout_exp_experim_6e3c28_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exposure',
+            index=models.Index(fields=['variation', 'event_user'], name='planout_exp_variati_ec4a6f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exposure',
+            index=models.Index(fields=['event_user_identifier_type', 'event_user_identifier', 'variation'], name='planout_exp_event_u_71e05d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goalachievement',
+            index=models.Index(fields=['goal', 'seen_at'], name='planout_exp_goal_id_6abe41_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goalachievement',
+            index=models.Index(fields=['goal', 'event_user'], name='planout_exp_goal_id_91057e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goalachievement',
+            index=models.Index(fields=['goal', 'event_user_identifier_type', 'event_user_identifier'], name='planout_exp_goal_id_b37fe7_idx'),
+        ),
+    ]
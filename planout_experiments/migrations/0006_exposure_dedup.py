@@ -0,0 +1,28 @@
+# Generated by Django 2.1.11 on 2026-10-16 22:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0005_event_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exposure',
+            name='dedup_key',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='exposure',
+            name='hits',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='exposure',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.1.11 on 2026-10-16 22:59
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_goals(apps, schema_editor):
+    """
+    Keeps the oldest goal of each name and suffixes the others with their
+    id, so their achievements stay separate rather than being merged
+    """
+    Goal = apps.get_model('planout_experiments', 'Goal')
+
+    duplicated = Goal.objects.values('name').annotate(count=Count('*')).filter(count__gt=1).values_list('name', flat=True)
+
+    for goal in Goal.objects.filter(name__in=list(duplicated)).order_by('name', 'pk'):
+        if Goal.objects.filter(name=goal.name, pk__lt=goal.pk).exists():
+            suffix = ' #{}'.format(goal.pk)
+            goal.name = goal.name[:140 - len(suffix)] + suffix
+            goal.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0006_exposure_dedup'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_goals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='goal',
+            name='name',
+            field=models.CharField(max_length=140, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalgoal',
+            name='name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+    ]
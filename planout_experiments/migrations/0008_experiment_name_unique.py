@@ -0,0 +1,45 @@
+# Generated by Django 2.1.11 on 2026-10-16 23:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_experiments(apps, schema_editor):
+    """
+    Keeps the oldest experiment of each name and suffixes the others with
+    their id. Units are hashed with the name when there's no salt, the
+    old name becomes the salt so assignments don't change.
+    """
+    Experiment = apps.get_model('planout_experiments', 'Experiment')
+
+    duplicated = Experiment.objects.values('name').annotate(
+        count=Count('*')
+    ).filter(count__gt=1).values_list('name', flat=True)
+
+    for experiment in Experiment.objects.filter(name__in=list(duplicated)).order_by('name', 'pk'):
+        if Experiment.objects.filter(name=experiment.name, pk__lt=experiment.pk).exists():
+            suffix = ' #{}'.format(experiment.pk)
+            experiment.salt = experiment.salt or experiment.name
+            experiment.name = experiment.name[:140 - len(suffix)] + suffix
+            experiment.save(update_fields=['name', 'salt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0007_goal_name_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_experiments, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='experiment',
+            name='name',
+            field=models.CharField(max_length=140, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalexperiment',
+            name='name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+    ]
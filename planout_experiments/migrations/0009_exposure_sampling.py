@@ -0,0 +1,39 @@
+# Generated by Django 2.1.11 on 2026-10-16 23:09
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0008_experiment_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='exposure_sample_rate',
+            field=models.FloatField(default=1.0, help_text='Fraction of units whose exposures are logged, chosen by hashing the unit', validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='experiment',
+            name='max_exposures_per_second',
+            field=models.PositiveIntegerField(blank=True, help_text='Exposures each process logs per second at most, leave empty for no limit', null=True),
+        ),
+        migrations.AddField(
+            model_name='exposure',
+            name='sample_rate',
+            field=models.FloatField(default=1.0, help_text='Probability this exposure was logged with, see planout_experiments.sampling'),
+        ),
+        migrations.AddField(
+            model_name='historicalexperiment',
+            name='exposure_sample_rate',
+            field=models.FloatField(default=1.0, help_text='Fraction of units whose exposures are logged, chosen by hashing the unit', validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='historicalexperiment',
+            name='max_exposures_per_second',
+            field=models.PositiveIntegerField(blank=True, help_text='Exposures each process logs per second at most, leave empty for no limit', null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.11 on 2026-10-16 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0009_exposure_sampling'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='experimentlog',
+            index=models.Index(fields=['created'], name='planout_exp_created_c6cc06_idx'),
+        ),
+    ]
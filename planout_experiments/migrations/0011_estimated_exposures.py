@@ -0,0 +1,61 @@
+# Generated by Django 2.1.11 on 2026-10-16 23:35
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def estimate_exposures(apps, schema_editor):
+    Variation = apps.get_model('planout_experiments', 'Variation')
+    Exposure = apps.get_model('planout_experiments', 'Exposure')
+
+    estimated_counts = Exposure.objects.filter(
+        variation=OuterRef('pk')
+    ).order_by().values('variation').annotate(
+        estimated=Sum(1.0 / F('sample_rate'), output_field=models.FloatField())
+    ).values('estimated')
+
+    Variation.objects.update(
+        estimated_exposure_count=Coalesce(Subquery(estimated_counts, output_field=models.FloatField()), 0.0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planout_experiments', '0010_experiment_log_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experimentresult',
+            name='estimated_exposures',
+            field=models.FloatField(default=0, help_text='Exposed units weighted by the inverse of their sample rate'),
+        ),
+        migrations.AddField(
+            model_name='exposedunit',
+            name='weight',
+            field=models.FloatField(default=1.0, help_text="Inverse of the highest sample rate the unit's first processed exposures were logged with"),
+        ),
+        migrations.AddField(
+            model_name='exposurerollup',
+            name='estimated_exposures',
+            field=models.FloatField(default=0, help_text='Exposures weighted by the inverse of their sample rate'),
+        ),
+        migrations.AddField(
+            model_name='historicalexperimentresult',
+            name='estimated_exposures',
+            field=models.FloatField(default=0, help_text='Exposed units weighted by the inverse of their sample rate'),
+        ),
+        migrations.AddField(
+            model_name='historicalvariation',
+            name='estimated_exposure_count',
+            field=models.FloatField(default=0, help_text='Exposures weighted by the inverse of their sample rate, maintained alongside exposure_count'),
+        ),
+        migrations.AddField(
+            model_name='variation',
+            name='estimated_exposure_count',
+            field=models.FloatField(default=0, help_text='Exposures weighted by the inverse of their sample rate, maintained alongside exposure_count'),
+        ),
+        migrations.RunPython(estimate_exposures, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,8 @@
 import json
+import random
+import threading
 
 from django_extensions.db.models import TimeStampedModel
-from simple_history.models import HistoricalRecords
 
 from planout.experiment import SimpleInterpretedExperiment
 from planout.assignment import Assignment
@@ -9,22 +10,65 @@ from planout.interpreter import Interpreter
 
 from structlog import get_logger
 
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.contrib.postgres.fields import JSONField
-from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.db.models import Sum
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.utils.timezone import now
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.conf import settings
 
+from .assignment_cache import load_assignments, mark_exposed, store_assignments
+from .attribution import VariationGoalStats, goal_attribution
+from .bulk import assign_units
+from .compiler import compiled_scripts
+from .conf import get_setting
+from .goals import Achievement, log_achievements
+from .history import ConfigurableHistoricalRecords
+from .logs import get_log_backend, log_row
+from .registry import TrialCache, experiment_registry, goal_registry, variation_ids
+from .sampling import exposure_sample_rate
+from .sinks import get_exposure_sink
+
 
 logger = get_logger(__name__)
 
 DJANGO_USER_DB_ID = 'django_user_db_id'
 
 
+def get_unit_inputs(user=None, user_identifier=None, user_identifier_type=None, inputs=None):
+    """
+    Builds trial inputs identifying the unit by django user or by a fuzzy
+    identifier, returns None when neither is given
+    """
+    if user is None and (user_identifier is None or user_identifier_type is None):
+        return None
+
+    inputs = dict(inputs or {})
+
+    if user is not None:
+        inputs['user_id'] = user.id
+        inputs['user_identifier_type'] = DJANGO_USER_DB_ID
+    else:
+        inputs['user_id'] = user_identifier
+        inputs['user_identifier_type'] = user_identifier_type
+
+    return inputs
+
+
+def log_constant_exposure():
+    """
+    Whether a lookup on an experiment whose script has no random
+    operators logs exposure, sampled at
+    PLANOUT_EXPERIMENTS_CONSTANT_EXPOSURE_SAMPLE_RATE
+    """
+    rate = get_setting('CONSTANT_EXPOSURE_SAMPLE_RATE', 1.0)
+    return rate >= 1 or random.random() < rate
+
+
 def default_now():
     return now()
 
@@ -33,6 +77,24 @@ def default_planout():
     return """{"op": "seq", "seq": []}"""
 
 
+def planout_set_ops(variables):
+    return [{"op": "set", "var": key, "value": value} for key, value in variables]
+
+
+def planout_from_control(control):
+    """
+    Builds the planout script setting each control value, a bare value
+    is stored as ``single_value``
+    """
+    if type(control) != dict:
+        control = {"single_value": control}
+
+    return {
+        "op": "seq",
+        "seq": planout_set_ops(control.items())
+    }
+
+
 class AdminLinkMixin(models.Model):
     """
     Mixin that provides links to the model's admin and a link to report issues with model instances for admin users
@@ -69,12 +131,13 @@ class BaseModelNoHistory(TimeStampedModel):
 
 class BaseModel(AdminLinkMixin, BaseModelNoHistory):
     """
-    By default all models should have timestamp info and history
+    By default all models should have timestamp info and history, which
+    PLANOUT_EXPERIMENTS_HISTORY can buffer or turn off per model
     """
     class Meta:
         abstract = True
 
-    history = HistoricalRecords(inherit=True)
+    history = ConfigurableHistoricalRecords(inherit=True)
 
 
 class FuzzyUserMixin(AdminLinkMixin, models.Model):
@@ -176,7 +239,7 @@ class AppDataEvent(AdminLinkMixin, AppDataMixin, DataEvent):
 
 
 class Experiment(BaseModel):
-    name = models.CharField(max_length=140)
+    name = models.CharField(max_length=140, unique=True)
     salt = models.CharField(
         blank=True,
         max_length=140,
@@ -192,6 +255,16 @@ class Experiment(BaseModel):
         help_text="JSON experiment description using the planout design language, user the editor at http://planout-editor.herokuapp.com/",  # NOQA,
         default=default_planout
     )
+    exposure_sample_rate = models.FloatField(
+        default=1.0,
+        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+        help_text="Fraction of units whose exposures are logged, chosen by hashing the unit"
+    )
+    max_exposures_per_second = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Exposures each process logs per second at most, leave empty for no limit"
+    )
 
     def __str__(self):
         return self.name
@@ -203,19 +276,50 @@ class Experiment(BaseModel):
             **kwargs
         )
 
+    def get_compiled_script(self):
+        """
+        Returns the process wide compiled form of this experiment's
+        planout script, memoized per parsed script so the content hash
+        is only computed once per instance
+        """
+        planout_dict = self.get_planout_dict()
+        source, compiled_script = getattr(self, '_compiled_planout', (None, None))
+
+        if source is not planout_dict:
+            compiled_script = compiled_scripts.get_or_compile(self.pk, planout_dict)
+            self._compiled_planout = (planout_dict, compiled_script)
+
+        return compiled_script
+
+    def get_constant_params(self):
+        """
+        The read only parameters every unit gets when the script has no
+        random operators, None otherwise
+        """
+        return self.get_compiled_script().constant_params
+
     def get_planout_params(self):
-        interpreter_instance = self.get_interpreter_instance()
-        return interpreter_instance.get_params()
+        params = Assignment(self.salt)
+        self.get_compiled_script().execute(params, self.salt, {})
+        return params
 
     @property
     def output_variables(self):
         return list([k for k in self.get_planout_params().keys()])
 
     def get_planout_dict(self):
-        if type(self.planout_json) != dict:
-            return json.loads(self.planout_json)
+        if type(self.planout_json) == dict:
+            return self.planout_json
 
-        return self.planout_json
+        # Parse each planout_json string once per instance, cached
+        # experiments are read on every flag lookup
+        source, planout_dict = getattr(self, '_parsed_planout', (None, None))
+
+        if source is not self.planout_json:
+            planout_dict = json.loads(self.planout_json)
+            self._parsed_planout = (self.planout_json, planout_dict)
+
+        return planout_dict
 
     def get_planout_str(self):
         if type(self.planout_json) == dict:
@@ -224,43 +328,105 @@ class Experiment(BaseModel):
         return self.planout_json
 
     def add_planout_variable(self, key, value):
+        self.add_planout_variables([(key, value)])
+
+    def add_planout_variables(self, variables, save=True):
+        """
+        Appends a set op for every (key, value) in ``variables``, a dict or
+        pairs, to the script and persists them with a single save
+        """
+        if isinstance(variables, dict):
+            variables = variables.items()
+
         existing_dict = self.get_planout_dict()
-        existing_dict['seq'].append({"op": "set", "var": key, "value": value})
 
-        self.planout_json = existing_dict
-        self.save()
+        # Build a new script rather than appending in place, the parsed
+        # dict may be shared with the experiment registry
+        self.planout_json = dict(
+            existing_dict,
+            seq=existing_dict['seq'] + planout_set_ops(variables)
+        )
+
+        if save:
+            self.save()
 
-    def set_planout_from_control(self, control):
+    def set_planout_from_control(self, control, save=True):
         if type(control) != dict:
             control = {"single_value": control}
 
-        for key, value in control.items():
-            self.add_planout_variable(key, value)
+        self.add_planout_variables(control, save=save)
 
-    def get_experiment_trial(self, **inputs):
-        trial = getattr(self, 'trial', None)
+    def get_experiment_trial(self, event_user=None, **inputs):
+        """
+        Returns the trial for ``inputs``. Trials are kept in a per instance
+        and thread LRU (PLANOUT_EXPERIMENTS_TRIAL_CACHE_SIZE) so repeat
+        lookups for a unit reuse its assignment and only log exposure once.
+        """
+        trials = self._get_trial_cache()
+        key = TrialCache.key_for(inputs)
+        trial = trials.get(key) if key is not None else None
 
         if trial is None:
-            self.trial = SingleTrial(db_experiment=self, **inputs)
+            trial = SingleTrial(db_experiment=self, event_user=event_user, **inputs)
 
-        return self.trial
+            if key is not None:
+                trials.set(key, trial)
+
+        return trial
+
+    def _get_trial_cache(self):
+        # Trials are mutable and instances are shared through the process
+        # wide registry, every thread gets its own trials
+        local = self.__dict__.setdefault('_trials', threading.local())
+
+        try:
+            return local.trials
+        except AttributeError:
+            local.trials = TrialCache()
+            return local.trials
 
     def get_trial_for_user(self, user, inputs=None):
-        return self.get_trial_for_user_id(user.id, inputs=inputs)
+        return self.get_trial_for_user_id(user.id, inputs=inputs, event_user=user)
 
-    def get_trial_for_user_id(self, user_id, inputs=None):
+    def get_trial_for_user_id(self, user_id, inputs=None, event_user=None):
         if inputs is None:
             inputs = {}
 
         inputs['user_id'] = user_id
         inputs['user_identifier_type'] = DJANGO_USER_DB_ID
 
-        return self.get_experiment_trial(**inputs)
+        return self.get_experiment_trial(event_user=event_user, **inputs)
+
+    def assign_units(
+            self,
+            units,
+            user_identifier_type=DJANGO_USER_DB_ID,
+            inputs=None,
+            log_exposures=False,
+            batch_size=1000
+    ):
+        """
+        Streams assignments for many units (django user ids by default)
+        for batch jobs, see bulk.assign_units
+        """
+        return assign_units(
+            self,
+            units,
+            user_identifier_type,
+            inputs=inputs,
+            log_exposures=log_exposures,
+            batch_size=batch_size
+        )
 
     def save(self, *args, **kwargs):
-        self.salt = self.name
+        # Only default the salt, an existing one keeps units where they
+        # were assigned
+        self.salt = self.salt or self.name
         super().save(*args, **kwargs)
 
+        # Cached trials were assigned with the previous script/salt
+        self.__dict__.pop('_trials', None)
+
     def get_absolute_url(self):
         return reverse(
             'experiment-breakdown',
@@ -269,15 +435,56 @@ class Experiment(BaseModel):
             }
         )
 
+    def get_estimated_exposures(self):
+        """
+        {variation id: exposures} scaled back up for exposure sampling
+        and rate limiting, read from the variations' estimated counters
+        """
+        return dict(self.variations.values_list('pk', 'estimated_exposure_count'))
+
+    def get_goal_attribution(self, goal):
+        """
+        Returns (variation, VariationGoalStats) for every variation of this
+        experiment, computed with one grouped query
+        """
+        stats = goal_attribution(self.pk, goal.pk)
+
+        return [
+            (variation, stats.get(variation.pk, VariationGoalStats(variation.pk, 0, 0, 0, 0)))
+            for variation in self.variations.all()
+        ]
+
     def get_results_for_goal(self, goal):
-        for variation in self.variations.all():
-            result, created = ExperimentResult.objects.get_or_create(
-                experiment=self,
-                goal=goal,
-                variation=variation
-            )
-            result.update_from_variation(variation)
-            yield result
+        """
+        The precomputed results for ``goal``, kept current by the
+        experiment_results rollup (see the run_rollups command)
+        """
+        return self.results.filter(goal=goal).select_related('variation').order_by(
+            'variation__key',
+            'variation__value'
+        )
+
+    def get_exposure_series(self, granularity='day'):
+        """
+        Precomputed exposures per variation and hour or day, ordered by
+        bucket
+        """
+        return self.exposure_rollups.filter(granularity=granularity).select_related('variation').order_by(
+            'bucket',
+            'variation__key',
+            'variation__value'
+        )
+
+    def get_goal_series(self, goal, granularity='day'):
+        """
+        Precomputed achievements and goal value per variation and hour or
+        day, ordered by bucket
+        """
+        return self.goal_rollups.filter(goal=goal, granularity=granularity).select_related('variation').order_by(
+            'bucket',
+            'variation__key',
+            'variation__value'
+        )
 
     def get_goal_results(self):
         for goal in self.goals.all():
@@ -285,13 +492,18 @@ class Experiment(BaseModel):
 
     @staticmethod
     def get_experiment(experiment_name, control_dict):
-        experiment, created = Experiment.objects.get_or_create(
-            name=experiment_name
-        )
+        """
+        Returns the named experiment, creating it from ``control_dict``
+        if it doesn't exist yet. Instances are shared through the
+        process wide experiment registry and must be treated as read only.
+        """
+        cached = experiment_registry.get(experiment_name)
 
-        if created:
-            experiment.set_planout_from_control(control_dict)
-            experiment.save()
+        if cached is not None:
+            return cached.experiment
+
+        experiment = experiment_registry.bootstrap(experiment_name, planout_from_control(control_dict))
+        experiment_registry.register(experiment)
 
         return experiment
 
@@ -307,25 +519,22 @@ class Experiment(BaseModel):
     ):
 
         experiment = Experiment.get_experiment(experiment_name, {key: control_value})
+        inputs = get_unit_inputs(user, user_identifier, user_identifier_type, inputs)
 
-        if user is None and (user_identifier is None or user_identifier_type is None):
+        if inputs is None:
             logger.warn(
                 "get_experiment_value must provide user or user_identifier and user_idenfier type, returning control"
             )
             return control_value
 
-        if inputs is None:
-            inputs = {}
+        # Flags whose script only sets literals skip assignment entirely
+        # unless this lookup is sampled for exposure logging
+        constant_params = experiment.get_constant_params()
 
-        if user is not None:
-            trial = experiment.get_trial_for_user(user)
-        else:
-            trial = experiment.get_experiment_trial(
-                inputs={
-                    'user_id': user_identifier,
-                    'user_identifier_type': user_identifier_type
-                }
-            )
+        if constant_params is not None and not log_constant_exposure():
+            return constant_params.get(key)
+
+        trial = experiment.get_experiment_trial(event_user=user, **inputs)
 
         return trial.get(key)
 
@@ -338,6 +547,14 @@ class Variation(BaseModel):
     )
     key = models.CharField(max_length=140)
     value = models.TextField()
+    exposure_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Denormalized number of exposures, incremented as exposures are written and corrected by reconcile_exposure_counts"  # NOQA
+    )
+    estimated_exposure_count = models.FloatField(
+        default=0,
+        help_text="Exposures weighted by the inverse of their sample rate, maintained alongside exposure_count"
+    )
 
     class Meta:
         unique_together = [
@@ -353,49 +570,145 @@ class Variation(BaseModel):
 
     @property
     def num_exposures(self):
-        num_exposures = self.exposures.count()
+        return self.exposure_count
 
-        if num_exposures is None:
-            return 0
-        else:
-            return num_exposures
+    @property
+    def estimated_exposures(self):
+        """
+        Exposures scaled back up for exposure sampling and rate limiting
+        """
+        return self.estimated_exposure_count
+
+    @staticmethod
+    def increment_exposure_counts(counts, estimates=None, using='default'):
+        """
+        Adds ``counts`` (a mapping of variation id to new exposures) and
+        ``estimates`` (variation id to the new exposures weighted by 1 /
+        their sample rate, the counts when not given) to the stored
+        counters of database ``using`` with a single update
+        """
+        if not counts:
+            return
+
+        if estimates is None:
+            estimates = counts
+
+        Variation.objects.using(using).filter(pk__in=counts).update(
+            exposure_count=F('exposure_count') + Case(
+                *[When(pk=variation_id, then=Value(count)) for variation_id, count in counts.items()],
+                output_field=models.PositiveIntegerField()
+            ),
+            estimated_exposure_count=F('estimated_exposure_count') + Case(
+                *[When(pk=variation_id, then=Value(float(estimates.get(variation_id, 0)))) for variation_id in counts],
+                output_field=models.FloatField()
+            )
+        )
+
+    @staticmethod
+    def reconcile_exposure_counts(experiment=None):
+        """
+        Recounts exposures for every variation (or those of
+        ``experiment``), correcting counters that drifted because
+        exposures were deleted or written outside the exposure sinks
+        """
+        variations = Variation.objects.all()
+
+        if experiment is not None:
+            variations = variations.filter(experiment=experiment)
+
+        exposures = Exposure.objects.filter(variation=OuterRef('pk')).order_by().values('variation')
+        exposure_counts = exposures.annotate(count=Count('*')).values('count')
+        estimated_counts = exposures.annotate(
+            estimated=Sum(1.0 / F('sample_rate'), output_field=models.FloatField())
+        ).values('estimated')
+
+        return variations.update(
+            exposure_count=Coalesce(Subquery(exposure_counts, output_field=models.PositiveIntegerField()), 0),
+            estimated_exposure_count=Coalesce(Subquery(estimated_counts, output_field=models.FloatField()), 0.0)
+        )
 
     def goal_achievements(self, goal):
-        return GoalAchievement.objects.filter(
-            goal=goal,
-            event_user__experiments_exposure_related__variation=self
+        """
+        Achievements of ``goal`` by units, django users or fuzzy
+        identifiers, exposed to this variation
+        """
+        # Separate EXISTS per kind of unit, each matches an index
+        exposed_user = Exposure.objects.filter(variation=self, event_user_id=OuterRef('event_user_id'))
+        exposed_identifier = Exposure.objects.filter(
+            variation=self,
+            event_user__isnull=True,
+            event_user_identifier=OuterRef('event_user_identifier'),
+            event_user_identifier_type=OuterRef('event_user_identifier_type')
         )
 
-    def success_value(self, goal):
-        if self.goal_achievements(goal).count() == 0:
-            return 0
+        return GoalAchievement.objects.filter(goal=goal).annotate(
+            exposed_user=Exists(exposed_user),
+            exposed_identifier=Exists(exposed_identifier)
+        ).filter(Q(exposed_user=True) | Q(event_user__isnull=True, exposed_identifier=True))
+
+    def goal_stats(self, goal):
+        """
+        VariationGoalStats of ``goal`` for this variation, every unit
+        counts once
+        """
+        return goal_attribution(self.experiment_id, goal.pk, [self.pk]).get(
+            self.pk,
+            VariationGoalStats(self.pk, 0, 0, 0, 0)
+        )
 
-        return self.goal_achievements(goal).aggregate(
-            total_success=Sum('value')
-        )['total_success']
+    def success_value(self, goal):
+        return self.goal_stats(goal).success_value
 
     def success_rate(self, goal):
-        if self.num_exposures == 0:
+        # Exposed units and value come from the same attribution row, so
+        # repeat visitors don't dilute the rate as raw exposure rows would
+        stats = self.goal_stats(goal)
+
+        if stats.exposed_units == 0:
             return 0
 
-        return self.success_value(goal) / self.num_exposures
+        return stats.success_value / stats.exposed_units
 
     def success_percentage(self, goal):
         return self.success_rate(goal) * 100.0
 
 
 class Exposure(FuzzyUserAppDataEvent):
+    # The experiment and variation columns lead composite indexes below,
+    # single column indexes on them would only slow down writes
     experiment = models.ForeignKey(
         Experiment,
         on_delete=models.CASCADE,
-        related_name='exposures'
+        related_name='exposures',
+        db_index=False
     )
     variation = models.ForeignKey(
         Variation,
         on_delete=models.CASCADE,
-        related_name='exposures'
+        related_name='exposures',
+        db_index=False
+    )
+
+    # Set when PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP is enabled, one row per
+    # unit and variation. See planout_experiments.dedup
+    dedup_key = models.CharField(max_length=40, null=True, blank=True, unique=True, editable=False)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    hits = models.PositiveIntegerField(default=1)
+    sample_rate = models.FloatField(
+        default=1.0,
+        help_text="Probability this exposure was logged with, see planout_experiments.sampling"
     )
 
+    class Meta:
+        indexes = [
+            # Rollups read exposures in windows of creation time
+            models.Index(fields=['created']),
+            models.Index(fields=['experiment', 'seen_at']),
+            # Matching achievements to the variations their unit saw
+            models.Index(fields=['variation', 'event_user']),
+            models.Index(fields=['event_user_identifier_type', 'event_user_identifier', 'variation']),
+        ]
+
     def __str__(self):
         return "{} exposed to {}".format(
             self.fuzzy_user_str,
@@ -411,11 +724,37 @@ class ExperimentLog(BaseModelNoHistory):
     )
     data = JSONField()
 
+    class Meta:
+        indexes = [
+            # Compaction and retention work through logs by creation time
+            models.Index(fields=['created']),
+        ]
+
 
 class SingleTrial(SimpleInterpretedExperiment):
-    def __init__(self, db_experiment, salt=None, **inputs):
+    def __init__(
+            self,
+            db_experiment,
+            salt=None,
+            event_user=None,
+            exposure_sink=None,
+            assignment_batch=None,
+            **inputs
+    ):
         self.db_experiment = db_experiment
 
+        # Where exposures go, defaults to the process wide sink
+        self.exposure_sink = exposure_sink
+
+        # Optional AssignmentBatch collecting assignment cache writes,
+        # otherwise they're written as the trial assigns and exposes
+        self.assignment_batch = assignment_batch
+        self._assignment_cache_checked = False
+
+        # Optional user instance matching inputs['user_id'], exposures
+        # fall back to writing the id so logging never fetches the user
+        self.event_user = event_user
+
         self.inputs = inputs           # input data
 
         # True when assignments have been exposure logged
@@ -439,8 +778,26 @@ class SingleTrial(SimpleInterpretedExperiment):
     def __str__(self):
         return f"Trial {self._salt} of {self._name}"
 
+    def _assign(self):
+        # Another process may already have assigned this unit
+        if self._assignment_cache_checked or load_assignments([self]):
+            super()._assign()
+
+            if self.assignment_batch is not None:
+                self.assignment_batch.assigned.append(self)
+            else:
+                store_assignments([self])
+
     def loadScript(self):
-        self.script = self.db_experiment.get_planout_dict()
+        self.compiled_script = self.db_experiment.get_compiled_script()
+        self.script = self.compiled_script.script
+
+    def assign(self, params, **kwargs):
+        self.loadScript()
+        return self.compiled_script.execute(params, self.salt, kwargs)
+
+    def checksum(self):
+        return self.compiled_script.checksum
 
     def setup(self):
         self.name = self.db_experiment.name
@@ -453,42 +810,58 @@ class SingleTrial(SimpleInterpretedExperiment):
         if not self._in_experiment:
             return
 
-        for key, value in self._assignment.items():
-            variation, created = Variation.objects.get_or_create(
-                experiment=self.db_experiment,
-                key=key,
-                value=value
-            )
+        exposures = []
+        user_identifier_type = self.inputs.get('user_identifier_type')
+        sample_rate = exposure_sample_rate(
+            self.db_experiment,
+            self.salt,
+            self.inputs.get('user_id'),
+            count=len(self._assignment)
+        )
+
+        if not sample_rate:
+            self._exposure_logged = True
+            return
 
-            user_identifier_type = self.inputs.get('user_identifier_type')
+        for key, value in self._assignment.items():
+            variation_id = variation_ids.get_variation_id(self.db_experiment.pk, key, value)
 
             if user_identifier_type is not None:
                 exposure = Exposure(
                     experiment=self.db_experiment,
-                    variation=variation
+                    variation_id=variation_id,
+                    sample_rate=sample_rate
                 )
 
                 if user_identifier_type == DJANGO_USER_DB_ID:
-                    user = get_user_model().objects.get(id=self.inputs['user_id'])
-                    exposure.event_user = user
+                    if self.event_user is not None:
+                        exposure.event_user = self.event_user
+                    else:
+                        exposure.event_user_id = self.inputs['user_id']
+
                     exposure.event_user_identifier_type = DJANGO_USER_DB_ID
                 else:
                     exposure.event_user_identifier = self.inputs['user_id']
                     exposure.event_user_identifier_type = user_identifier_type
 
-                exposure.save()
+                exposures.append(exposure)
+
+        exposure_sink = self.exposure_sink if self.exposure_sink is not None else get_exposure_sink()
+        exposure_sink.submit(exposures)
+
+        if self.assignment_batch is not None:
+            self.assignment_batch.exposed.append(self)
+        else:
+            mark_exposed([self])
 
         self._exposure_logged = True
 
     def log(self, data):
-        ExperimentLog.objects.create(
-            experiment=self.db_experiment,
-            data=data
-        )
+        get_log_backend().submit([log_row(self.db_experiment, data)])
 
 
 class Goal(BaseModel):
-    name = models.CharField(max_length=140)
+    name = models.CharField(max_length=140, unique=True)
     description = models.TextField()
 
     def __str__(self):
@@ -496,18 +869,19 @@ class Goal(BaseModel):
 
     @staticmethod
     def get_goal_by_name(name):
-        goal, created = Goal.objects.get_or_create(
-            name=name
-        )
-
-        return goal
+        """
+        Returns the goal named ``name`` from the goal registry, creating it
+        if it doesn't exist
+        """
+        return goal_registry.get_goal(name)
 
 
 class GoalAchievement(FuzzyUserAppDataEvent):
     goal = models.ForeignKey(
         Goal,
         on_delete=models.CASCADE,
-        related_name='achivements'
+        related_name='achivements',
+        db_index=False
     )
     value = models.FloatField(
         default=1.0,
@@ -517,18 +891,28 @@ class GoalAchievement(FuzzyUserAppDataEvent):
     object_id = models.PositiveIntegerField(null=True, blank=True)
     related_instance = GenericForeignKey('content_type', 'object_id')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created']),
+            models.Index(fields=['goal', 'seen_at']),
+            models.Index(fields=['goal', 'event_user']),
+            models.Index(fields=['goal', 'event_user_identifier_type', 'event_user_identifier']),
+        ]
+
     @staticmethod
-    def log_achievement_for_user(self, goal_name, user, value=1.0, seen_at=None):
-        goal = Goal.get_goal_by_name(goal_name)
+    def log_achievement_for_user(goal_name, user, value=1.0, seen_at=None, related_instance=None):
+        achievement, = log_achievements([
+            Achievement(goal_name, user=user, value=value, seen_at=seen_at, related_instance=related_instance)
+        ])
 
-        if seen_at is None:
-            seen_at = now()
+        return achievement
 
-        GoalAchievement.objects.create(
-            goal=goal,
-            event_user=user,
-            value=value
-        )
+    @staticmethod
+    def log_achievements(records, idempotent=False, batch_size=1000):
+        """
+        Batch ingestion, see planout_experiments.goals.log_achievements
+        """
+        return log_achievements(records, idempotent=idempotent, batch_size=batch_size)
 
     def __str__(self):
         return "{user} achieved {goal} {value}".format(
@@ -555,17 +939,170 @@ class ExperimentResult(BaseModel):
         related_name='results'
     )
     total_exposures = models.PositiveIntegerField(default=0)
+    estimated_exposures = models.FloatField(
+        default=0,
+        help_text="Exposed units weighted by the inverse of their sample rate"
+    )
     total_goal_achievements = models.PositiveIntegerField(default=0)
     success_value = models.FloatField(default=0)
     success_rate = models.FloatField(default=0)
 
     @property
     def success_percentage(self):
-        self.success_rate * 100
+        return self.success_rate * 100
+
+    def update_from_stats(self, stats):
+        """
+        Stores a VariationGoalStats, every unit counts once
+        """
+        self.total_exposures = stats.exposed_units
+        self.estimated_exposures = stats.estimated_units
+        self.total_goal_achievements = stats.achieving_units
+        self.success_value = stats.success_value
+        self.success_rate = stats.success_value / stats.exposed_units if stats.exposed_units else 0
+        self.save()
 
     def update_from_variation(self):
-        self.total_exposures = self.variation.num_variations
-        self.total_goal_achievements = self.variation.goal_achievements(self.goal)
-        self.success_value = self.variation.success_value(self.goal)
-        self.success_rate = self.variation.success_rate(self.goal)
-        self.save()
+        stats = goal_attribution(self.experiment_id, self.goal_id, [self.variation_id]).get(
+            self.variation_id,
+            VariationGoalStats(self.variation_id, 0, 0, 0, 0)
+        )
+        self.update_from_stats(stats)
+
+
+class ExposedUnit(BaseModelNoHistory):
+    """
+    Each unit exposed to a variation, once, as counted by the experiment
+    result rollup. Units are django user ids or fuzzy identifiers keyed
+    by their identifier type.
+    """
+    experiment = models.ForeignKey(
+        Experiment,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    variation = models.ForeignKey(
+        Variation,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    unit_type = models.CharField(max_length=140)
+    unit_id = models.CharField(max_length=140)
+    weight = models.FloatField(
+        default=1.0,
+        help_text="Inverse of the highest sample rate the unit's first processed exposures were logged with"
+    )
+
+    class Meta:
+        unique_together = [
+            ('variation', 'unit_type', 'unit_id')
+        ]
+        indexes = [
+            models.Index(fields=['unit_type', 'unit_id'])
+        ]
+
+
+class AchievingUnit(BaseModelNoHistory):
+    """
+    The summed value of a unit's achievements of a goal, as counted by
+    the experiment result rollup
+    """
+    goal = models.ForeignKey(
+        Goal,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    unit_type = models.CharField(max_length=140)
+    unit_id = models.CharField(max_length=140)
+    value = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = [
+            ('goal', 'unit_type', 'unit_id')
+        ]
+        indexes = [
+            models.Index(fields=['unit_type', 'unit_id'])
+        ]
+
+
+ROLLUP_GRANULARITIES = (
+    ('hour', 'Hour'),
+    ('day', 'Day'),
+)
+
+
+class ExposureRollup(BaseModelNoHistory):
+    """
+    Exposures of a variation per hour or day of ``seen_at``
+    """
+    experiment = models.ForeignKey(
+        Experiment,
+        on_delete=models.CASCADE,
+        related_name='exposure_rollups'
+    )
+    variation = models.ForeignKey(
+        Variation,
+        on_delete=models.CASCADE,
+        related_name='exposure_rollups'
+    )
+    granularity = models.CharField(max_length=8, choices=ROLLUP_GRANULARITIES)
+    bucket = models.DateTimeField(help_text="Start of the hour or day")
+    exposures = models.PositiveIntegerField(default=0)
+    estimated_exposures = models.FloatField(
+        default=0,
+        help_text="Exposures weighted by the inverse of their sample rate"
+    )
+
+    class Meta:
+        unique_together = [
+            ('granularity', 'bucket', 'variation')
+        ]
+        indexes = [
+            models.Index(fields=['experiment', 'granularity', 'bucket'])
+        ]
+
+
+class GoalRollup(BaseModelNoHistory):
+    """
+    Achievements of a goal per hour or day of ``seen_at`` by units exposed
+    to a variation, whenever they were exposed
+    """
+    experiment = models.ForeignKey(
+        Experiment,
+        on_delete=models.CASCADE,
+        related_name='goal_rollups'
+    )
+    variation = models.ForeignKey(
+        Variation,
+        on_delete=models.CASCADE,
+        related_name='goal_rollups'
+    )
+    goal = models.ForeignKey(
+        Goal,
+        on_delete=models.CASCADE,
+        related_name='rollups'
+    )
+    granularity = models.CharField(max_length=8, choices=ROLLUP_GRANULARITIES)
+    bucket = models.DateTimeField(help_text="Start of the hour or day")
+    achievements = models.PositiveIntegerField(default=0)
+    value = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = [
+            ('granularity', 'bucket', 'variation', 'goal')
+        ]
+        indexes = [
+            models.Index(fields=['experiment', 'goal', 'granularity', 'bucket'])
+        ]
+
+
+class RollupState(BaseModelNoHistory):
+    """
+    How far a rollup has processed exposures and achievements, by
+    creation time
+    """
+    name = models.CharField(max_length=140, unique=True)
+    watermark = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{} up to {}".format(self.name, self.watermark)
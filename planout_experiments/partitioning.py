@@ -0,0 +1,222 @@
+"""
+Optional PostgreSQL range partitioning of the event tables by month of
+``seen_at``. Converting a table rewrites it, run ``partition_events
+--convert`` during a maintenance window and ``partition_events`` on a
+schedule afterwards so upcoming months have their partitions.
+"""
+import re
+
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.utils.timezone import now, utc
+
+from .conf import get_setting
+
+
+PARTITION_KEY = 'seen_at'
+
+
+def get_partitioned_models():
+    from .models import Exposure, GoalAchievement
+
+    return [Exposure, GoalAchievement]
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=utc)
+
+
+def next_month(value):
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1, tzinfo=utc)
+
+    return datetime(value.year, value.month + 1, 1, tzinfo=utc)
+
+
+def partition_name(model, start):
+    return '{}_p{:%Y%m}'.format(model._meta.db_table, start)
+
+
+def is_partitioned(model):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [model._meta.db_table])
+        row = cursor.fetchone()
+
+    return row is not None and row[0] == 'p'
+
+
+def create_partitions(model, start, end):
+    """
+    Creates the monthly partitions of ``model`` covering ``start`` up to
+    and including the month of ``end``, skipping existing ones. Returns
+    the names of the partitions created.
+    """
+    created = []
+    month = month_start(start)
+
+    with connection.cursor() as cursor:
+        while month <= end:
+            name = partition_name(model, month)
+            cursor.execute("SELECT to_regclass(%s)", [name])
+
+            if cursor.fetchone()[0] is None:
+                cursor.execute(
+                    "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)".format(
+                        _qn(name),
+                        _qn(model._meta.db_table)
+                    ),
+                    [month, next_month(month)]
+                )
+                created.append(name)
+
+            month = next_month(month)
+
+    return created
+
+
+def ensure_future_partitions(months_ahead=3):
+    """
+    Creates partitions from the current month to ``months_ahead`` months
+    out for every partitioned event table
+    """
+    created = []
+    end = month_start(now())
+
+    for _ in range(months_ahead):
+        end = next_month(end)
+
+    for model in get_partitioned_models():
+        if is_partitioned(model):
+            created.extend(create_partitions(model, now(), end))
+
+    return created
+
+
+def _index_definitions(cursor, table):
+    """
+    CREATE INDEX statements for every index of ``table`` but the primary
+    key. Partitioned tables can only enforce uniqueness within a
+    partition key value, unique indexes without it (``uuid``) become
+    plain indexes rather than pretending to be unique.
+    """
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(i.indexrelid), i.indisunique
+        FROM pg_index i
+        WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary
+        """,
+        [table]
+    )
+    definitions = []
+
+    for definition, unique in cursor.fetchall():
+        if unique and PARTITION_KEY not in definition:
+            definition = re.sub(r'^CREATE UNIQUE INDEX', 'CREATE INDEX', definition)
+
+        definitions.append(definition)
+
+    return definitions
+
+
+def convert_to_partitioned(model, months_ahead=3):
+    """
+    Rewrites the table of ``model`` as a table range partitioned by month
+    of ``seen_at``, with a default partition for anything outside the
+    created months. The primary key becomes (id, seen_at) and seen_at
+    becomes NOT NULL, rows without one use their creation time. ``uuid``
+    is no longer unique afterwards, idempotent ``log_achievements``
+    serializes its replay check instead. Returns False when the table is
+    already partitioned. Exposures can't be partitioned while
+    PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP is enabled.
+    """
+    from .models import Exposure
+
+    if is_partitioned(model):
+        return False
+
+    if model is Exposure and get_setting('EXPOSURE_DEDUP', False):
+        raise ImproperlyConfigured(
+            "Exposures can't be partitioned with PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP enabled, deduplication "
+            "needs a unique index on dedup_key alone"
+        )
+
+    opts = model._meta
+    table = opts.db_table
+    old_table = '{}_unpartitioned'.format(table)
+    pk = opts.pk.column
+    columns = [field.column for field in opts.concrete_fields]
+    created = opts.get_field('created').column
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Deferred foreign key checks queued against the old table would
+        # keep it from being dropped
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(_qn(table)))
+        indexes = _index_definitions(cursor, table)
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) "
+            "AND contype = 'f'",
+            [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, pk])
+        sequence = cursor.fetchone()[0]
+        cursor.execute("SELECT min({}), max({}) FROM {}".format(
+            _qn(PARTITION_KEY), _qn(PARTITION_KEY), _qn(table)
+        ))
+        first_seen, last_seen = cursor.fetchone()
+
+        cursor.execute("ALTER TABLE {} RENAME TO {}".format(_qn(table), _qn(old_table)))
+        cursor.execute(
+            "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({})".format(
+                _qn(table),
+                _qn(old_table),
+                _qn(PARTITION_KEY)
+            )
+        )
+        cursor.execute("ALTER TABLE {} ALTER COLUMN {} SET NOT NULL".format(_qn(table), _qn(PARTITION_KEY)))
+        cursor.execute("ALTER TABLE {} ADD PRIMARY KEY ({}, {})".format(
+            _qn(table), _qn(pk), _qn(PARTITION_KEY)
+        ))
+
+        end = month_start(now())
+
+        for _ in range(months_ahead):
+            end = next_month(end)
+
+        create_partitions(model, min(first_seen or now(), now()), max(last_seen or end, end))
+        cursor.execute("CREATE TABLE {} PARTITION OF {} DEFAULT".format(
+            _qn('{}_default'.format(table)),
+            _qn(table)
+        ))
+
+        cursor.execute("INSERT INTO {table} ({columns}) SELECT {values} FROM {old_table}".format(
+            table=_qn(table),
+            columns=', '.join(_qn(column) for column in columns),
+            values=', '.join(
+                'COALESCE({}, {})'.format(_qn(column), _qn(created)) if column == PARTITION_KEY else _qn(column)
+                for column in columns
+            ),
+            old_table=_qn(old_table)
+        ))
+
+        if sequence is not None:
+            cursor.execute("ALTER SEQUENCE {} OWNED BY {}.{}".format(sequence, _qn(table), _qn(pk)))
+
+        cursor.execute("DROP TABLE {}".format(_qn(old_table)))
+
+        for definition in indexes:
+            cursor.execute(definition)
+
+        for name, definition in foreign_keys:
+            cursor.execute("ALTER TABLE {} ADD CONSTRAINT {} {}".format(_qn(table), _qn(name), definition))
+
+        cursor.execute("ANALYZE {}".format(_qn(table)))
+
+    return True
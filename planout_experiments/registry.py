@@ -0,0 +1,427 @@
+import time
+import threading
+
+from collections import OrderedDict, namedtuple
+
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from .conf import get_setting
+from .history import record_history
+
+
+CachedExperiment = namedtuple('CachedExperiment', ['experiment', 'planout_dict'])
+
+
+class TTLCache(object):
+    """
+    Thread safe, size bounded LRU mapping whose entries expire ``ttl``
+    seconds after they were stored. A ``ttl`` of None never expires
+    entries and a ``max_size`` of 0 disables the cache entirely.
+    """
+    def __init__(self, max_size=1000, ttl=None, timer=time.monotonic):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._timer = timer
+        self._lock = threading.RLock()
+        self._data = OrderedDict()
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                return default
+
+            if expires_at is not None and expires_at <= self._timer():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        max_size = self.max_size
+
+        if not max_size:
+            return
+
+        ttl = self.ttl
+        expires_at = None if ttl is None else self._timer() + ttl
+
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            expires_at, value = self._data.pop(key, (None, default))
+            return value
+
+    def pop_matching(self, predicate):
+        """
+        Removes every entry whose value satisfies ``predicate``, used when
+        the key a value was stored under is no longer known
+        """
+        with self._lock:
+            stale = [key for key, (expires_at, value) in self._data.items() if predicate(value)]
+
+            for key in stale:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ExperimentRegistry(TTLCache):
+    """
+    Process local cache of Experiment rows keyed by name, holding the
+    loaded model instance alongside its parsed planout script so flag
+    lookups only touch the database on a miss. Entries are dropped when
+    an Experiment is saved or deleted (see signals.py) and otherwise
+    live for PLANOUT_EXPERIMENTS_REGISTRY_TTL seconds.
+    """
+    def __init__(self, timer=time.monotonic):
+        super().__init__(timer=timer)
+
+    @property
+    def max_size(self):
+        return get_setting('REGISTRY_MAX_SIZE', 1000)
+
+    @property
+    def ttl(self):
+        return get_setting('REGISTRY_TTL', 300)
+
+    def register(self, experiment):
+        """
+        Stores ``experiment`` once the surrounding transaction commits, a
+        row created inside a transaction that later rolls back must never
+        be served from the cache
+        """
+        def store():
+            self.set(
+                experiment.name,
+                CachedExperiment(experiment, experiment.get_planout_dict())
+            )
+
+        transaction.on_commit(store)
+
+    def bootstrap(self, name, planout_dict):
+        """
+        Returns the experiment named ``name``, creating it with
+        ``planout_dict`` as its script if it doesn't exist. Creation is a
+        single INSERT ... ON CONFLICT on the unique name, so concurrent
+        first requests all end up with the same row and a new experiment
+        is never visible without its script.
+        """
+        from .models import Experiment
+
+        experiment = Experiment.objects.filter(name=name).first()
+
+        if experiment is not None:
+            return experiment
+
+        # Experiment.save salts with the name, so does the raw insert
+        experiment = Experiment(name=name, salt=name, planout_json=planout_dict)
+        opts = Experiment._meta
+        qn = connection.ops.quote_name
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} ({columns}) VALUES ({values}) "
+                "ON CONFLICT ({name}) DO NOTHING RETURNING {pk}".format(
+                    table=qn(opts.db_table),
+                    columns=', '.join(qn(field.column) for field in fields),
+                    values=', '.join(['%s'] * len(fields)),
+                    name=qn(opts.get_field('name').column),
+                    pk=qn(opts.pk.column)
+                ),
+                [field.get_db_prep_save(field.pre_save(experiment, True), connection) for field in fields]
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            # Another worker created it first
+            return Experiment.objects.get(name=name)
+
+        experiment.pk = row[0]
+        experiment._state.adding = False
+        record_history([experiment])
+
+        return experiment
+
+    def invalidate(self, experiment):
+        self.pop(experiment.name)
+
+        # The row may have been renamed since it was cached
+        self.pop_matching(lambda cached: cached.experiment.pk == experiment.pk)
+
+
+experiment_registry = ExperimentRegistry()
+
+
+class VariationCache(TTLCache):
+    """
+    Process wide map of experiment id to the ids of its variations keyed
+    by (key, value), so steady state exposure logging runs no variation
+    queries. Experiments are warmed with one query and misses are filled
+    with a single race safe INSERT ... ON CONFLICT. Ids only become
+    visible to other requests once the transaction that read or created
+    them commits.
+    """
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def max_size(self):
+        return get_setting('VARIATION_CACHE_SIZE', 1000)
+
+    def warm(self, experiment_ids):
+        from .models import Variation
+
+        loaded = {experiment_id: {} for experiment_id in experiment_ids}
+        rows = Variation.objects.filter(
+            experiment_id__in=loaded.keys()
+        ).values_list('experiment_id', 'key', 'value', 'id')
+
+        for experiment_id, key, value, variation_id in rows:
+            loaded[experiment_id][(key, value)] = variation_id
+
+        def store():
+            for experiment_id, variations in loaded.items():
+                self.set(experiment_id, variations)
+
+        transaction.on_commit(store)
+
+        return loaded
+
+    def get_variations(self, experiment_id):
+        """
+        Returns the cached {(key, value): variation id} map for an
+        experiment, loading it on a miss
+        """
+        variations = self.get(experiment_id)
+
+        if variations is None:
+            variations = self.warm([experiment_id])[experiment_id]
+
+        return variations
+
+    def get_variation_id(self, experiment_id, key, value):
+        # Variation.value is a TextField, match the string django stores
+        value = str(value)
+
+        try:
+            return self.get_variations(experiment_id)[(key, value)]
+        except KeyError:
+            return self.create_variation_id(experiment_id, key, value)
+
+    def create_variation_id(self, experiment_id, key, value):
+        value = str(value)
+        variation_id = self._insert(experiment_id, key, value)
+
+        def store():
+            cached = self.get(experiment_id)
+
+            if cached is not None:
+                cached[(key, value)] = variation_id
+
+        transaction.on_commit(store)
+
+        return variation_id
+
+    def _insert(self, experiment_id, key, value):
+        from .models import Variation
+
+        opts = Variation._meta
+        qn = connection.ops.quote_name
+        columns = ', '.join(
+            qn(opts.get_field(name).column)
+            for name in (
+                'created',
+                'modified',
+                'experiment',
+                'key',
+                'value',
+                'exposure_count',
+                'estimated_exposure_count'
+            )
+        )
+        unique = ', '.join(qn(opts.get_field(name).column) for name in ('experiment', 'key', 'value'))
+        created = now()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s, %s, 0, 0) "
+                "ON CONFLICT ({unique}) DO NOTHING RETURNING {pk}".format(
+                    table=qn(opts.db_table),
+                    columns=columns,
+                    unique=unique,
+                    pk=qn(opts.pk.column)
+                ),
+                [created, created, experiment_id, key, value]
+            )
+            row = cursor.fetchone()
+
+        if row is not None:
+            record_history([Variation(
+                pk=row[0],
+                created=created,
+                modified=created,
+                experiment_id=experiment_id,
+                key=key,
+                value=value,
+                exposure_count=0,
+                estimated_exposure_count=0
+            )])
+            return row[0]
+
+        # Another worker created it first
+        return Variation.objects.values_list('id', flat=True).get(
+            experiment_id=experiment_id,
+            key=key,
+            value=value
+        )
+
+    def invalidate(self, experiment_id):
+        self.pop(experiment_id)
+
+
+variation_ids = VariationCache()
+
+
+class GoalRegistry(TTLCache):
+    """
+    Process wide cache of Goal rows keyed by name so logging achievements
+    by goal name runs no goal queries in steady state. The first lookup
+    warms it with every goal in one query, later misses load only the
+    missing names and create goals that don't exist yet. Entries are
+    dropped when a Goal is saved or deleted (see signals.py) and otherwise
+    live for PLANOUT_EXPERIMENTS_REGISTRY_TTL seconds.
+    """
+    def __init__(self, timer=time.monotonic):
+        super().__init__(timer=timer)
+        self._warmed = False
+
+    @property
+    def max_size(self):
+        return get_setting('GOAL_CACHE_SIZE', 1000)
+
+    @property
+    def ttl(self):
+        return get_setting('REGISTRY_TTL', 300)
+
+    def get_goals(self, names):
+        """
+        Returns {name: Goal} for every name in ``names``
+        """
+        goals = {}
+        missing = set()
+
+        for name in names:
+            goal = self.get(name)
+
+            if goal is None:
+                missing.add(name)
+            else:
+                goals[name] = goal
+
+        if missing:
+            loaded = self._load(missing)
+            goals.update((name, loaded[name]) for name in missing)
+
+            def store():
+                for name, goal in loaded.items():
+                    self.set(name, goal)
+
+                self._warmed = True
+
+            transaction.on_commit(store)
+
+        return goals
+
+    def get_goal(self, name):
+        return self.get_goals([name])[name]
+
+    def get_goal_ids(self, names):
+        return {name: goal.pk for name, goal in self.get_goals(names).items()}
+
+    def _load(self, names):
+        from .models import Goal
+
+        loaded = {}
+
+        if not self._warmed:
+            loaded.update((goal.name, goal) for goal in Goal.objects.order_by('-modified')[:self.max_size])
+
+        missing = [name for name in names if name not in loaded]
+
+        if missing:
+            loaded.update((goal.name, goal) for goal in Goal.objects.filter(name__in=missing))
+
+        for name in names:
+            if name not in loaded:
+                # Unique name, concurrent creators end up with the same row
+                loaded[name], created = Goal.objects.get_or_create(name=name)
+
+        return loaded
+
+    def invalidate(self, goal):
+        self.pop(goal.name)
+
+        # The row may have been renamed since it was cached
+        self.pop_matching(lambda cached: cached.pk == goal.pk)
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._warmed = False
+
+
+goal_registry = GoalRegistry()
+
+
+class TrialCache(TTLCache):
+    """
+    Per experiment instance LRU of SingleTrials keyed by their inputs
+    """
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def max_size(self):
+        return get_setting('TRIAL_CACHE_SIZE', 1000)
+
+    @staticmethod
+    def key_for(inputs):
+        """
+        Returns a hashable key for ``inputs`` or None when an input value
+        can't be hashed, those trials aren't cached
+        """
+        key = tuple(sorted(inputs.items()))
+
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
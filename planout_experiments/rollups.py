@@ -0,0 +1,529 @@
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils.timezone import is_naive, now
+
+from .attribution import unit_key_sql
+from .conf import get_setting
+
+
+def _column(model, name, alias=None):
+    column = connection.ops.quote_name(model._meta.get_field(name).column)
+
+    if alias is None:
+        return column
+
+    return '{}.{}'.format(alias, column)
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def created_window_sql(model, alias, start, end):
+    """
+    SQL and params selecting rows of ``model`` created after ``start``
+    (when there is one) up to and including ``end``
+    """
+    created = _column(model, 'created', alias)
+
+    if start is None:
+        return '{} <= %s'.format(created), [end]
+
+    return '{created} > %s AND {created} <= %s'.format(created=created), [start, end]
+
+
+class Rollup(object):
+    """
+    Base class for aggregations that are updated incrementally. Each run
+    processes the exposures and achievements created between the stored
+    watermark and ``until`` and then moves the watermark forward, in one
+    transaction holding a lock on the rollup's state row.
+    """
+    name = None
+
+    def process(self, start, end):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def default_until():
+        # Rows are stamped when they are built, not when their
+        # transaction commits, stay behind the newest rows so slow
+        # writers aren't skipped
+        return now() - timedelta(seconds=get_setting('ROLLUP_LAG', 60))
+
+    def run(self, until=None, rebuild=False):
+        """
+        Processes everything created up to ``until``, starting from
+        scratch when ``rebuild`` is set. Returns the new watermark.
+        """
+        from .models import RollupState
+
+        if until is None:
+            until = self.default_until()
+        elif is_naive(until):
+            # Watermarks are compared with aware timestamps
+            raise ValueError("until must be timezone aware, not {}".format(until.isoformat()))
+
+        with transaction.atomic():
+            RollupState.objects.get_or_create(name=self.name)
+            state = RollupState.objects.select_for_update().get(name=self.name)
+            start = state.watermark
+
+            if rebuild:
+                self.reset()
+                start = None
+            elif start is not None and start >= until:
+                return start
+
+            self.process(start, until)
+            RollupState.objects.filter(pk=state.pk).update(watermark=until, modified=now())
+
+        return until
+
+
+class ExperimentResultRollup(Rollup):
+    """
+    Keeps ExperimentResult up to date for every goal attached to an
+    experiment. Exposed and achieving units are recorded once in
+    ExposedUnit and AchievingUnit so each run only reads new events and
+    still counts every unit once, matching goal_attribution. A unit's
+    estimated exposure weight is fixed by the window it is first seen
+    in. Goals attached to an experiment after its events were processed
+    need a rebuild.
+    """
+    name = 'experiment_results'
+
+    def process(self, start, end):
+        deltas = OrderedDict()
+
+        # Achievements first, so units exposed in this window (which pick
+        # up all their achievements below) aren't counted twice
+        for row in self._achievement_deltas(start, end) + self._exposure_deltas(start, end):
+            experiment_id, variation_id, goal_id, exposures, estimated, achievements, value = row
+            delta = deltas.setdefault((experiment_id, variation_id, goal_id), [0, 0.0, 0, 0.0])
+            delta[0] += exposures
+            delta[1] += estimated
+            delta[2] += achievements
+            delta[3] += value
+
+        self._apply(deltas)
+
+    def reset(self):
+        from .models import AchievingUnit, ExperimentResult, ExposedUnit
+
+        ExposedUnit.objects.all().delete()
+        AchievingUnit.objects.all().delete()
+        ExperimentResult.objects.update(
+            total_exposures=0,
+            estimated_exposures=0,
+            total_goal_achievements=0,
+            success_value=0,
+            success_rate=0,
+            modified=now()
+        )
+
+    def _achievement_deltas(self, start, end):
+        from .models import DJANGO_USER_DB_ID, AchievingUnit, Experiment, ExposedUnit, GoalAchievement
+
+        window, window_params = created_window_sql(GoalAchievement, 'a', start, end)
+        unit_type, unit_id = unit_key_sql(GoalAchievement, 'a')
+        experiment_goals = Experiment.goals.through
+        stamp = now()
+
+        sql = """
+            WITH delta AS (
+                SELECT a.{goal} AS goal_id, {unit_type} AS unit_type, {unit_id} AS unit_id, SUM(a.{value}) AS value
+                FROM {achievement_table} a
+                WHERE {window}
+                GROUP BY 1, 2, 3
+            ), upserted AS (
+                INSERT INTO {achieving_table} AS au ({au_created}, {au_modified}, {au_goal}, {au_type}, {au_unit},
+                    {au_value})
+                SELECT %s, %s, goal_id, unit_type, unit_id, value
+                FROM delta
+                WHERE unit_type IS NOT NULL AND unit_id IS NOT NULL
+                ON CONFLICT ({au_goal}, {au_type}, {au_unit}) DO UPDATE
+                SET {au_value} = au.{au_value} + EXCLUDED.{au_value}, {au_modified} = EXCLUDED.{au_modified}
+                RETURNING au.{au_goal} AS goal_id, au.{au_type} AS unit_type, au.{au_unit} AS unit_id,
+                    (au.xmax = 0) AS inserted
+            )
+            SELECT eu.{eu_experiment}, eu.{eu_variation}, upserted.goal_id, 0, CAST(0 AS double precision),
+                COUNT(*) FILTER (WHERE upserted.inserted), SUM(delta.value)
+            FROM upserted
+            JOIN delta USING (goal_id, unit_type, unit_id)
+            JOIN {exposed_table} eu ON eu.{eu_type} = upserted.unit_type AND eu.{eu_unit} = upserted.unit_id
+            JOIN {goals_table} eg ON eg.{eg_experiment} = eu.{eu_experiment} AND eg.{eg_goal} = upserted.goal_id
+            GROUP BY 1, 2, 3
+        """.format(
+            goal=_column(GoalAchievement, 'goal'),
+            unit_type=unit_type,
+            unit_id=unit_id,
+            value=_column(GoalAchievement, 'value'),
+            achievement_table=_table(GoalAchievement),
+            window=window,
+            achieving_table=_table(AchievingUnit),
+            au_created=_column(AchievingUnit, 'created'),
+            au_modified=_column(AchievingUnit, 'modified'),
+            au_goal=_column(AchievingUnit, 'goal'),
+            au_type=_column(AchievingUnit, 'unit_type'),
+            au_unit=_column(AchievingUnit, 'unit_id'),
+            au_value=_column(AchievingUnit, 'value'),
+            exposed_table=_table(ExposedUnit),
+            eu_experiment=_column(ExposedUnit, 'experiment'),
+            eu_variation=_column(ExposedUnit, 'variation'),
+            eu_type=_column(ExposedUnit, 'unit_type'),
+            eu_unit=_column(ExposedUnit, 'unit_id'),
+            goals_table=_table(experiment_goals),
+            eg_experiment=_column(experiment_goals, 'experiment'),
+            eg_goal=_column(experiment_goals, 'goal')
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [DJANGO_USER_DB_ID] + window_params + [stamp, stamp])
+            return cursor.fetchall()
+
+    def _exposure_deltas(self, start, end):
+        from .models import DJANGO_USER_DB_ID, AchievingUnit, Experiment, Exposure, ExposedUnit
+
+        window, window_params = created_window_sql(Exposure, 'e', start, end)
+        unit_type, unit_id = unit_key_sql(Exposure, 'e')
+        experiment_goals = Experiment.goals.through
+        stamp = now()
+
+        sql = """
+            WITH exposed AS (
+                SELECT e.{experiment} AS experiment_id, e.{variation} AS variation_id,
+                    {unit_type} AS unit_type, {unit_id} AS unit_id, 1.0 / MAX(e.{sample_rate}) AS weight
+                FROM {exposure_table} e
+                WHERE {window}
+                GROUP BY 1, 2, 3, 4
+            ), inserted AS (
+                INSERT INTO {exposed_table} ({eu_created}, {eu_modified}, {eu_experiment}, {eu_variation}, {eu_type},
+                    {eu_unit}, {eu_weight})
+                SELECT %s, %s, experiment_id, variation_id, unit_type, unit_id, weight
+                FROM exposed
+                WHERE unit_type IS NOT NULL AND unit_id IS NOT NULL
+                ON CONFLICT ({eu_variation}, {eu_type}, {eu_unit}) DO NOTHING
+                RETURNING {eu_experiment} AS experiment_id, {eu_variation} AS variation_id, {eu_type} AS unit_type,
+                    {eu_unit} AS unit_id, {eu_weight} AS weight
+            )
+            SELECT inserted.experiment_id, inserted.variation_id, eg.{eg_goal}, COUNT(*), SUM(inserted.weight), 0, 0.0
+            FROM inserted
+            JOIN {goals_table} eg ON eg.{eg_experiment} = inserted.experiment_id
+            GROUP BY 1, 2, 3
+            UNION ALL
+            SELECT inserted.experiment_id, inserted.variation_id, au.{au_goal}, 0, 0.0, COUNT(*), SUM(au.{au_value})
+            FROM inserted
+            JOIN {achieving_table} au ON au.{au_type} = inserted.unit_type AND au.{au_unit} = inserted.unit_id
+            JOIN {goals_table} eg ON eg.{eg_experiment} = inserted.experiment_id AND eg.{eg_goal} = au.{au_goal}
+            GROUP BY 1, 2, 3
+        """.format(
+            experiment=_column(Exposure, 'experiment'),
+            variation=_column(Exposure, 'variation'),
+            sample_rate=_column(Exposure, 'sample_rate'),
+            unit_type=unit_type,
+            unit_id=unit_id,
+            exposure_table=_table(Exposure),
+            window=window,
+            exposed_table=_table(ExposedUnit),
+            eu_created=_column(ExposedUnit, 'created'),
+            eu_modified=_column(ExposedUnit, 'modified'),
+            eu_experiment=_column(ExposedUnit, 'experiment'),
+            eu_variation=_column(ExposedUnit, 'variation'),
+            eu_type=_column(ExposedUnit, 'unit_type'),
+            eu_unit=_column(ExposedUnit, 'unit_id'),
+            eu_weight=_column(ExposedUnit, 'weight'),
+            achieving_table=_table(AchievingUnit),
+            au_goal=_column(AchievingUnit, 'goal'),
+            au_type=_column(AchievingUnit, 'unit_type'),
+            au_unit=_column(AchievingUnit, 'unit_id'),
+            au_value=_column(AchievingUnit, 'value'),
+            goals_table=_table(experiment_goals),
+            eg_experiment=_column(experiment_goals, 'experiment'),
+            eg_goal=_column(experiment_goals, 'goal')
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [DJANGO_USER_DB_ID] + window_params + [stamp, stamp])
+            return cursor.fetchall()
+
+    def _apply(self, deltas):
+        """
+        Adds the deltas to their ExperimentResult rows with a single
+        UPDATE, creating missing rows first
+        """
+        from .models import ExperimentResult
+
+        if not deltas:
+            return
+
+        result_ids = {}
+        existing = ExperimentResult.objects.filter(
+            variation_id__in={variation_id for _, variation_id, _ in deltas},
+            goal_id__in={goal_id for _, _, goal_id in deltas}
+        ).order_by('-pk').values_list('pk', 'experiment_id', 'variation_id', 'goal_id')
+
+        for result_id, experiment_id, variation_id, goal_id in existing:
+            result_ids[(experiment_id, variation_id, goal_id)] = result_id
+
+        missing = [
+            ExperimentResult(experiment_id=experiment_id, variation_id=variation_id, goal_id=goal_id)
+            for experiment_id, variation_id, goal_id in deltas
+            if (experiment_id, variation_id, goal_id) not in result_ids
+        ]
+
+        for result in ExperimentResult.objects.bulk_create(missing):
+            result_ids[(result.experiment_id, result.variation_id, result.goal_id)] = result.pk
+
+        rows = []
+        params = []
+
+        for key, (exposures, estimated, achievements, value) in deltas.items():
+            rows.append('(%s, %s, %s, %s, %s)')
+            params.extend([result_ids[key], exposures, estimated, achievements, value])
+
+        total_exposures = 'r.{} + delta.exposures'.format(_column(ExperimentResult, 'total_exposures'))
+        success_value = 'r.{} + delta.value'.format(_column(ExperimentResult, 'success_value'))
+
+        sql = """
+            UPDATE {result_table} AS r
+            SET {total_exposures} = {new_exposures},
+                {estimated_exposures} = r.{estimated_exposures} + delta.estimated,
+                {total_achievements} = r.{total_achievements} + delta.achievements,
+                {success_value} = {new_value},
+                {success_rate} = CASE WHEN {new_exposures} > 0 THEN ({new_value}) / ({new_exposures}) ELSE 0 END,
+                {modified} = %s
+            FROM (VALUES {rows}) AS delta (id, exposures, estimated, achievements, value)
+            WHERE r.{pk} = delta.id
+        """.format(
+            result_table=_table(ExperimentResult),
+            total_exposures=_column(ExperimentResult, 'total_exposures'),
+            new_exposures=total_exposures,
+            estimated_exposures=_column(ExperimentResult, 'estimated_exposures'),
+            total_achievements=_column(ExperimentResult, 'total_goal_achievements'),
+            success_value=_column(ExperimentResult, 'success_value'),
+            new_value='CAST({} AS double precision)'.format(success_value),
+            success_rate=_column(ExperimentResult, 'success_rate'),
+            modified=_column(ExperimentResult, 'modified'),
+            rows=', '.join(rows),
+            pk=_column(ExperimentResult, 'id')
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [now()] + params)
+
+
+class TimeSeriesRollup(Rollup):
+    """
+    Fills ExposureRollup and GoalRollup with exposures and goal value per
+    variation for every hour or day of ``seen_at``. Each run finds the
+    buckets touched by events created since the watermark, including the
+    buckets of earlier achievements by newly exposed units, and
+    recomputes those buckets from the event tables, so rerunning any
+    window gives the same rows and late events land in the right bucket.
+    """
+    intervals = OrderedDict([
+        ('hour', timedelta(hours=1)),
+        ('day', timedelta(days=1)),
+    ])
+
+    def __init__(self, granularity):
+        if granularity not in self.intervals:
+            raise ValueError("granularity must be one of {}, not {}".format(', '.join(self.intervals), granularity))
+
+        self.granularity = granularity
+        self.name = 'series_by_{}'.format(granularity)
+
+    def process(self, start, end):
+        buckets = sorted(self._touched_buckets(start, end))
+        batch_size = get_setting('ROLLUP_BUCKET_BATCH_SIZE', 500)
+
+        for index in range(0, len(buckets), batch_size):
+            self._recompute(buckets[index:index + batch_size])
+
+    def reset(self):
+        from .models import ExposureRollup, GoalRollup
+
+        ExposureRollup.objects.filter(granularity=self.granularity).delete()
+        GoalRollup.objects.filter(granularity=self.granularity).delete()
+
+    def _touched_buckets(self, start, end):
+        from .models import Exposure, GoalAchievement
+
+        exposure_window, exposure_params = created_window_sql(Exposure, 'e', start, end)
+        achievement_window, achievement_params = created_window_sql(GoalAchievement, 'a', start, end)
+        columns = dict(
+            exposure_table=_table(Exposure),
+            exposure_seen=_column(Exposure, 'seen_at', 'e'),
+            exposure_user=_column(Exposure, 'event_user', 'e'),
+            exposure_identifier=_column(Exposure, 'event_user_identifier', 'e'),
+            exposure_identifier_type=_column(Exposure, 'event_user_identifier_type', 'e'),
+            achievement_table=_table(GoalAchievement),
+            achievement_seen=_column(GoalAchievement, 'seen_at', 'a'),
+            achievement_user=_column(GoalAchievement, 'event_user', 'a'),
+            achievement_identifier=_column(GoalAchievement, 'event_user_identifier', 'a'),
+            achievement_identifier_type=_column(GoalAchievement, 'event_user_identifier_type', 'a'),
+            exposure_window=exposure_window,
+            achievement_window=achievement_window
+        )
+
+        queries = [
+            (
+                "SELECT date_trunc(%s, {exposure_seen}) FROM {exposure_table} e "
+                "WHERE {exposure_window} AND {exposure_seen} IS NOT NULL",
+                [self.granularity] + exposure_params
+            ),
+            (
+                "SELECT date_trunc(%s, {achievement_seen}) FROM {achievement_table} a "
+                "WHERE {achievement_window} AND {achievement_seen} IS NOT NULL",
+                [self.granularity] + achievement_params
+            ),
+        ]
+
+        if start is not None:
+            # A new exposure attributes the unit's earlier achievements to
+            # its variation, on a full run every achievement is read anyway
+            queries.extend([
+                (
+                    "SELECT date_trunc(%s, {achievement_seen}) FROM {exposure_table} e "
+                    "JOIN {achievement_table} a ON {achievement_user} = {exposure_user} "
+                    "WHERE {exposure_window} AND {achievement_seen} IS NOT NULL",
+                    [self.granularity] + exposure_params
+                ),
+                (
+                    "SELECT date_trunc(%s, {achievement_seen}) FROM {exposure_table} e "
+                    "JOIN {achievement_table} a ON {achievement_user} IS NULL "
+                    "AND {achievement_identifier} = {exposure_identifier} "
+                    "AND {achievement_identifier_type} = {exposure_identifier_type} "
+                    "WHERE {exposure_window} AND {exposure_user} IS NULL AND {achievement_seen} IS NOT NULL",
+                    [self.granularity] + exposure_params
+                ),
+            ])
+
+        sql = ' UNION '.join(query.format(**columns) for query, _ in queries)
+        params = [param for _, query_params in queries for param in query_params]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _recompute(self, buckets):
+        from .models import Experiment, Exposure, ExposureRollup, GoalAchievement, GoalRollup
+
+        experiment_goals = Experiment.goals.through
+        interval = self.intervals[self.granularity]
+        stamp = now()
+
+        exposure_sql = """
+            INSERT INTO {rollup_table} ({created}, {modified}, {experiment}, {variation}, {granularity}, {bucket},
+                {exposures}, {estimated_exposures})
+            SELECT %s, %s, e.{exposure_experiment}, e.{exposure_variation}, %s, buckets.bucket, COUNT(*),
+                SUM(1.0 / e.{sample_rate})
+            FROM unnest(%s::timestamptz[]) AS buckets (bucket)
+            JOIN {exposure_table} e ON e.{seen_at} >= buckets.bucket AND e.{seen_at} < buckets.bucket + %s
+            GROUP BY e.{exposure_experiment}, e.{exposure_variation}, buckets.bucket
+        """.format(
+            rollup_table=_table(ExposureRollup),
+            created=_column(ExposureRollup, 'created'),
+            modified=_column(ExposureRollup, 'modified'),
+            experiment=_column(ExposureRollup, 'experiment'),
+            variation=_column(ExposureRollup, 'variation'),
+            granularity=_column(ExposureRollup, 'granularity'),
+            bucket=_column(ExposureRollup, 'bucket'),
+            exposures=_column(ExposureRollup, 'exposures'),
+            estimated_exposures=_column(ExposureRollup, 'estimated_exposures'),
+            exposure_experiment=_column(Exposure, 'experiment'),
+            exposure_variation=_column(Exposure, 'variation'),
+            exposure_table=_table(Exposure),
+            seen_at=_column(Exposure, 'seen_at'),
+            sample_rate=_column(Exposure, 'sample_rate')
+        )
+
+        # Each achievement counts once for every variation its unit was
+        # exposed to
+        goal_sql = """
+            INSERT INTO {rollup_table} ({created}, {modified}, {experiment}, {variation}, {goal}, {granularity},
+                {bucket}, {achievements}, {value})
+            SELECT %s, %s, exposed.experiment_id, exposed.variation_id, a.{achievement_goal}, %s, buckets.bucket,
+                COUNT(*), SUM(a.{achievement_value})
+            FROM unnest(%s::timestamptz[]) AS buckets (bucket)
+            JOIN {achievement_table} a
+                ON a.{achievement_seen} >= buckets.bucket AND a.{achievement_seen} < buckets.bucket + %s
+            JOIN LATERAL (
+                SELECT e.{exposure_experiment} AS experiment_id, e.{exposure_variation} AS variation_id
+                FROM {exposure_table} e
+                WHERE a.{achievement_user} IS NOT NULL AND e.{exposure_user} = a.{achievement_user}
+                UNION
+                SELECT e.{exposure_experiment}, e.{exposure_variation}
+                FROM {exposure_table} e
+                WHERE a.{achievement_user} IS NULL AND e.{exposure_user} IS NULL
+                    AND e.{exposure_identifier} = a.{achievement_identifier}
+                    AND e.{exposure_identifier_type} = a.{achievement_identifier_type}
+            ) exposed ON true
+            JOIN {goals_table} eg
+                ON eg.{eg_experiment} = exposed.experiment_id AND eg.{eg_goal} = a.{achievement_goal}
+            GROUP BY exposed.experiment_id, exposed.variation_id, a.{achievement_goal}, buckets.bucket
+        """.format(
+            rollup_table=_table(GoalRollup),
+            created=_column(GoalRollup, 'created'),
+            modified=_column(GoalRollup, 'modified'),
+            experiment=_column(GoalRollup, 'experiment'),
+            variation=_column(GoalRollup, 'variation'),
+            goal=_column(GoalRollup, 'goal'),
+            granularity=_column(GoalRollup, 'granularity'),
+            bucket=_column(GoalRollup, 'bucket'),
+            achievements=_column(GoalRollup, 'achievements'),
+            value=_column(GoalRollup, 'value'),
+            achievement_goal=_column(GoalAchievement, 'goal'),
+            achievement_value=_column(GoalAchievement, 'value'),
+            achievement_table=_table(GoalAchievement),
+            achievement_seen=_column(GoalAchievement, 'seen_at'),
+            achievement_user=_column(GoalAchievement, 'event_user'),
+            achievement_identifier=_column(GoalAchievement, 'event_user_identifier'),
+            achievement_identifier_type=_column(GoalAchievement, 'event_user_identifier_type'),
+            exposure_experiment=_column(Exposure, 'experiment'),
+            exposure_variation=_column(Exposure, 'variation'),
+            exposure_table=_table(Exposure),
+            exposure_user=_column(Exposure, 'event_user'),
+            exposure_identifier=_column(Exposure, 'event_user_identifier'),
+            exposure_identifier_type=_column(Exposure, 'event_user_identifier_type'),
+            goals_table=_table(experiment_goals),
+            eg_experiment=_column(experiment_goals, 'experiment'),
+            eg_goal=_column(experiment_goals, 'goal')
+        )
+
+        ExposureRollup.objects.filter(granularity=self.granularity, bucket__in=buckets).delete()
+        GoalRollup.objects.filter(granularity=self.granularity, bucket__in=buckets).delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute(exposure_sql, [stamp, stamp, self.granularity, buckets, interval])
+            cursor.execute(goal_sql, [stamp, stamp, self.granularity, buckets, interval])
+
+
+_rollups = OrderedDict()
+
+
+def register_rollup(rollup):
+    _rollups[rollup.name] = rollup
+    return rollup
+
+
+def get_rollups(names=None):
+    """
+    Returns the registered rollups, or those named in ``names``, in
+    registration order
+    """
+    if names is None:
+        return list(_rollups.values())
+
+    return [_rollups[name] for name in names]
+
+
+register_rollup(ExperimentResultRollup())
+register_rollup(TimeSeriesRollup('hour'))
+register_rollup(TimeSeriesRollup('day'))
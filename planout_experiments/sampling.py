@@ -0,0 +1,102 @@
+"""
+Per experiment exposure sampling. ``Experiment.exposure_sample_rate``
+keeps a deterministic, hash selected fraction of units, a unit is either
+always or never logged. ``Experiment.max_exposures_per_second`` caps the
+exposures each process writes, admitting exposures at random once the
+budget is exceeded. Every exposure row stores the probability it was
+written with in ``sample_rate``, weighting rows by its inverse estimates
+the unsampled counts.
+"""
+import random
+import threading
+import time
+
+from collections import Counter
+
+from .compiler import LONG_SCALE, planout_hash
+
+
+def unit_in_sample(salt, unit, rate):
+    """
+    Whether ``unit`` falls into the first ``rate`` of the hash space,
+    stable across processes and requests
+    """
+    if rate >= 1:
+        return True
+
+    return planout_hash('{}.exposure_sample.'.format(salt), unit) / LONG_SCALE < rate
+
+
+class ExposureRateLimiter(object):
+    """
+    Tracks exposures per experiment in one second windows and returns
+    the probability that keeps them under a per second budget, based on
+    the busier of the current and previous window
+    """
+    def __init__(self, timer=time.monotonic):
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def admit_probability(self, experiment_id, budget, count=1):
+        """
+        Records ``count`` exposures, one per row about to be written, and
+        returns the probability of admitting them
+        """
+        window = int(self._timer())
+
+        with self._lock:
+            current, seen, previous = self._windows.get(experiment_id, (window, 0, 0))
+
+            if current != window:
+                previous = seen if current == window - 1 else 0
+                current, seen = window, 0
+
+            seen += count
+            self._windows[experiment_id] = (current, seen, previous)
+
+        return min(1.0, budget / max(seen, previous))
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+
+rate_limiter = ExposureRateLimiter()
+
+
+def exposure_sample_rate(experiment, salt, unit, count=1):
+    """
+    The probability the ``count`` exposure rows of this exposure of
+    ``unit`` are written with, 0 when they are left out
+    """
+    rate = experiment.exposure_sample_rate
+
+    if rate <= 0 or not unit_in_sample(salt, unit, rate):
+        return 0
+
+    if experiment.max_exposures_per_second:
+        admit = rate_limiter.admit_probability(experiment.pk, experiment.max_exposures_per_second, count)
+
+        if admit < 1:
+            if random.random() >= admit:
+                return 0
+
+            rate *= admit
+
+    return rate
+
+
+def exposure_counts(rows):
+    """
+    Exposures and estimated exposures, weighting each by the inverse of
+    its sample rate, per variation id of (variation id, sample rate) rows
+    """
+    counts = Counter()
+    estimates = Counter()
+
+    for variation_id, sample_rate in rows:
+        counts[variation_id] += 1
+        estimates[variation_id] += 1.0 / sample_rate
+
+    return counts, estimates
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Experiment, Goal, Variation
+from .registry import experiment_registry, goal_registry, variation_ids
+
+
+@receiver(post_save, sender=Experiment)
+@receiver(post_delete, sender=Experiment)
+def invalidate_cached_experiment(sender, instance, **kwargs):
+    experiment_registry.invalidate(instance)
+
+    # Another worker thread may re-cache the old row before this
+    # transaction commits, drop it again once the change is visible
+    transaction.on_commit(lambda: experiment_registry.invalidate(instance))
+
+
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def invalidate_cached_variations(sender, instance, **kwargs):
+    variation_ids.invalidate(instance.experiment_id)
+    transaction.on_commit(lambda: variation_ids.invalidate(instance.experiment_id))
+
+
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+def invalidate_cached_goal(sender, instance, **kwargs):
+    goal_registry.invalidate(instance)
+    transaction.on_commit(lambda: goal_registry.invalidate(instance))
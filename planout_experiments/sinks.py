@@ -0,0 +1,359 @@
+import os
+import time
+import queue
+import atexit
+import threading
+
+from collections import Counter, OrderedDict
+
+from structlog import get_logger
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from .conf import get_setting
+from .copy_writer import copy_exposures, exposure_rows
+from .sampling import exposure_counts
+
+
+logger = get_logger(__name__)
+
+DEFAULT_EXPOSURE_SINK = 'planout_experiments.sinks.SynchronousExposureSink'
+
+# Queue markers understood by the BackgroundBatchWriter worker
+_FLUSH = object()
+_STOP = object()
+
+
+def write_exposures(exposures, count=True):
+    """
+    Inserts ``exposures`` and, with ``count`` and unless
+    PLANOUT_EXPERIMENTS_COUNT_EXPOSURES is disabled, adds them to their
+    variations' exposure counters in the same transaction. With
+    PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP only the first exposure of a unit
+    to a variation is stored and counted. Returns the counted and the
+    estimated (see sampling.exposure_counts) exposures per variation id.
+    """
+    from .dedup import write_deduplicated_exposures
+    from .models import Exposure, Variation
+
+    with transaction.atomic(savepoint=False):
+        if get_setting('EXPOSURE_DEDUP', False):
+            # Only first exposures of a unit count towards the variation
+            counts, estimates = exposure_counts(write_deduplicated_exposures(exposures))
+        else:
+            Exposure.objects.bulk_create(exposures)
+            counts, estimates = exposure_counts(
+                (exposure.variation_id, exposure.sample_rate) for exposure in exposures
+            )
+
+        if count and get_setting('COUNT_EXPOSURES', True):
+            Variation.increment_exposure_counts(counts, estimates)
+
+    return counts, estimates
+
+
+class ExposureSink(object):
+    """
+    Receives the unsaved Exposure instances built by
+    SingleTrial.log_exposure and is responsible for persisting them
+    """
+    def submit(self, exposures):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class SynchronousExposureSink(ExposureSink):
+    """
+    Writes exposures on the calling thread, one bulk insert per trial,
+    and updates the variation exposure counters in the same transaction.
+    With PLANOUT_EXPERIMENTS_ASYNC_EXPOSURE_COUNTS the counters are
+    updated after commit from a background thread instead.
+    """
+    def submit(self, exposures):
+        if not exposures:
+            return
+
+        if not get_setting('ASYNC_EXPOSURE_COUNTS', False):
+            write_exposures(exposures)
+            return
+
+        counts, estimates = write_exposures(exposures, count=False)
+
+        # Counter updates lock the experiment's variation rows, they're
+        # left to the background counter so they don't serialize
+        # requests for the same experiment
+        if get_setting('COUNT_EXPOSURES', True):
+            exposure_counter.submit([
+                (variation_id, count, estimates[variation_id]) for variation_id, count in counts.items()
+            ])
+
+
+class CollectingExposureSink(ExposureSink):
+    """
+    Holds exposures in memory, dropping repeats of the same (experiment,
+    variation, unit), until flush hands them to the process sink as a
+    single batch. Used to scope exposure logging to one request.
+    """
+    def __init__(self):
+        self._exposures = OrderedDict()
+
+    def __len__(self):
+        return len(self._exposures)
+
+    def submit(self, exposures):
+        for exposure in exposures:
+            key = (
+                exposure.experiment_id,
+                exposure.variation_id,
+                exposure.event_user_id,
+                exposure.event_user_identifier_type,
+                exposure.event_user_identifier
+            )
+            self._exposures.setdefault(key, exposure)
+
+    def flush(self):
+        exposures = list(self._exposures.values())
+        self._exposures.clear()
+
+        get_exposure_sink().submit(exposures)
+
+
+class BackgroundBatchWriter(object):
+    """
+    Queues items in memory and hands them to ``write_batch`` from a
+    background thread, whenever ``batch_size`` items are waiting or
+    ``flush_interval`` seconds have passed.
+
+    The queue holds at most ``max_queue_size`` items. When it is full the
+    ``block`` backpressure policy waits up to ``block_timeout`` seconds
+    for room before dropping, ``drop`` discards immediately. Items are
+    only queued once the surrounding transaction commits and the queue is
+    drained when the process exits.
+    """
+    thread_name = 'planout-batch-writer'
+    description = 'batch writer'
+    item_name = 'item'
+
+    def __init__(
+            self,
+            batch_size=500,
+            flush_interval=1.0,
+            max_queue_size=10000,
+            backpressure='block',
+            block_timeout=1.0
+    ):
+        if backpressure not in ('block', 'drop'):
+            raise ValueError("backpressure must be 'block' or 'drop', not {}".format(backpressure))
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker = None
+        self._queue = None
+
+        atexit.register(self.close)
+
+    def submit(self, items):
+        if items:
+            transaction.on_commit(lambda: self._enqueue(items))
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+    def _ensure_worker(self):
+        with self._lock:
+            # Worker threads don't survive a fork, forked processes start
+            # with an empty queue and their own thread
+            if self._pid != os.getpid() or self._worker is None or not self._worker.is_alive():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name=self.thread_name,
+                    daemon=True
+                )
+                self._worker.start()
+
+            return self._queue
+
+    def _enqueue(self, items):
+        item_queue = self._ensure_worker()
+
+        # One deadline for the whole submit, so the time a full queue can
+        # hold up a request doesn't grow with the number of items
+        deadline = time.monotonic() + self.block_timeout
+        dropped = 0
+
+        for item in items:
+            remaining = deadline - time.monotonic()
+
+            try:
+                if self.backpressure == 'block' and remaining > 0:
+                    item_queue.put(item, timeout=remaining)
+                else:
+                    item_queue.put_nowait(item)
+            except queue.Full:
+                dropped += 1
+
+        if dropped:
+            self.dropped += dropped
+            logger.warning(
+                "{} queue full, dropping {}".format(self.description, self.item_name),
+                count=dropped,
+                dropped=self.dropped
+            )
+
+    def _next_batch(self, item_queue):
+        """
+        Collects up to ``batch_size`` items, returns early when the flush
+        interval elapses or a marker is received
+        """
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            try:
+                item = item_queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return batch, None
+
+            if item is _FLUSH or item is _STOP:
+                return batch, item
+
+            batch.append(item)
+
+        return batch, None
+
+    def _write(self, batch):
+        close_old_connections()
+
+        try:
+            self.write_batch(batch)
+        except Exception:
+            logger.exception(
+                "{} failed to write batch".format(self.description),
+                batch_size=len(batch)
+            )
+
+    def _run(self):
+        item_queue = self._queue
+
+        try:
+            while True:
+                batch, marker = self._next_batch(item_queue)
+
+                if batch:
+                    self._write(batch)
+
+                for _ in range(len(batch) + (marker is not None)):
+                    item_queue.task_done()
+
+                if marker is _STOP:
+                    return
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Blocks until every item queued so far has been written
+        """
+        if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+            return
+
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+            return
+
+        self._queue.put(_STOP)
+        self._queue.join()
+        self._worker.join()
+
+
+class BufferedExposureSink(BackgroundBatchWriter, ExposureSink):
+    """
+    Writes exposures from a background thread with bulk inserts, see
+    BackgroundBatchWriter for the batching and backpressure options.
+    With ``use_copy`` batches are written with COPY instead of INSERT
+    (see copy_writer.py), which can't deduplicate exposures and can't be
+    combined with PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP.
+    """
+    thread_name = 'planout-exposure-sink'
+    description = 'exposure sink'
+    item_name = 'exposure'
+
+    def __init__(self, use_copy=False, **options):
+        if use_copy and get_setting('EXPOSURE_DEDUP', False):
+            raise ImproperlyConfigured(
+                "BufferedExposureSink can't use COPY with PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP enabled, COPY "
+                "doesn't support ON CONFLICT"
+            )
+
+        super().__init__(**options)
+        self.use_copy = use_copy
+
+    def write_batch(self, batch):
+        if self.use_copy:
+            copy_exposures(exposure_rows(batch))
+        else:
+            write_exposures(batch)
+
+
+class ExposureCounter(BackgroundBatchWriter):
+    """
+    Applies exposure counts (variation id, count, estimate) queued once their
+    exposures committed, with one counter update per batch outside any
+    request transaction, used by SynchronousExposureSink with
+    PLANOUT_EXPERIMENTS_ASYNC_EXPOSURE_COUNTS. Counts dropped from a full
+    queue are only restored by reconcile_exposure_counts.
+    """
+    thread_name = 'planout-exposure-counter'
+    description = 'exposure counter'
+    item_name = 'count'
+
+    def write_batch(self, batch):
+        from .models import Variation
+
+        counts = Counter()
+        estimates = Counter()
+
+        for variation_id, count, estimate in batch:
+            counts[variation_id] += count
+            estimates[variation_id] += estimate
+
+        Variation.increment_exposure_counts(counts, estimates)
+
+
+exposure_counter = ExposureCounter(backpressure='drop')
+
+_sinks = {}
+
+
+def get_exposure_sink():
+    """
+    Returns the sink configured by PLANOUT_EXPERIMENTS_EXPOSURE_SINK
+    (a dotted path) built with PLANOUT_EXPERIMENTS_EXPOSURE_SINK_OPTIONS,
+    one instance per process
+    """
+    path = get_setting('EXPOSURE_SINK', DEFAULT_EXPOSURE_SINK)
+
+    try:
+        return _sinks[path]
+    except KeyError:
+        sink_class = import_string(path)
+        return _sinks.setdefault(path, sink_class(**get_setting('EXPOSURE_SINK_OPTIONS', {})))
@@ -0,0 +1,298 @@
+import hashlib
+import weakref
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .bulk import trial_salt
+from .compiler import LONG_SCALE
+
+
+UnitArrayAssignments = namedtuple('UnitArrayAssignments', ['units', 'params', 'in_experiment'])
+
+RANDOM_OPS = ('uniformChoice', 'weightedChoice', 'bernoulliTrial', 'randomInteger', 'randomFloat')
+
+# Marks the position of the unit being assigned inside a unit spec
+_UNIT = object()
+
+
+class NotVectorizable(Exception):
+    pass
+
+
+def _is_operator(node):
+    return type(node) is dict and 'op' in node
+
+
+def _literal(node):
+    """
+    Resolves an argument that must not depend on the unit
+    """
+    if _is_operator(node):
+        if node['op'] == 'literal':
+            return node['value']
+
+        if node['op'] == 'array':
+            return [_literal(value) for value in node['values']]
+
+        raise NotVectorizable("argument is not a literal: {}".format(node['op']))
+
+    if type(node) is list:
+        return [_literal(value) for value in node]
+
+    return node
+
+
+def _object_array(values):
+    # Filling element by element keeps list choices from being broadcast
+    array = np.empty(len(values), dtype=object)
+
+    for index, value in enumerate(values):
+        array[index] = value
+
+    return array
+
+
+class VectorizedOp(object):
+    def __init__(self, var, node, assigned):
+        args = {name: value for name, value in node.items() if name not in ('op', 'unit')}
+        self.var = var
+        self.op = node['op']
+        self.args = {name: _literal(value) for name, value in args.items()}
+        self.unit_spec = self._unit_spec(node['unit'], assigned)
+
+        if 'full_salt' in self.args:
+            full_salt = self.args['full_salt']
+        else:
+            full_salt = self.args.get('salt', var)
+
+        if not isinstance(full_salt, str):
+            raise NotVectorizable("salts must be literal strings")
+
+        self._validate()
+
+    def _validate(self):
+        """
+        Argument combinations the scalar operators reject or special
+        case are left to the scalar path
+        """
+        args = self.args
+
+        if self.op in ('uniformChoice', 'weightedChoice') and not args['choices']:
+            raise NotVectorizable("empty choices")
+
+        if self.op == 'weightedChoice':
+            weights = args['weights']
+
+            if len(weights) != len(args['choices']) or any(weight < 0 for weight in weights):
+                raise NotVectorizable("weights must be non negative and match the choices")
+
+        if self.op == 'bernoulliTrial' and not (isinstance(args['p'], (int, float)) and 0 <= args['p'] <= 1):
+            raise NotVectorizable("p must be between 0 and 1")
+
+        if self.op == 'randomInteger' and not (
+                isinstance(args['min'], int) and isinstance(args['max'], int) and args['min'] <= args['max']
+        ):
+            raise NotVectorizable("min and max must be ordered ints")
+
+        if self.op == 'randomFloat' and not all(isinstance(args[name], (int, float)) for name in ('min', 'max')):
+            raise NotVectorizable("min and max must be numbers")
+
+    @staticmethod
+    def _unit_spec(unit, assigned):
+        parts = unit if type(unit) is list else [unit]
+        spec = []
+
+        for part in parts:
+            if _is_operator(part) and part['op'] == 'get':
+                if part['var'] in assigned:
+                    raise NotVectorizable("unit depends on script variable {}".format(part['var']))
+
+                spec.append(('get', part['var']))
+            else:
+                spec.append(('literal', _literal(part)))
+
+        return spec
+
+    def _full_salt(self, experiment_salt):
+        if 'full_salt' in self.args:
+            return self.args['full_salt'] + '.'
+
+        return '%s.%s.' % (experiment_salt, self.args.get('salt', self.var))
+
+    def hashes(self, experiment_salt, unit_strs, inputs, unit_input):
+        parts = []
+
+        for kind, value in self.unit_spec:
+            if kind == 'get' and value == unit_input:
+                parts.append(_UNIT)
+            elif kind == 'get':
+                parts.append(str(inputs.get(value)))
+            else:
+                parts.append(str(value))
+
+        full_salt = self._full_salt(experiment_salt)
+
+        if parts == [_UNIT]:
+            hash_strs = (full_salt + unit_str for unit_str in unit_strs)
+        else:
+            hash_strs = (
+                full_salt + '.'.join(unit_str if part is _UNIT else part for part in parts)
+                for unit_str in unit_strs
+            )
+
+        return np.fromiter(
+            (int(hashlib.sha1(hash_str.encode('ascii')).hexdigest()[:15], 16) for hash_str in hash_strs),
+            dtype=np.uint64,
+            count=len(unit_strs)
+        )
+
+    def evaluate(self, experiment_salt, unit_strs, inputs, unit_input):
+        hashes = self.hashes(experiment_salt, unit_strs, inputs, unit_input)
+        args = self.args
+
+        if self.op == 'uniformChoice':
+            choices = args['choices']
+            return _object_array(choices)[(hashes % np.uint64(len(choices))).astype(np.intp)]
+
+        if self.op == 'bernoulliTrial':
+            return (hashes / LONG_SCALE <= args['p']).astype(np.int64)
+
+        if self.op == 'randomInteger':
+            span = np.uint64(args['max'] - args['min'] + 1)
+            return args['min'] + (hashes % span).astype(np.int64)
+
+        if self.op == 'randomFloat':
+            min_val, max_val = float(args['min']), float(args['max'])
+            return min_val + (max_val - min_val) * (hashes / LONG_SCALE)
+
+        # weightedChoice, accumulate exactly like the scalar operator
+        cum_weights = []
+        cum_sum = 0.0
+
+        for weight in args['weights']:
+            cum_sum += weight
+            cum_weights.append(cum_sum)
+
+        stop_values = 0.0 + (cum_sum - 0.0) * (hashes / LONG_SCALE)
+        indexes = np.searchsorted(np.array(cum_weights), stop_values, side='left')
+        # Rounding can leave a stop value past the last bucket, the scalar
+        # operator returns None in that case
+        choices = _object_array(list(args['choices']) + [None])
+        return choices[indexes]
+
+
+class VectorizedScript(object):
+    """
+    Evaluates scripts made of ``set`` operations with literal values or
+    the common random operators over arrays of units. The values match
+    the scalar planout operators bit for bit.
+    """
+    def __init__(self, script):
+        if not _is_operator(script) or script['op'] != 'seq':
+            raise NotVectorizable("script must be a seq")
+
+        self.steps = []
+        assigned = set()
+
+        for node in script['seq']:
+            if not _is_operator(node) or node['op'] != 'set':
+                raise NotVectorizable("only set operations are vectorized")
+
+            var, value = node['var'], node['value']
+
+            if not isinstance(var, str) or var == 'experiment_salt':
+                raise NotVectorizable("unsupported variable {}".format(var))
+
+            if _is_operator(value) and value['op'] in RANDOM_OPS:
+                self.steps.append(VectorizedOp(var, value, assigned))
+            else:
+                self.steps.append((var, _literal(value)))
+
+            assigned.add(var)
+
+    def evaluate(self, experiment_salt, units, inputs, unit_input):
+        unit_strs = [str(unit) for unit in units]
+        params = {}
+
+        for step in self.steps:
+            if isinstance(step, VectorizedOp):
+                params[step.var] = step.evaluate(experiment_salt, unit_strs, inputs, unit_input)
+            else:
+                var, value = step
+                params[var] = _object_array([value] * len(unit_strs))
+
+        return params
+
+
+_vectorized_scripts = weakref.WeakKeyDictionary()
+
+
+def get_vectorized_script(compiled_script):
+    """
+    Returns the VectorizedScript for a compiled script or None when the
+    script can't be vectorized, memoized for the compiled script's life
+    """
+    try:
+        return _vectorized_scripts[compiled_script]
+    except KeyError:
+        pass
+
+    try:
+        vectorized = VectorizedScript(compiled_script.script)
+    except (NotVectorizable, KeyError, TypeError):
+        vectorized = None
+
+    _vectorized_scripts[compiled_script] = vectorized
+    return vectorized
+
+
+def _evaluate_scalar(compiled_script, salt, units, inputs, unit_input):
+    rows = []
+    in_experiment = []
+
+    for unit in units:
+        unit_inputs = dict(inputs)
+        unit_inputs[unit_input] = unit
+        params = {}
+        in_experiment.append(compiled_script.execute(params, salt, unit_inputs))
+        rows.append(params)
+
+    names = []
+
+    for params in rows:
+        names.extend(name for name in params if name not in names)
+
+    params = {name: _object_array([row.get(name) for row in rows]) for name in names}
+    return params, np.array(in_experiment, dtype=bool)
+
+
+def assign_unit_array(experiment, units, inputs=None, unit_input='user_id'):
+    """
+    Assigns a whole array of units at once, returning parameters as
+    columns (one numpy array per variable). Scripts the vectorized
+    engine doesn't support are evaluated unit by unit with the compiled
+    script instead. Nothing is exposure logged.
+    """
+    if np is None:
+        raise ImproperlyConfigured("assign_unit_array requires numpy to be installed")
+
+    units = list(units)
+    inputs = dict(inputs or {})
+    compiled_script = experiment.get_compiled_script()
+    salt = trial_salt(experiment)
+    vectorized = get_vectorized_script(compiled_script)
+
+    if vectorized is None:
+        params, in_experiment = _evaluate_scalar(compiled_script, salt, units, inputs, unit_input)
+    else:
+        params = vectorized.evaluate(salt, units, inputs, unit_input)
+        in_experiment = np.ones(len(units), dtype=bool)
+
+    return UnitArrayAssignments(units, params, in_experiment)
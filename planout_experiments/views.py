@@ -1,10 +1,34 @@
 from django.views.generic.detail import DetailView
 from django.contrib.auth.mixins import PermissionRequiredMixin
 
-from .models import Experiment
+from .models import Experiment, ROLLUP_GRANULARITIES
 
 
 class ExperimentBreakdownView(PermissionRequiredMixin, DetailView):
     permission_required = ('experiments.can_open', 'experiments.can_edit')
     model = Experiment
     template = "experiments/experiment_breakdown.html"
+
+    def get_granularity(self):
+        granularity = self.request.GET.get('granularity')
+
+        if granularity not in dict(ROLLUP_GRANULARITIES):
+            return 'day'
+
+        return granularity
+
+    def get_context_data(self, **kwargs):
+        """
+        Adds the precomputed exposure and goal series, read from the
+        rollup tables rather than the event tables
+        """
+        context = super().get_context_data(**kwargs)
+        granularity = self.get_granularity()
+
+        context['granularity'] = granularity
+        context['exposure_series'] = self.object.get_exposure_series(granularity)
+        context['goal_series'] = [
+            (goal, self.object.get_goal_series(goal, granularity)) for goal in self.object.goals.all()
+        ]
+
+        return context
@@ -57,6 +57,9 @@ setup(
     ],
     include_package_data=True,
     install_requires=["django-model-utils>=2.0",],
+    extras_require={
+        'vectorized': ['numpy'],
+    },
     license="MIT",
     zip_safe=False,
     keywords='django-planout-experiments',
@@ -0,0 +1,138 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+
+from planout_experiments.assignment_cache import load_assignments, trial_keys
+from planout_experiments.middleware import AssignmentContext
+from planout_experiments.models import DJANGO_USER_DB_ID, Experiment, Exposure, SingleTrial
+from planout_experiments.sinks import exposure_counter
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'assignments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'assignments'},
+    },
+    PLANOUT_EXPERIMENTS_ASSIGNMENT_CACHE='assignments'
+)
+class AssignmentCacheTests(TransactionTestCase):
+    def setUp(self):
+        caches['assignments'].clear()
+        self.addCleanup(exposure_counter.close)
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Cached Assignments', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def trial(self, experiment=None, **inputs):
+        # A fresh instance stands in for another worker process
+        experiment = experiment or Experiment.objects.get(pk=self.experiment.pk)
+        return SingleTrial(
+            db_experiment=experiment,
+            **dict({'user_id': self.user.pk, 'user_identifier_type': DJANGO_USER_DB_ID}, **inputs)
+        )
+
+    def test_assignment_is_shared(self):
+        params = self.trial().get_params()
+
+        with mock.patch('planout_experiments.compiler.CompiledScript.execute') as execute:
+            self.assertEqual(self.trial().get_params(), params)
+
+        self.assertFalse(execute.called)
+
+    def test_exposure_is_logged_once_across_trials(self):
+        first = self.trial()
+        first.get_params()
+        exposures = Exposure.objects.count()
+        self.assertGreater(exposures, 0)
+
+        second = self.trial()
+        second.get_params()
+
+        self.assertTrue(second.exposure_logged)
+        self.assertEqual(Exposure.objects.count(), exposures)
+
+    def test_single_round_trip(self):
+        self.trial().get_params()
+        trials = [self.trial(), self.trial(user_id=self.user.pk + 1)]
+
+        with mock.patch.object(caches['assignments'], 'get_many', wraps=caches['assignments'].get_many) as get_many:
+            missing = load_assignments(trials)
+
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(missing, [trials[1]])
+
+    def test_request_context_batches_round_trips(self):
+        other = Experiment.objects.create(name='Other Cached', planout_json=EXAMPLE_EXPERIMENT_JSON)
+        cache = caches['assignments']
+        context = AssignmentContext(user=self.user)
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            context.prefetch({self.experiment.name: {}, other.name: {}})
+            context.get_trial(self.experiment.name).get_params()
+            context.get_trial(other.name).get_params()
+            self.assertEqual(set_many.call_count, 0)
+
+            context.flush()
+
+        # One read for both trials, one write of their assignments and
+        # one of their exposure markers
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(set_many.call_count, 2)
+
+        trials = [self.trial(), self.trial(other)]
+        self.assertEqual(load_assignments(trials), [])
+        self.assertTrue(all(trial.exposure_logged for trial in trials))
+
+    def test_bulk_assignment_batches_round_trips(self):
+        cache = caches['assignments']
+        units = ['device_{}'.format(i) for i in range(10)]
+
+        def assign():
+            return list(self.experiment.assign_units(units, 'device_id', log_exposures=True, batch_size=4))
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            first = assign()
+
+        self.assertEqual(get_many.call_count, 3)
+        exposures = Exposure.objects.count()
+
+        # Assignments and exposure markers are shared with later runs and
+        # single trials
+        with mock.patch('planout_experiments.compiler.CompiledScript.execute') as execute:
+            second = assign()
+
+        self.assertFalse(execute.called)
+        self.assertEqual(second, first)
+        self.assertEqual(Exposure.objects.count(), exposures)
+
+        trial = self.trial(user_id=units[0], user_identifier_type='device_id')
+        self.assertEqual(load_assignments([trial]), [])
+        self.assertTrue(trial.exposure_logged)
+
+    def test_editing_script_changes_version(self):
+        trial = self.trial()
+        trial.get_params()
+        before = trial_keys(trial)
+
+        experiment = Experiment.objects.get(pk=self.experiment.pk)
+        experiment.add_planout_variable('topping', 'sprinkles')
+        after = self.trial(experiment)
+
+        self.assertNotEqual(trial_keys(after), before)
+        self.assertEqual(after.get('topping'), 'sprinkles')
+
+    def test_overridden_trials_are_not_cached(self):
+        trial = self.trial()
+        trial.set_overrides({'button_text': 'purple'})
+
+        self.assertIsNone(trial_keys(trial))
+        self.assertEqual(trial.get('button_text'), 'purple')
+
+    @override_settings(PLANOUT_EXPERIMENTS_ASSIGNMENT_CACHE=None)
+    def test_disabled_by_default(self):
+        self.trial().get_params()
+        self.assertIsNone(caches['assignments'].get(trial_keys(self.trial())[0]))
@@ -0,0 +1,107 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from planout_experiments.attribution import goal_attribution
+from planout_experiments.models import DJANGO_USER_DB_ID, Experiment, Exposure, Goal, GoalAchievement, Variation
+
+
+class GoalAttributionTests(TestCase):
+    def setUp(self):
+        self.experiment = Experiment.objects.create(name='Attribution Experiment')
+        self.control = Variation.objects.create(experiment=self.experiment, key='color', value='red')
+        self.treatment = Variation.objects.create(experiment=self.experiment, key='color', value='blue')
+        self.unexposed = Variation.objects.create(experiment=self.experiment, key='color', value='green')
+        self.goal = Goal.objects.create(name='purchase', description='User bought something')
+        self.other_goal = Goal.objects.create(name='share', description='User shared')
+
+        self.users = [User.objects.create_user(username='user_{}'.format(i)) for i in range(3)]
+
+    def expose(self, variation, user=None, identifier=None):
+        if user is not None:
+            Exposure.objects.create(
+                experiment=self.experiment,
+                variation=variation,
+                event_user=user,
+                event_user_identifier_type=DJANGO_USER_DB_ID
+            )
+        else:
+            Exposure.objects.create(
+                experiment=self.experiment,
+                variation=variation,
+                event_user_identifier=identifier,
+                event_user_identifier_type='device_id'
+            )
+
+    def achieve(self, value=1.0, user=None, identifier=None, goal=None):
+        GoalAchievement.objects.create(
+            goal=goal or self.goal,
+            value=value,
+            event_user=user,
+            event_user_identifier=identifier,
+            event_user_identifier_type=None if identifier is None else 'device_id'
+        )
+
+    def test_counts_each_unit_once(self):
+        first, second, third = self.users
+
+        # Repeat exposures and achievements don't inflate the counts
+        self.expose(self.control, user=first)
+        self.expose(self.control, user=first)
+        self.expose(self.control, user=second)
+        self.expose(self.treatment, user=third)
+        self.achieve(2.0, user=first)
+        self.achieve(3.0, user=first)
+        self.achieve(user=third, goal=self.other_goal)
+
+        with self.assertNumQueries(1):
+            stats = goal_attribution(self.experiment.pk, self.goal.pk)
+
+        self.assertEqual(set(stats), {self.control.pk, self.treatment.pk})
+        self.assertEqual(stats[self.control.pk].exposed_units, 2)
+        self.assertEqual(stats[self.control.pk].achieving_units, 1)
+        self.assertEqual(stats[self.control.pk].success_value, 5.0)
+        self.assertEqual(stats[self.treatment.pk].exposed_units, 1)
+        self.assertEqual(stats[self.treatment.pk].achieving_units, 0)
+        self.assertEqual(stats[self.treatment.pk].success_value, 0)
+
+    def test_fuzzy_identifiers(self):
+        self.expose(self.treatment, identifier='device-1')
+        self.expose(self.treatment, identifier='device-2')
+        self.achieve(4.0, identifier='device-1')
+
+        # The same identifier string as a django user id is a different unit
+        self.achieve(user=self.users[0])
+        self.expose(self.control, identifier=str(self.users[0].id))
+
+        stats = goal_attribution(self.experiment.pk, self.goal.pk)
+
+        self.assertEqual(stats[self.treatment.pk].exposed_units, 2)
+        self.assertEqual(stats[self.treatment.pk].achieving_units, 1)
+        self.assertEqual(stats[self.treatment.pk].success_value, 4.0)
+        self.assertEqual(stats[self.control.pk].achieving_units, 0)
+
+        self.assertEqual(
+            list(self.treatment.goal_achievements(self.goal).values_list('event_user_identifier', flat=True)),
+            ['device-1']
+        )
+
+    def test_limit_to_variations(self):
+        self.expose(self.control, user=self.users[0])
+        self.expose(self.treatment, user=self.users[1])
+
+        stats = goal_attribution(self.experiment.pk, self.goal.pk, [self.treatment.pk])
+
+        self.assertEqual(set(stats), {self.treatment.pk})
+        self.assertEqual(goal_attribution(self.experiment.pk, self.goal.pk, []), {})
+
+    def test_experiment_goal_attribution(self):
+        self.expose(self.control, user=self.users[0])
+        self.expose(self.control, user=self.users[1])
+        self.achieve(user=self.users[0])
+
+        stats = {variation.pk: stats for variation, stats in self.experiment.get_goal_attribution(self.goal)}
+
+        self.assertEqual(set(stats), {self.control.pk, self.treatment.pk, self.unexposed.pk})
+        self.assertEqual(stats[self.control.pk].exposed_units, 2)
+        self.assertEqual(stats[self.control.pk].achieving_units, 1)
+        self.assertEqual(stats[self.unexposed.pk].exposed_units, 0)
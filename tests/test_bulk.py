@@ -0,0 +1,67 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from planout_experiments.models import DJANGO_USER_DB_ID, Experiment, Exposure, SingleTrial
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON, WEIGHTED_CHOICE_JSON
+
+
+class AssignUnitsTests(TestCase):
+    def setUp(self):
+        self.experiment = Experiment.objects.create(name='Bulk Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def test_matches_single_trials(self):
+        for assignment in self.experiment.assign_units(range(200)):
+            trial = SingleTrial(db_experiment=self.experiment, user_id=assignment.unit)
+            trial.set_auto_exposure_logging(False)
+
+            self.assertEqual(assignment.params, trial.get_params())
+            self.assertTrue(assignment.in_experiment)
+
+    def test_no_exposures_by_default(self):
+        list(self.experiment.assign_units(range(10)))
+        self.assertEqual(Exposure.objects.count(), 0)
+
+    def test_exposures_are_written_in_batches(self):
+        users = [User.objects.create_user(username='user_{}'.format(i)) for i in range(10)]
+        user_ids = [user.id for user in users]
+        experiment = Experiment.objects.create(name='Bulk Weighted', planout_json=WEIGHTED_CHOICE_JSON)
+
+        # One query warming the variation cache, at most one insert and
+        # history row per variation and one bulk insert and counter update
+        # per four exposures
+        with self.assertNumQueries(1 + 2 * 2 + 3 * 2):
+            assignments = list(experiment.assign_units(user_ids, log_exposures=True, batch_size=4))
+
+        self.assertEqual(Exposure.objects.count(), 10)
+        self.assertEqual(
+            set(Exposure.objects.values_list('event_user_id', 'variation__value')),
+            set((a.unit, a.params['user_is_participating']) for a in assignments)
+        )
+        self.assertEqual(
+            set(Exposure.objects.values_list('event_user_identifier_type', flat=True)),
+            {DJANGO_USER_DB_ID}
+        )
+
+    def test_fuzzy_identifiers(self):
+        assignments = self.experiment.assign_units(['a', 'b'], user_identifier_type='device_id', log_exposures=True)
+
+        self.assertEqual([a.unit for a in assignments], ['a', 'b'])
+        self.assertEqual(
+            set(Exposure.objects.values_list('event_user_identifier', flat=True)),
+            {'a', 'b'}
+        )
+
+    def test_closing_early_writes_pending_exposures(self):
+        assignments = self.experiment.assign_units(
+            ['a', 'b', 'c'],
+            user_identifier_type='device_id',
+            log_exposures=True
+        )
+        next(assignments)
+        assignments.close()
+
+        self.assertEqual(
+            set(Exposure.objects.values_list('event_user_identifier', flat=True)),
+            {'a'}
+        )
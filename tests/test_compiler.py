@@ -0,0 +1,194 @@
+import json
+
+from django.test import TestCase
+
+from planout.assignment import Assignment
+from planout.interpreter import Interpreter
+from planout.ops.utils import Operators
+
+from planout_experiments.compiler import CompiledScript, compiled_scripts
+from planout_experiments.models import Experiment, SingleTrial
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON, WEIGHTED_CHOICE_JSON
+
+
+def unit(var='user_id'):
+    return {"op": "get", "var": var}
+
+
+OPERATOR_SCRIPT = {
+    "op": "seq",
+    "seq": [
+        {"op": "set", "var": "integer", "value": {
+            "op": "randomInteger", "min": 0, "max": 99, "unit": unit()
+        }},
+        {"op": "set", "var": "float", "value": {
+            "op": "randomFloat", "min": 1, "max": 5, "unit": unit()
+        }},
+        {"op": "set", "var": "sampled", "value": {
+            "op": "sample", "choices": [1, 2, 3, 4, 5], "draws": 2, "unit": unit()
+        }},
+        {"op": "set", "var": "filtered", "value": {
+            "op": "bernoulliFilter", "p": 0.5, "choices": ["a", "b", "c"], "unit": unit()
+        }},
+        {"op": "set", "var": "multi_unit", "value": {
+            "op": "uniformChoice", "choices": ["x", "y", "z"], "unit": [unit(), unit('country')]
+        }},
+        {"op": "set", "var": "salted", "value": {
+            "op": "bernoulliTrial", "p": 0.3, "salt": "shared_salt", "unit": unit()
+        }},
+        {"op": "set", "var": "full_salted", "value": {
+            "op": "randomInteger", "min": 1, "max": 6, "full_salt": "dice", "unit": unit()
+        }},
+        {"op": "set", "var": "config", "value": {
+            "op": "map", "size": {"op": "get", "var": "integer"}, "color": "red"
+        }},
+        {"op": "set", "var": "size", "value": {
+            "op": "index", "base": {"op": "get", "var": "config"}, "index": "size"
+        }},
+        {"op": "set", "var": "is_big", "value": {"op": ">", "left": {"op": "get", "var": "size"}, "right": 50}},
+        {"op": "set", "var": "label", "value": {"op": "cond", "cond": [
+            {"if": {"op": "and", "values": [{"op": "get", "var": "is_big"}, {"op": "get", "var": "salted"}]},
+             "then": "big and salted"},
+            {"if": {"op": "or", "values": [{"op": "get", "var": "is_big"}, {"op": "get", "var": "salted"}]},
+             "then": "one of them"},
+            {"if": True, "then": {"op": "coalesce", "values": [{"op": "get", "var": "missing"}, "neither"]}},
+        ]}},
+        {"op": "set", "var": "total", "value": {"op": "sum", "values": [
+            {"op": "get", "var": "integer"},
+            {"op": "length", "value": {"op": "get", "var": "sampled"}}
+        ]}},
+        {"op": "cond", "cond": [
+            {"if": {"op": "equals", "left": {"op": "get", "var": "full_salted"}, "right": 6},
+             "then": {"op": "return", "value": False}}
+        ]},
+        {"op": "set", "var": "after_return", "value": {"op": "literal", "value": [1, 2]}},
+    ]
+}
+
+
+def interpret(script, salt, inputs):
+    params = Assignment(salt)
+    interpreter = Interpreter(json.loads(json.dumps(script)), salt, inputs, params)
+    interpreter.get_params()
+    return dict(params), interpreter.in_experiment
+
+
+class CompiledScriptParityTests(TestCase):
+    def assertParity(self, script, salt='parity_salt'):
+        compiled = CompiledScript(script)
+        self.assertFalse(compiled.interpreted)
+
+        for user_id in range(300):
+            inputs = {'user_id': user_id, 'country': 'US' if user_id % 2 else 'CA'}
+            params = Assignment(salt)
+            in_experiment = compiled.execute(params, salt, inputs)
+
+            self.assertEqual((dict(params), in_experiment), interpret(script, salt, inputs))
+
+    def test_example_experiment(self):
+        self.assertParity(json.loads(EXAMPLE_EXPERIMENT_JSON))
+
+    def test_weighted_choice(self):
+        self.assertParity(json.loads(WEIGHTED_CHOICE_JSON))
+
+    def test_all_operators(self):
+        self.assertParity(OPERATOR_SCRIPT)
+
+    def test_experiment_salt_override(self):
+        script = {"op": "seq", "seq": [
+            {"op": "set", "var": "experiment_salt", "value": "new_salt"},
+            {"op": "set", "var": "choice", "value": {"op": "uniformChoice", "choices": [1, 2, 3], "unit": unit()}},
+        ]}
+        self.assertParity(script)
+
+    def test_overrides_are_respected(self):
+        script = json.loads(WEIGHTED_CHOICE_JSON)
+        params = Assignment('salt', overrides={'user_is_participating': 'maybe'})
+        CompiledScript(script).execute(params, 'salt', {'user_id': 1})
+        self.assertEqual(params['user_is_participating'], 'maybe')
+
+    def test_literal_values_are_not_shared(self):
+        script = {"op": "seq", "seq": [{"op": "set", "var": "items", "value": [1, 2]}]}
+        compiled = CompiledScript(script)
+
+        first = {}
+        compiled.execute(first, 'salt', {})
+        first['items'].append(3)
+
+        second = {}
+        compiled.execute(second, 'salt', {})
+        self.assertEqual(second['items'], [1, 2])
+
+    def test_unknown_operator_falls_back_to_interpreter(self):
+        class Shout(object):
+            def __init__(self, **args):
+                self.args = args
+
+            def execute(self, mapper):
+                return mapper.evaluate(self.args['value']).upper()
+
+        Operators.registerOperators({'shout': Shout})
+
+        try:
+            script = {"op": "seq", "seq": [{"op": "set", "var": "greeting", "value": {"op": "shout", "value": "hi"}}]}
+            compiled = CompiledScript(script)
+            self.assertTrue(compiled.interpreted)
+
+            params = {}
+            self.assertTrue(compiled.execute(params, 'salt', {}))
+            self.assertEqual(params, {'greeting': 'HI'})
+        finally:
+            del Operators.operators['shout']
+
+
+class CompiledScriptCacheTests(TestCase):
+    def setUp(self):
+        compiled_scripts.clear()
+        self.experiment = Experiment.objects.create(name='compiled', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def test_trials_share_compiled_script(self):
+        first = SingleTrial(db_experiment=self.experiment, user_id=1)
+        first.get_params()
+
+        other_instance = Experiment.objects.get(pk=self.experiment.pk)
+        second = SingleTrial(db_experiment=other_instance, user_id=2)
+        second.get_params()
+
+        self.assertIs(first.compiled_script, second.compiled_script)
+        self.assertEqual(len(compiled_scripts), 1)
+
+    def test_edited_script_is_recompiled(self):
+        before = self.experiment.get_compiled_script()
+        self.experiment.add_planout_variable('the_lime', 'The Coconut')
+        after = self.experiment.get_compiled_script()
+
+        self.assertIsNot(before, after)
+        self.assertEqual(self.experiment.get_planout_params()['the_lime'], 'The Coconut')
+
+
+class ConstantScriptTests(TestCase):
+    def test_set_only_scripts_are_constant(self):
+        script = {"op": "seq", "seq": [
+            {"op": "set", "var": "strategy", "value": "vanilla"},
+            {"op": "set", "var": "limit", "value": {"op": "literal", "value": 3}},
+        ]}
+
+        params = CompiledScript(script).constant_params
+        self.assertEqual(dict(params), {'strategy': 'vanilla', 'limit': 3})
+
+        with self.assertRaises(TypeError):
+            params['strategy'] = 'chocolate'
+
+    def test_empty_script_is_constant(self):
+        self.assertEqual(dict(CompiledScript({"op": "seq", "seq": []}).constant_params), {})
+
+    def test_random_and_mutable_scripts_are_not_constant(self):
+        for script in (
+            json.loads(EXAMPLE_EXPERIMENT_JSON),
+            OPERATOR_SCRIPT,
+            {"op": "seq", "seq": [{"op": "set", "var": "colors", "value": ["red", "blue"]}]},
+            {"op": "seq", "seq": [{"op": "set", "var": "user", "value": unit()}]},
+            {"op": "seq", "seq": [{"op": "return", "value": False}]},
+        ):
+            self.assertIsNone(CompiledScript(script).constant_params)
@@ -0,0 +1,128 @@
+import json
+import tempfile
+
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+
+from planout_experiments.copy_writer import CopyWriter, copy_exposures, encode_value, exposure_rows
+from planout_experiments.models import Experiment, ExperimentLog, Exposure, Goal, GoalAchievement, Variation
+from planout_experiments.sinks import BufferedExposureSink
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+
+
+class EncodeValueTests(TestCase):
+    def test_values(self):
+        self.assertEqual(encode_value(None), '\\N')
+        self.assertEqual(encode_value(True), 't')
+        self.assertEqual(encode_value(1.5), '1.5')
+        self.assertEqual(encode_value({'a': 'b'}), '{"a": "b"}')
+        self.assertEqual(encode_value('tab\there\nline\\slash'), 'tab\\there\\nline\\\\slash')
+
+
+class CopyWriterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Copy Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+        self.variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+
+    def test_copy_exposures(self):
+        seen_at = now()
+        rows = [
+            {'experiment': self.experiment.pk, 'variation_id': self.variation.pk, 'event_user_id': self.user.pk,
+             'event_user_identifier_type': 'django_user_db_id', 'seen_at': seen_at},
+            {'experiment_id': self.experiment.pk, 'variation_id': self.variation.pk,
+             'event_user_identifier': 'tab\tdevice', 'event_user_identifier_type': 'device_id',
+             'data_meta': {'source': 'replay'}},
+        ]
+
+        self.assertEqual(copy_exposures(rows), 2)
+
+        by_user = Exposure.objects.get(event_user=self.user)
+        self.assertEqual(by_user.seen_at, seen_at)
+        self.assertEqual(by_user.data_meta, {})
+        self.assertEqual(by_user.hits, 1)
+
+        device = Exposure.objects.get(event_user_identifier_type='device_id')
+        self.assertEqual(device.event_user_identifier, 'tab\tdevice')
+        self.assertEqual(device.data_meta, {'source': 'replay'})
+        self.assertIsNotNone(device.seen_at)
+
+        self.variation.refresh_from_db()
+        self.assertEqual(self.variation.exposure_count, 2)
+
+    def test_copy_achievements_and_logs(self):
+        goal = Goal.objects.create(name='purchase')
+
+        CopyWriter(GoalAchievement).write([{'goal': goal.pk, 'event_user': self.user.pk, 'value': 3.0}])
+        CopyWriter(ExperimentLog).write([{'experiment_id': self.experiment.pk, 'data': {'event': 'click'}}])
+
+        self.assertEqual(GoalAchievement.objects.get().value, 3.0)
+        self.assertEqual(ExperimentLog.objects.get().data, {'event': 'click'})
+
+    def test_scalar_json(self):
+        CopyWriter(ExperimentLog).write([
+            {'experiment_id': self.experiment.pk, 'data': 'plain\tstring'},
+            {'experiment_id': self.experiment.pk, 'data': 3},
+        ])
+
+        self.assertEqual(
+            sorted(ExperimentLog.objects.values_list('data', flat=True), key=str),
+            [3, 'plain\tstring']
+        )
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            CopyWriter(ExperimentLog).write([{'experiment_id': self.experiment.pk, 'colour': 'blue'}])
+
+    def test_exposure_rows(self):
+        exposure = Exposure(experiment=self.experiment, variation=self.variation, event_user=self.user)
+        copy_exposures(exposure_rows([exposure]))
+
+        self.assertEqual(Exposure.objects.get().event_user, self.user)
+
+    def test_copy_events_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as rows:
+            for value in ('a', 'b', 'c'):
+                rows.write(json.dumps({'experiment_id': self.experiment.pk, 'data': {'value': value}}) + '\n')
+
+            rows.flush()
+            out = StringIO()
+            call_command('copy_events', 'experimentlog', rows.name, batch_size=2, stdout=out)
+
+        self.assertIn('Copied 3', out.getvalue())
+        self.assertEqual(ExperimentLog.objects.count(), 3)
+
+    def test_copy_events_command_rejects_invalid_json(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as rows:
+            rows.write('{not json\n')
+            rows.flush()
+
+            with self.assertRaises(CommandError):
+                call_command('copy_events', 'experimentlog', rows.name, stdout=StringIO())
+
+
+class CopyExposureSinkTests(TransactionTestCase):
+    def test_buffered_sink_can_copy(self):
+        user = User.objects.create_user(username='test_user')
+        experiment = Experiment.objects.create(name='Copy Sink', planout_json=EXAMPLE_EXPERIMENT_JSON)
+        variation = Variation.objects.create(experiment=experiment, key='button_text', value='blue')
+        sink = BufferedExposureSink(batch_size=10, flush_interval=60, use_copy=True)
+        self.addCleanup(sink.close)
+
+        sink.submit([Exposure(experiment=experiment, variation=variation, event_user=user) for _ in range(3)])
+        sink.flush()
+
+        self.assertEqual(Exposure.objects.count(), 3)
+        variation.refresh_from_db()
+        self.assertEqual(variation.exposure_count, 3)
+
+    @override_settings(PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP=True)
+    def test_copy_refuses_dedup(self):
+        with self.assertRaises(ImproperlyConfigured):
+            BufferedExposureSink(use_copy=True)
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+
+from planout_experiments.dedup import dedup_cache, exposure_dedup_key, write_deduplicated_exposures
+from planout_experiments.models import Experiment, Exposure, Variation
+from planout_experiments.sinks import write_exposures
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+
+
+class DedupTestMixin(object):
+    def setUp(self):
+        dedup_cache.clear()
+        self.addCleanup(dedup_cache.clear)
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Dedup Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+        self.variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+
+    def exposure(self, seen_at=None, **unit):
+        unit = unit or {'event_user': self.user}
+        return Exposure(experiment=self.experiment, variation=self.variation, seen_at=seen_at or now(), **unit)
+
+
+@override_settings(PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP=True)
+class ExposureDedupTests(DedupTestMixin, TestCase):
+    def test_dedup_key(self):
+        by_user = self.exposure()
+        by_id = self.exposure(event_user_identifier_type='django_user_db_id', event_user_identifier=str(self.user.pk))
+        by_device = self.exposure(event_user_identifier_type='device_id', event_user_identifier=str(self.user.pk))
+
+        # Same unit key as goal attribution uses
+        self.assertEqual(len(exposure_dedup_key(by_user)), 40)
+        self.assertEqual(exposure_dedup_key(by_user), exposure_dedup_key(by_id))
+        self.assertNotEqual(exposure_dedup_key(by_user), exposure_dedup_key(by_device))
+        self.assertIsNone(exposure_dedup_key(Exposure(experiment=self.experiment, variation=self.variation)))
+
+    def test_first_exposure_is_kept(self):
+        first = now() - timedelta(hours=1)
+        write_exposures([self.exposure(seen_at=first), self.exposure()])
+        write_exposures([self.exposure()])
+
+        exposure = Exposure.objects.get()
+        self.assertEqual(exposure.seen_at, first)
+        self.assertEqual(exposure.hits, 2)
+
+        self.variation.refresh_from_db()
+        self.assertEqual(self.variation.exposure_count, 1)
+
+    def test_units_are_separate(self):
+        write_exposures([
+            self.exposure(),
+            self.exposure(event_user_identifier_type='device_id', event_user_identifier='abc'),
+            self.exposure(event_user_identifier_type='device_id', event_user_identifier='abc'),
+            self.exposure(event_user_identifier_type='device_id', event_user_identifier='xyz'),
+        ])
+
+        self.assertEqual(Exposure.objects.count(), 3)
+        self.variation.refresh_from_db()
+        self.assertEqual(self.variation.exposure_count, 3)
+
+    def test_exposures_without_unit_are_not_deduplicated(self):
+        write_exposures([
+            Exposure(experiment=self.experiment, variation=self.variation),
+            Exposure(experiment=self.experiment, variation=self.variation),
+        ])
+
+        self.assertEqual(Exposure.objects.count(), 2)
+        self.assertFalse(Exposure.objects.filter(dedup_key__isnull=False).exists())
+
+    @override_settings(PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP_TRACK_HITS=True)
+    def test_track_hits(self):
+        first = now() - timedelta(hours=2)
+        last = now() - timedelta(hours=1)
+
+        write_exposures([self.exposure(seen_at=first)])
+        write_exposures([self.exposure(seen_at=last), self.exposure(seen_at=first)])
+
+        exposure = Exposure.objects.get()
+        self.assertEqual(exposure.seen_at, first)
+        self.assertEqual(exposure.last_seen_at, last)
+        self.assertEqual(exposure.hits, 3)
+
+        self.variation.refresh_from_db()
+        self.assertEqual(self.variation.exposure_count, 1)
+
+    def test_single_query_per_batch(self):
+        with self.assertNumQueries(2):
+            write_exposures([self.exposure() for _ in range(5)])
+
+        # Conflicting rows insert nothing, the counter update is skipped
+        with self.assertNumQueries(1):
+            write_exposures([self.exposure()])
+
+
+@override_settings(PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP=True)
+class ExposureDedupCacheTests(DedupTestMixin, TransactionTestCase):
+    def test_known_keys_skip_the_database(self):
+        write_deduplicated_exposures([self.exposure()])
+        self.assertIn(exposure_dedup_key(self.exposure()), dedup_cache)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(write_deduplicated_exposures([self.exposure()]), [])
+
+    @override_settings(PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP_TRACK_HITS=True)
+    def test_cache_unused_when_tracking_hits(self):
+        write_deduplicated_exposures([self.exposure()])
+        write_deduplicated_exposures([self.exposure()])
+
+        self.assertEqual(len(dedup_cache), 0)
+        self.assertEqual(Exposure.objects.get().hits, 2)
@@ -0,0 +1,138 @@
+import uuid
+
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.utils.timezone import now
+
+from planout_experiments.goals import Achievement, log_achievements
+from planout_experiments.models import Experiment, Goal, GoalAchievement
+from planout_experiments.registry import goal_registry
+
+
+class GoalTestMixin(object):
+    def setUp(self):
+        goal_registry.clear()
+        self.addCleanup(goal_registry.clear)
+        self.user = User.objects.create_user(username='test_user')
+        self.goal = Goal.objects.create(name='purchase', description='Completed checkout')
+
+
+class LogAchievementsTests(GoalTestMixin, TestCase):
+    def test_log_achievement_for_user(self):
+        seen_at = now() - timedelta(days=1)
+
+        achievement = GoalAchievement.log_achievement_for_user('purchase', self.user, value=2.5, seen_at=seen_at)
+
+        achievement.refresh_from_db()
+        self.assertEqual(achievement.goal, self.goal)
+        self.assertEqual(achievement.event_user, self.user)
+        self.assertEqual(achievement.value, 2.5)
+        self.assertEqual(achievement.seen_at, seen_at)
+
+    def test_batch(self):
+        experiment = Experiment.objects.create(name='Related')
+        seen_at = now() - timedelta(hours=3)
+
+        achievements = log_achievements([
+            Achievement('purchase', user=self.user, value=10.0, seen_at=seen_at),
+            Achievement('purchase', user=self.user.pk),
+            {'goal_name': 'signup', 'user_identifier': 'abc', 'user_identifier_type': 'device_id'},
+            Achievement('purchase', user=self.user, related_instance=experiment, data_source='orders'),
+        ])
+
+        self.assertEqual(len(achievements), 4)
+        self.assertEqual(GoalAchievement.objects.filter(goal=self.goal, event_user=self.user).count(), 3)
+        self.assertTrue(GoalAchievement.objects.filter(goal=self.goal, value=10.0, seen_at=seen_at).exists())
+
+        signup = GoalAchievement.objects.get(goal__name='signup')
+        self.assertEqual(signup.event_user_identifier, 'abc')
+        self.assertEqual(signup.event_user_identifier_type, 'device_id')
+
+        related = GoalAchievement.objects.get(data_source='orders')
+        self.assertEqual(related.content_type, ContentType.objects.get_for_model(Experiment))
+        self.assertEqual(related.related_instance, experiment)
+
+    def test_missing_goals_are_created(self):
+        log_achievements([Achievement('newsletter', user=self.user)])
+
+        self.assertTrue(Goal.objects.filter(name='newsletter').exists())
+
+    def test_single_insert_for_known_goals(self):
+        goal_registry.set('purchase', self.goal)
+
+        with self.assertNumQueries(1):
+            log_achievements([Achievement('purchase', user=self.user.pk) for _ in range(50)])
+
+        self.assertEqual(GoalAchievement.objects.count(), 50)
+
+    def test_idempotent(self):
+        delivered = uuid.uuid4()
+        records = [
+            Achievement('purchase', user=self.user, uuid=delivered),
+            Achievement('purchase', user=self.user, uuid=delivered),
+            Achievement('purchase', user=self.user, uuid=uuid.uuid4()),
+        ]
+
+        self.assertEqual(len(log_achievements(records, idempotent=True)), 2)
+        self.assertEqual(len(log_achievements(records, idempotent=True)), 0)
+        self.assertEqual(GoalAchievement.objects.count(), 2)
+
+    def test_idempotent_string_uuid(self):
+        delivered = str(uuid.uuid4())
+
+        log_achievements([Achievement('purchase', user=self.user, uuid=delivered)], idempotent=True)
+        replayed = log_achievements([Achievement('purchase', user=self.user, uuid=delivered)], idempotent=True)
+
+        self.assertEqual(replayed, [])
+        self.assertEqual(GoalAchievement.objects.filter(uuid=delivered).count(), 1)
+
+
+class GoalRegistryTests(GoalTestMixin, TransactionTestCase):
+    def test_warms_with_every_goal(self):
+        signup = Goal.objects.create(name='signup', description='Created an account')
+
+        self.assertEqual(goal_registry.get_goal_ids(['purchase']), {'purchase': self.goal.pk})
+        self.assertEqual(goal_registry.get('signup'), signup)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Goal.get_goal_by_name('signup'), signup)
+
+    def test_misses_after_warmup_load_only_missing_names(self):
+        Goal.get_goal_by_name('purchase')
+        Goal.objects.create(name='signup', description='Created an account')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Goal.get_goal_by_name('signup').name, 'signup')
+
+    def test_no_goal_queries_in_steady_state(self):
+        GoalAchievement.log_achievement_for_user('purchase', self.user)
+
+        with self.assertNumQueries(1):
+            GoalAchievement.log_achievement_for_user('purchase', self.user)
+
+    def test_get_goal_by_name_creates_goal(self):
+        goal = Goal.get_goal_by_name('newsletter')
+
+        self.assertEqual(Goal.objects.get(name='newsletter'), goal)
+        self.assertEqual(Goal.get_goal_by_name('newsletter'), goal)
+        self.assertEqual(Goal.objects.filter(name='newsletter').count(), 1)
+
+    def test_saving_goal_invalidates(self):
+        Goal.get_goal_by_name('purchase')
+
+        self.goal.name = 'checkout'
+        self.goal.save()
+
+        self.assertIsNone(goal_registry.get('purchase'))
+        self.assertEqual(Goal.get_goal_by_name('checkout').pk, self.goal.pk)
+
+    def test_deleting_goal_invalidates(self):
+        Goal.get_goal_by_name('purchase')
+        deleted_pk = self.goal.pk
+        self.goal.delete()
+
+        self.assertIsNone(goal_registry.get('purchase'))
+        self.assertNotEqual(Goal.get_goal_by_name('purchase').pk, deleted_pk)
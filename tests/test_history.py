@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from planout_experiments.history import get_history_mode, history_buffer
+from planout_experiments.models import Experiment, ExperimentResult, Goal, Variation
+from planout_experiments.registry import variation_ids
+
+
+class HistoryModeTests(TestCase):
+    def setUp(self):
+        self.experiment = Experiment.objects.create(name='History Experiment')
+
+    def test_history_is_on_by_default(self):
+        variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+
+        self.assertEqual(get_history_mode(Variation), 'on')
+        self.assertEqual(variation.history.count(), 1)
+
+    @override_settings(PLANOUT_EXPERIMENTS_HISTORY={'Variation': 'off'})
+    def test_history_can_be_turned_off_per_model(self):
+        variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+        variation.value = 'red'
+        variation.save()
+        goal = Goal.objects.create(name='purchase')
+
+        self.assertEqual(Variation.history.count(), 0)
+        self.assertEqual(goal.history.count(), 1)
+
+    @override_settings(PLANOUT_EXPERIMENTS_HISTORY={'Variation': 'off'})
+    def test_created_variations_follow_mode(self):
+        with self.assertNumQueries(1):
+            variation_ids.create_variation_id(self.experiment.pk, 'button_text', 'blue')
+
+        self.assertEqual(Variation.history.count(), 0)
+
+    @override_settings(PLANOUT_EXPERIMENTS_HISTORY={'Variation': 'sometimes'})
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            get_history_mode(Variation)
+
+
+@override_settings(PLANOUT_EXPERIMENTS_HISTORY={'Variation': 'buffered', 'ExperimentResult': 'buffered'})
+class BufferedHistoryTests(TransactionTestCase):
+    def setUp(self):
+        history_buffer.flush()
+        self.addCleanup(history_buffer.flush)
+        self.experiment = Experiment.objects.create(name='History Experiment')
+        self.goal = Goal.objects.create(name='purchase')
+
+    def test_history_is_written_on_flush(self):
+        variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+        result = ExperimentResult.objects.create(experiment=self.experiment, goal=self.goal, variation=variation)
+        result.total_exposures = 10
+        result.save()
+
+        self.assertEqual(Variation.history.count(), 0)
+        self.assertEqual(len(history_buffer), 3)
+
+        with self.assertNumQueries(2):
+            history_buffer.flush()
+
+        self.assertEqual(
+            list(result.history.order_by('history_id').values_list('history_type', 'total_exposures')),
+            [('+', 0), ('~', 10)]
+        )
+        self.assertEqual(variation.history.get().value, 'blue')
+
+    def test_rolled_back_changes_are_not_recorded(self):
+        with transaction.atomic():
+            Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+            transaction.set_rollback(True)
+
+        self.assertEqual(len(history_buffer), 0)
+
+    @override_settings(PLANOUT_EXPERIMENTS_HISTORY_BUFFER_SIZE=2)
+    def test_full_buffer_is_flushed(self):
+        variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+        variation.delete()
+
+        self.assertEqual(len(history_buffer), 0)
+        self.assertEqual(
+            list(Variation.history.order_by('history_id').values_list('history_type', flat=True)),
+            ['+', '-']
+        )
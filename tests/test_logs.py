@@ -0,0 +1,173 @@
+import json
+import time
+import tempfile
+
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils.timezone import now, utc
+
+from planout_experiments.logs import (
+    BufferedLogBackend,
+    DatabaseLogBackend,
+    JSONLinesLogBackend,
+    NullLogBackend,
+    compact_experiment_logs,
+    get_log_backend,
+    log_row,
+    prune_experiment_logs
+)
+from planout_experiments.models import Experiment, ExperimentLog
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+
+
+class LogBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Log Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def test_trial_logs_to_database_by_default(self):
+        self.assertIsInstance(get_log_backend(), DatabaseLogBackend)
+
+        trial = self.experiment.get_trial_for_user(self.user)
+        trial.log_event('conversion', {'amount': 3})
+
+        log = ExperimentLog.objects.get(experiment=self.experiment)
+        self.assertEqual(log.data['event'], 'conversion')
+        self.assertEqual(log.data['extra_data'], {'amount': 3})
+
+    @override_settings(PLANOUT_EXPERIMENTS_LOG_BACKEND='planout_experiments.logs.NullLogBackend')
+    def test_null_backend_drops_logs(self):
+        self.assertIsInstance(get_log_backend(), NullLogBackend)
+
+        trial = self.experiment.get_trial_for_user(self.user)
+
+        with self.assertNumQueries(0):
+            trial.log_event('conversion')
+
+        self.assertFalse(ExperimentLog.objects.exists())
+
+
+class BufferedLogBackendTests(TransactionTestCase):
+    def setUp(self):
+        self.experiment = Experiment.objects.create(name='Log Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def test_flush_copies_queued_logs(self):
+        backend = BufferedLogBackend(batch_size=10, flush_interval=60)
+        self.addCleanup(backend.close)
+
+        backend.submit([log_row(self.experiment, {'event': 'conversion', 'n': n}) for n in range(25)])
+        self.assertEqual(ExperimentLog.objects.count(), 0)
+
+        backend.flush()
+        self.assertEqual(ExperimentLog.objects.count(), 25)
+        self.assertEqual(
+            sorted(ExperimentLog.objects.values_list('data__n', flat=True)),
+            list(range(25))
+        )
+
+    def test_block_timeout_covers_whole_submit(self):
+        backend = BufferedLogBackend(max_queue_size=1, block_timeout=0.2)
+        self.addCleanup(backend.close)
+
+        with mock.patch.object(backend, '_next_batch', side_effect=lambda q: ([], None)):
+            started = time.monotonic()
+            backend.submit([log_row(self.experiment, {'n': n}) for n in range(10)])
+
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(backend.dropped, 9)
+
+
+class JSONLinesLogBackendTests(TransactionTestCase):
+    def setUp(self):
+        self.experiment = Experiment.objects.create(name='Log Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_appends_rows_and_rotates(self):
+        path = self.directory.name + '/logs-{pid}.jsonl'
+        backend = JSONLinesLogBackend(path, max_bytes=300, backup_count=2)
+        self.addCleanup(backend.close)
+
+        for n in range(5):
+            backend.submit([log_row(self.experiment, {'event': 'conversion', 'n': n})])
+
+        backend.flush()
+        current = backend._logger.handlers[0].baseFilename
+
+        with open(current) as lines:
+            rows = [json.loads(line) for line in lines]
+
+        with open(current + '.1') as lines:
+            rows = [json.loads(line) for line in lines] + rows
+
+        self.assertEqual([row['data']['n'] for row in rows][-2:], [3, 4])
+        self.assertEqual(rows[0]['experiment_id'], self.experiment.pk)
+
+        # Segments load back into the table
+        call_command('copy_events', 'experimentlog', current, stdout=StringIO())
+        self.assertTrue(ExperimentLog.objects.filter(data__n=4).exists())
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.experiment = Experiment.objects.create(name='Log Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def create_log(self, created, event='conversion'):
+        log = ExperimentLog.objects.create(experiment=self.experiment, data={'event': event})
+        ExperimentLog.objects.filter(pk=log.pk).update(created=created)
+
+    def test_compact_counts_events_per_day(self):
+        day = datetime(2026, 1, 5, tzinfo=utc)
+        self.create_log(day + timedelta(hours=1))
+        self.create_log(day + timedelta(hours=2))
+        self.create_log(day + timedelta(hours=3), event='exposure')
+        self.create_log(day + timedelta(days=1, hours=1))
+        self.create_log(now())
+
+        # Only whole days before the cut off are compacted
+        removed, compacted = compact_experiment_logs(day + timedelta(days=1, hours=12))
+
+        self.assertEqual((removed, compacted), (3, 1))
+        self.assertEqual(ExperimentLog.objects.count(), 3)
+
+        row = ExperimentLog.objects.get(data__compacted=True)
+        self.assertEqual(row.created, day)
+        self.assertEqual(row.data['count'], 3)
+        self.assertEqual(row.data['events'], {'conversion': 2, 'exposure': 1})
+
+        # Compacted rows are left alone by later runs
+        self.assertEqual(compact_experiment_logs(day + timedelta(days=1, hours=12)), (0, 0))
+
+    def test_prune_deletes_in_batches(self):
+        for days in (10, 11, 12):
+            self.create_log(now() - timedelta(days=days))
+        self.create_log(now())
+
+        with self.assertNumQueries(4):
+            self.assertEqual(prune_experiment_logs(now() - timedelta(days=5), batch_size=2), 3)
+
+        self.assertEqual(ExperimentLog.objects.count(), 1)
+
+    def test_command(self):
+        self.create_log(now() - timedelta(days=40))
+        self.create_log(now() - timedelta(days=10))
+        self.create_log(now())
+        out = StringIO()
+
+        call_command('prune_experiment_logs', compact_after=7, delete_after=30, stdout=out)
+
+        # The older log is compacted first, its daily row is then deleted
+        self.assertIn('Compacted 2 experiment logs into 2 daily rows', out.getvalue())
+        self.assertIn('Deleted 1 experiment logs', out.getvalue())
+        self.assertEqual(ExperimentLog.objects.filter(data__compacted=True).count(), 1)
+        self.assertEqual(ExperimentLog.objects.count(), 2)
+
+    def test_command_requires_an_age(self):
+        with self.assertRaises(CommandError):
+            call_command('prune_experiment_logs', stdout=StringIO())
@@ -0,0 +1,88 @@
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.contrib.auth.models import AnonymousUser, User
+
+from planout_experiments.middleware import AssignmentContext, ExperimentAssignmentMiddleware
+from planout_experiments.models import Experiment, Exposure
+from planout_experiments.registry import experiment_registry, variation_ids
+from planout_experiments.sinks import exposure_counter
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+
+
+def experiment_view(request):
+    values = [
+        request.experiments.get_value('Middleware Experiment', 'button_text'),
+        request.experiments.get_value('Middleware Experiment', 'group_size'),
+        request.experiments.get_value('Middleware Experiment', 'button_text'),
+        request.experiments.get_value('flag_experiment', 'new_checkout', control_value=False),
+    ]
+    return HttpResponse(repr(values))
+
+
+class ExperimentAssignmentMiddlewareTests(TransactionTestCase):
+    def setUp(self):
+        experiment_registry.clear()
+        variation_ids.clear()
+        self.factory = RequestFactory()
+        self.middleware = ExperimentAssignmentMiddleware(experiment_view)
+        self.experiment = Experiment.objects.create(name='Middleware Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def tearDown(self):
+        experiment_registry.clear()
+        variation_ids.clear()
+        exposure_counter.close()
+
+    def get(self, user):
+        request = self.factory.get('/')
+        request.user = user
+        return request, self.middleware(request)
+
+    def test_exposures_are_written_once_per_request(self):
+        user = User.objects.create_user(username='first_user')
+        request, response = self.get(user)
+
+        self.assertIn("'blue'", response.content.decode())
+        self.assertEqual(len(request.experiments.exposure_sink), 0)
+
+        trial = request.experiments.get_trial('Middleware Experiment')
+        flag = Experiment.objects.get(name='flag_experiment')
+
+        self.assertEqual(Exposure.objects.filter(experiment=self.experiment).count(), len(trial.get_params()))
+        self.assertEqual(Exposure.objects.filter(experiment=flag).count(), 1)
+        self.assertEqual(set(Exposure.objects.values_list('event_user', flat=True)), {user.id})
+
+    def test_warm_request_makes_one_round_trip(self):
+        user = User.objects.create_user(username='first_user')
+        self.get(user)
+
+        # Definitions and variation ids are cached after the first
+        # request, exposures for both experiments share one insert and
+        # one exposure counter update
+        with self.assertNumQueries(2):
+            self.get(user)
+
+    def test_anonymous_users_get_control(self):
+        request, response = self.get(AnonymousUser())
+
+        self.assertIn('False', response.content.decode())
+        self.assertEqual(Exposure.objects.count(), 0)
+
+    def test_fuzzy_identifier_context(self):
+        context = AssignmentContext(user_identifier='device-1', user_identifier_type='device_id')
+        self.assertEqual(context.get_value('Middleware Experiment', 'button_text'), 'blue')
+        self.assertEqual(Exposure.objects.count(), 0)
+
+        context.flush()
+        self.assertEqual(
+            set(Exposure.objects.values_list('event_user_identifier', flat=True)),
+            {'device-1'}
+        )
+
+    @override_settings(PLANOUT_EXPERIMENTS_CONSTANT_EXPOSURE_SAMPLE_RATE=0)
+    def test_constant_flags_are_not_exposure_logged(self):
+        request, response = self.get(User.objects.create_user(username='first_user'))
+
+        self.assertIn('False', response.content.decode())
+        self.assertFalse(Exposure.objects.filter(experiment__name='flag_experiment').exists())
+        self.assertTrue(Exposure.objects.filter(experiment=self.experiment).exists())
@@ -1,9 +1,15 @@
-from unittest import skip
+import threading
 
-from django.test import TestCase
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 
 from planout_experiments.models import Experiment, Exposure, Variation, Goal, GoalAchievement
+from planout_experiments.sinks import exposure_counter
 
 
 EXAMPLE_EXPERIMENT_JSON = """
@@ -143,6 +149,39 @@ class ExperimentMutationTests(TestCase):
         self.empty_experiment.add_planout_variable('the_lime', 'The Coconut')
         self.assertEqual(self.empty_experiment.get_planout_params(), {'the_lime': 'The Coconut'})
 
+    def test_set_planout_from_control_saves_once(self):
+        control = {'variable_{}'.format(i): i for i in range(20)}
+
+        # One update and one history row
+        with self.assertNumQueries(2):
+            self.empty_experiment.set_planout_from_control(control)
+
+        self.empty_experiment.refresh_from_db()
+        self.assertEqual(self.empty_experiment.get_planout_params(), control)
+        self.assertEqual(self.empty_experiment.history.filter(history_type='~').count(), 1)
+
+    def test_add_planout_variables_without_saving(self):
+        self.empty_experiment.add_planout_variables([('the_lime', 'The Coconut'), ('the_nut', 'Pecan')], save=False)
+
+        self.assertEqual(
+            self.empty_experiment.get_planout_params(),
+            {'the_lime': 'The Coconut', 'the_nut': 'Pecan'}
+        )
+        self.empty_experiment.refresh_from_db()
+        self.assertEqual(self.empty_experiment.get_planout_params(), {})
+
+    def test_salt_defaults_to_name(self):
+        self.assertEqual(self.empty_experiment.salt, 'default_experiment')
+
+    def test_save_keeps_existing_salt(self):
+        # As left by renaming a duplicate in migration 0008
+        Experiment.objects.filter(pk=self.empty_experiment.pk).update(name='orig #5', salt='orig')
+        experiment = Experiment.objects.get(pk=self.empty_experiment.pk)
+
+        experiment.save()
+        experiment.refresh_from_db()
+        self.assertEqual(experiment.salt, 'orig')
+
 
 class ExperimentUserTests(TestCase):
     def setUp(self):
@@ -186,7 +225,57 @@ class ExperimentUserTests(TestCase):
         Exposure.objects.all().delete()
         Variation.objects.all().delete()
 
-    @skip
+    def test_exposure_logging_does_not_fetch_user(self):
+        trial = self.experiment.get_trial_for_user_id(self.user.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            trial.get('button_text')
+
+        self.assertFalse(any('auth_user' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(
+            set(Exposure.objects.values_list('event_user', flat=True)),
+            {self.user.id}
+        )
+
+    def test_trials_are_cached_per_unit(self):
+        other_user = User.objects.create_user(username='other_user')
+
+        self.assertIs(self.experiment.get_trial_for_user(self.user), self.trial)
+
+        other_trial = self.experiment.get_trial_for_user(other_user)
+        self.assertIsNot(other_trial, self.trial)
+        self.assertEqual(other_trial.inputs['user_id'], other_user.id)
+
+    def test_cached_trial_logs_exposure_once(self):
+        self.experiment.get_trial_for_user(self.user).get('button_text')
+        self.experiment.get_trial_for_user(self.user).get('button_text')
+
+        self.assertEqual(Exposure.objects.filter(variation__key='button_text').count(), 1)
+
+    @override_settings(PLANOUT_EXPERIMENTS_TRIAL_CACHE_SIZE=1)
+    def test_trial_cache_is_bounded(self):
+        other_user = User.objects.create_user(username='other_user')
+        self.experiment.get_trial_for_user(other_user)
+
+        self.assertIsNot(self.experiment.get_trial_for_user(self.user), self.trial)
+
+    def test_trial_cache_is_per_thread(self):
+        trials = []
+        thread = threading.Thread(target=lambda: trials.append(self.experiment.get_trial_for_user(self.user)))
+        thread.start()
+        thread.join()
+
+        # The same unit gets its own trial on another thread, and the
+        # same assignment
+        self.assertIsNot(trials[0], self.trial)
+        self.assertIs(self.experiment.get_trial_for_user(self.user), self.trial)
+        self.assertEqual(trials[0].inputs, self.trial.inputs)
+        self.assertEqual(trials[0].get_params(), self.trial.get_params())
+
+    def test_save_clears_trial_cache(self):
+        self.experiment.save()
+        self.assertIsNot(self.experiment.get_trial_for_user(self.user), self.trial)
+
     def test_goal_tracking(self):
         self.assertEqual(self.trial.get('button_text'), 'blue')
 
@@ -211,6 +300,74 @@ class ExperimentUserTests(TestCase):
         self.assertEqual(button_variation.success_rate(self.visit_goal), 1.0)
         self.assertEqual(button_variation.success_percentage(self.visit_goal), 100.0)
 
+    def test_success_rate_counts_units_once(self):
+        self.trial.get('button_text')
+        button_variation = self.experiment.variations.get(key='button_text')
+
+        # A repeat visit by the same user
+        Exposure.objects.create(experiment=self.experiment, variation=button_variation, event_user=self.user)
+        Variation.reconcile_exposure_counts(self.experiment)
+        GoalAchievement.objects.create(event_user=self.user, goal=self.visit_goal)
+
+        button_variation.refresh_from_db()
+        self.assertEqual(button_variation.num_exposures, 2)
+        self.assertEqual(button_variation.success_rate(self.visit_goal), 1.0)
+
+
+class VariationExposureCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Count Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def button_variation(self):
+        return self.experiment.variations.get(key='button_text')
+
+    def test_exposures_increment_count(self):
+        self.experiment.get_trial_for_user(self.user).get('button_text')
+        self.experiment.get_trial_for_user(User.objects.create_user(username='other_user')).get('button_text')
+
+        variation = self.button_variation()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(variation.num_exposures, 2)
+
+    def test_reconcile_exposure_counts(self):
+        self.experiment.get_trial_for_user(self.user).get('button_text')
+        Exposure.objects.filter(variation__key='button_text').delete()
+
+        self.assertEqual(self.button_variation().num_exposures, 1)
+
+        call_command('reconcile_exposure_counts', experiment='Count Experiment', stdout=StringIO())
+
+        self.assertEqual(self.button_variation().num_exposures, 0)
+
+    @override_settings(PLANOUT_EXPERIMENTS_COUNT_EXPOSURES=False)
+    def test_counting_disabled(self):
+        self.experiment.get_trial_for_user(self.user).get('button_text')
+        self.assertEqual(self.button_variation().num_exposures, 0)
+
+        Variation.reconcile_exposure_counts()
+        self.assertEqual(self.button_variation().num_exposures, 1)
+
+
+@override_settings(PLANOUT_EXPERIMENTS_ASYNC_EXPOSURE_COUNTS=True)
+class AsyncExposureCountTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Async Count', planout_json=EXAMPLE_EXPERIMENT_JSON)
+        self.addCleanup(exposure_counter.close)
+
+    def test_counts_are_applied_after_commit(self):
+        self.experiment.get_trial_for_user(self.user).get('button_text')
+
+        # Nothing is counted until the background counter runs
+        variation = self.experiment.variations.get(key='button_text')
+        self.assertEqual(variation.num_exposures, 0)
+
+        exposure_counter.flush()
+        variation.refresh_from_db()
+        self.assertEqual(variation.num_exposures, 1)
+
 
 class DynamicExperimentValueTests(TestCase):
     def setUp(self):
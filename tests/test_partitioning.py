@@ -0,0 +1,115 @@
+import uuid
+
+from datetime import timedelta
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+
+from planout_experiments import dedup
+from planout_experiments.goals import Achievement, log_achievements
+from planout_experiments.models import Experiment, Exposure, Goal, GoalAchievement, Variation
+from planout_experiments.partitioning import convert_to_partitioned, is_partitioned, month_start, partition_name
+from planout_experiments.sinks import write_exposures
+
+
+class PartitioningTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Partitioned Experiment')
+        self.variation = Variation.objects.create(experiment=self.experiment, key='color', value='red')
+        self.goal = Goal.objects.create(name='purchase', description='User bought something')
+
+        self.old_exposure = Exposure.objects.create(
+            experiment=self.experiment,
+            variation=self.variation,
+            event_user=self.user
+        )
+        Exposure.objects.filter(pk=self.old_exposure.pk).update(seen_at=now() - timedelta(days=100))
+
+    def partition_of(self, model, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM {} WHERE id = %s".format(model._meta.db_table),
+                [pk]
+            )
+            return cursor.fetchone()[0]
+
+    def test_convert(self):
+        self.assertFalse(is_partitioned(Exposure))
+
+        out = StringIO()
+        call_command('partition_events', convert=True, months_ahead=2, stdout=out)
+
+        self.assertTrue(is_partitioned(Exposure))
+        self.assertTrue(is_partitioned(GoalAchievement))
+        self.assertFalse(convert_to_partitioned(Exposure))
+
+        # Existing rows are kept in their month's partition
+        old_month = month_start(now() - timedelta(days=100))
+        self.assertEqual(self.partition_of(Exposure, self.old_exposure.pk), partition_name(Exposure, old_month))
+
+        # The ORM, foreign keys and the id sequence keep working
+        exposure = Exposure.objects.create(experiment=self.experiment, variation=self.variation, event_user=self.user)
+        self.assertGreater(exposure.pk, self.old_exposure.pk)
+        self.assertEqual(self.partition_of(Exposure, exposure.pk), partition_name(Exposure, month_start(now())))
+        self.assertEqual(self.experiment.exposures.count(), 2)
+
+        GoalAchievement.objects.create(goal=self.goal, event_user=self.user)
+        self.assertEqual(self.variation.goal_achievements(self.goal).count(), 1)
+
+        # Far future rows go to the default partition
+        future = Exposure.objects.create(experiment=self.experiment, variation=self.variation, event_user=self.user)
+        Exposure.objects.filter(pk=future.pk).update(seen_at=now() + timedelta(days=400))
+        self.assertEqual(self.partition_of(Exposure, future.pk), '{}_default'.format(Exposure._meta.db_table))
+
+    @override_settings(PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP=True)
+    def test_convert_refuses_exposures_with_dedup(self):
+        with self.assertRaises(CommandError):
+            call_command('partition_events', convert=True, stdout=StringIO())
+
+        self.assertFalse(is_partitioned(Exposure))
+
+    def test_dedup_fails_fast_on_partitioned_exposures(self):
+        convert_to_partitioned(Exposure, months_ahead=0)
+        self.addCleanup(setattr, dedup, '_table_checked', False)
+        dedup._table_checked = False
+
+        with override_settings(PLANOUT_EXPERIMENTS_EXPOSURE_DEDUP=True):
+            with self.assertRaises(ImproperlyConfigured):
+                write_exposures([
+                    Exposure(experiment=self.experiment, variation=self.variation, event_user=self.user)
+                ])
+
+    def test_uuid_uniqueness_after_convert(self):
+        out = StringIO()
+        call_command('partition_events', convert=True, months_ahead=0, stdout=out)
+
+        self.assertIn('uuid is no longer unique', out.getvalue())
+
+        # The database no longer rejects repeated uuids
+        delivered = uuid.uuid4()
+        GoalAchievement.objects.create(goal=self.goal, event_user=self.user, uuid=delivered)
+        GoalAchievement.objects.create(goal=self.goal, event_user=self.user, uuid=delivered)
+        self.assertEqual(GoalAchievement.objects.filter(uuid=delivered).count(), 2)
+
+        # Idempotent ingestion still skips stored uuids
+        replayed = uuid.uuid4()
+        records = [Achievement('purchase', user=self.user, uuid=str(replayed))]
+
+        self.assertEqual(len(log_achievements(records, idempotent=True)), 1)
+        self.assertEqual(log_achievements(records, idempotent=True), [])
+        self.assertEqual(GoalAchievement.objects.filter(uuid=replayed).count(), 1)
+
+    def test_ensure_future_partitions(self):
+        convert_to_partitioned(Exposure, months_ahead=0)
+
+        out = StringIO()
+        call_command('partition_events', months_ahead=2, stdout=out)
+
+        self.assertIn('Created partition {}'.format(Exposure._meta.db_table), out.getvalue())
+        self.assertNotIn(GoalAchievement._meta.db_table, out.getvalue())
@@ -0,0 +1,223 @@
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+
+from planout_experiments.models import (
+    DJANGO_USER_DB_ID,
+    Experiment,
+    Exposure,
+    SingleTrial,
+    Variation,
+    planout_from_control
+)
+from planout_experiments.registry import TTLCache, experiment_registry, variation_ids
+from planout_experiments.sinks import exposure_counter
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTests(TestCase):
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.cache = TTLCache(max_size=2, ttl=10, timer=self.timer)
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.timer.now = 9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.timer.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_zero_max_size_disables_cache(self):
+        cache = TTLCache(max_size=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_pop_matching(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.pop_matching(lambda value: value == 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+
+
+class ExperimentRegistryTests(TransactionTestCase):
+    def setUp(self):
+        experiment_registry.clear()
+        self.user = User.objects.create_user(username='test_user')
+
+    def tearDown(self):
+        experiment_registry.clear()
+        exposure_counter.close()
+
+    def test_get_experiment_is_cached(self):
+        experiment = Experiment.get_experiment('cached_experiment', {'strategy': 'vanilla'})
+
+        with self.assertNumQueries(0):
+            cached = Experiment.get_experiment('cached_experiment', {'strategy': 'vanilla'})
+
+        self.assertEqual(cached.pk, experiment.pk)
+        self.assertEqual(
+            experiment_registry.get('cached_experiment').planout_dict['seq'],
+            [{"op": "set", "var": "strategy", "value": "vanilla"}]
+        )
+
+    def test_save_invalidates(self):
+        experiment = Experiment.get_experiment('cached_experiment', {'strategy': 'vanilla'})
+        self.assertIsNotNone(experiment_registry.get('cached_experiment'))
+
+        experiment.add_planout_variable('topping', 'sprinkles')
+        self.assertIsNone(experiment_registry.get('cached_experiment'))
+
+        refreshed = Experiment.get_experiment('cached_experiment', {'strategy': 'vanilla'})
+        self.assertEqual(refreshed.get_planout_params(), {'strategy': 'vanilla', 'topping': 'sprinkles'})
+
+    def test_delete_invalidates(self):
+        experiment = Experiment.get_experiment('cached_experiment', {'strategy': 'vanilla'})
+        experiment.delete()
+        self.assertIsNone(experiment_registry.get('cached_experiment'))
+
+    @override_settings(PLANOUT_EXPERIMENTS_REGISTRY_MAX_SIZE=0)
+    def test_registry_can_be_disabled(self):
+        Experiment.get_experiment('cached_experiment', {'strategy': 'vanilla'})
+        self.assertIsNone(experiment_registry.get('cached_experiment'))
+
+    def test_get_experiment_value_with_user_identifier(self):
+        result = Experiment.get_experiment_value(
+            'cached_experiment',
+            'strategy',
+            user_identifier='abc123',
+            user_identifier_type='device_id',
+            control_value='vanilla'
+        )
+        self.assertEqual(result, 'vanilla')
+
+        experiment = Experiment.objects.get(name='cached_experiment')
+        exposure = experiment.exposures.get()
+        self.assertEqual(exposure.event_user_identifier, 'abc123')
+        self.assertEqual(exposure.event_user_identifier_type, 'device_id')
+
+    @override_settings(PLANOUT_EXPERIMENTS_CONSTANT_EXPOSURE_SAMPLE_RATE=0)
+    def test_constant_flags_skip_assignment(self):
+        Experiment.get_experiment('cached_experiment', {'strategy': 'vanilla'})
+
+        with self.assertNumQueries(0), mock.patch('planout_experiments.models.SingleTrial') as trial_class:
+            result = Experiment.get_experiment_value('cached_experiment', 'strategy', user=self.user)
+
+        self.assertEqual(result, 'vanilla')
+        self.assertFalse(trial_class.called)
+        self.assertFalse(Exposure.objects.exists())
+
+    @override_settings(PLANOUT_EXPERIMENTS_CONSTANT_EXPOSURE_SAMPLE_RATE=0.5)
+    def test_constant_flag_exposures_are_sampled(self):
+        with mock.patch('planout_experiments.models.random.random', side_effect=[0.7, 0.2]):
+            Experiment.get_experiment_value('cached_experiment', 'strategy', user=self.user, control_value='vanilla')
+            self.assertFalse(Exposure.objects.exists())
+
+            Experiment.get_experiment_value('cached_experiment', 'strategy', user=self.user, control_value='vanilla')
+            self.assertEqual(Exposure.objects.count(), 1)
+
+    def test_bootstrap_creates_experiment_with_script(self):
+        # Lookup, insert and the history row
+        with self.assertNumQueries(3):
+            experiment = experiment_registry.bootstrap('bootstrapped', planout_from_control({'strategy': 'vanilla'}))
+
+        stored = Experiment.objects.get(name='bootstrapped')
+        self.assertEqual(stored.pk, experiment.pk)
+        self.assertEqual(stored.salt, 'bootstrapped')
+        self.assertEqual(stored.get_planout_params(), {'strategy': 'vanilla'})
+        self.assertEqual(stored.history.get().history_type, '+')
+
+    def test_bootstrap_returns_existing_experiment(self):
+        existing = Experiment.objects.create(name='bootstrapped', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+        with self.assertNumQueries(1):
+            experiment = experiment_registry.bootstrap('bootstrapped', planout_from_control({'strategy': 'vanilla'}))
+
+        self.assertEqual(experiment.pk, existing.pk)
+
+    def test_bootstrap_insert_conflict_returns_existing_experiment(self):
+        existing = Experiment.objects.create(name='bootstrapped', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+        # Another worker inserts between the lookup and the insert
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            experiment = experiment_registry.bootstrap('bootstrapped', planout_from_control({'strategy': 'vanilla'}))
+
+        self.assertEqual(experiment.pk, existing.pk)
+        self.assertEqual(Experiment.objects.count(), 1)
+
+    def test_names_are_unique(self):
+        Experiment.objects.create(name='bootstrapped')
+
+        with self.assertRaises(IntegrityError):
+            Experiment.objects.create(name='bootstrapped')
+
+
+class VariationCacheTests(TransactionTestCase):
+    def setUp(self):
+        variation_ids.clear()
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='variation_cache', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def tearDown(self):
+        variation_ids.clear()
+        exposure_counter.close()
+
+    def test_steady_state_exposures_run_no_variation_queries(self):
+        self.experiment.get_trial_for_user(self.user).get_params()
+        variation_count = Variation.objects.count()
+
+        trial = SingleTrial(
+            db_experiment=self.experiment,
+            user_id=self.user.id,
+            user_identifier_type=DJANGO_USER_DB_ID
+        )
+
+        # Only the exposure bulk insert and the exposure counter update
+        with self.assertNumQueries(2):
+            trial.get_params()
+
+        self.assertEqual(Variation.objects.count(), variation_count)
+
+    def test_existing_variation_is_reused(self):
+        variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+        variation_ids.clear()
+
+        self.assertEqual(variation_ids.get_variation_id(self.experiment.pk, 'button_text', 'blue'), variation.pk)
+
+    def test_insert_conflict_returns_existing_id(self):
+        variation = Variation.objects.create(experiment=self.experiment, key='ratings_goal', value='10')
+        self.assertEqual(variation_ids._insert(self.experiment.pk, 'ratings_goal', '10'), variation.pk)
+
+    def test_values_are_matched_as_strings(self):
+        variation_id = variation_ids.get_variation_id(self.experiment.pk, 'group_size', 10)
+        self.assertEqual(Variation.objects.get(pk=variation_id).value, '10')
+        self.assertEqual(variation_ids.get_variation_id(self.experiment.pk, 'group_size', '10'), variation_id)
+
+    def test_deleting_variation_invalidates(self):
+        variation_id = variation_ids.get_variation_id(self.experiment.pk, 'button_text', 'blue')
+        self.assertIsNotNone(variation_ids.get(self.experiment.pk))
+
+        Variation.objects.filter(pk=variation_id).delete()
+        self.assertIsNone(variation_ids.get(self.experiment.pk))
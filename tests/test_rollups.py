@@ -0,0 +1,299 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils.timezone import localtime, now
+
+from planout_experiments.attribution import goal_attribution
+from planout_experiments.models import (
+    DJANGO_USER_DB_ID, Experiment, ExperimentResult, Exposure, Goal, GoalAchievement, RollupState, Variation
+)
+from planout_experiments.rollups import ExperimentResultRollup, TimeSeriesRollup
+
+
+class ExperimentResultRollupTests(TestCase):
+    def setUp(self):
+        self.goal = Goal.objects.create(name='purchase', description='User bought something')
+        self.unlinked_goal = Goal.objects.create(name='share', description='User shared')
+        self.experiment = Experiment.objects.create(name='Rollup Experiment')
+        self.experiment.goals.add(self.goal)
+        self.control = Variation.objects.create(experiment=self.experiment, key='color', value='red')
+        self.treatment = Variation.objects.create(experiment=self.experiment, key='color', value='blue')
+        self.users = [User.objects.create_user(username='user_{}'.format(i)) for i in range(4)]
+        self.rollup = ExperimentResultRollup()
+
+    def expose(self, variation, user=None, identifier=None, sample_rate=1.0):
+        Exposure.objects.create(
+            experiment=self.experiment,
+            variation=variation,
+            event_user=user,
+            event_user_identifier=identifier,
+            event_user_identifier_type=DJANGO_USER_DB_ID if identifier is None else 'device_id',
+            sample_rate=sample_rate
+        )
+
+    def achieve(self, value=1.0, user=None, identifier=None, goal=None):
+        GoalAchievement.objects.create(
+            goal=goal or self.goal,
+            value=value,
+            event_user=user,
+            event_user_identifier=identifier,
+            event_user_identifier_type=None if identifier is None else 'device_id'
+        )
+
+    def results(self):
+        return {result.variation_id: result for result in self.experiment.get_results_for_goal(self.goal)}
+
+    def assertMatchesAttribution(self):
+        stats = goal_attribution(self.experiment.pk, self.goal.pk)
+        results = self.results()
+
+        self.assertEqual(set(results), set(stats))
+
+        for variation_id, result in results.items():
+            self.assertEqual(result.total_exposures, stats[variation_id].exposed_units)
+            self.assertAlmostEqual(result.estimated_exposures, stats[variation_id].estimated_units)
+            self.assertEqual(result.total_goal_achievements, stats[variation_id].achieving_units)
+            self.assertAlmostEqual(result.success_value, stats[variation_id].success_value)
+
+    def test_incremental_runs_match_full_attribution(self):
+        first, second, third, fourth = self.users
+
+        self.expose(self.control, user=first)
+        self.expose(self.control, user=second)
+        self.expose(self.treatment, identifier='device-1')
+        self.achieve(2.0, user=first)
+        self.achieve(user=third)
+        self.achieve(user=third, goal=self.unlinked_goal)
+        self.rollup.run(until=now())
+
+        self.assertMatchesAttribution()
+        self.assertEqual(self.results()[self.control.pk].success_rate, 1.0)
+
+        # Repeat exposures and achievements, a late exposure of a unit
+        # that achieved earlier and a second achievement of a counted unit
+        self.expose(self.control, user=first)
+        self.expose(self.treatment, user=third)
+        self.achieve(3.0, user=first)
+        self.achieve(identifier='device-1')
+        self.expose(self.treatment, user=fourth)
+        self.achieve(user=fourth)
+        self.rollup.run(until=now())
+
+        self.assertMatchesAttribution()
+        control = self.results()[self.control.pk]
+        self.assertEqual(
+            (control.total_exposures, control.total_goal_achievements, control.success_value),
+            (2, 1, 5.0)
+        )
+
+    def test_estimated_exposures(self):
+        first, second, third, fourth = self.users
+
+        self.expose(self.control, user=first, sample_rate=0.25)
+        self.expose(self.control, user=first, sample_rate=0.5)
+        self.expose(self.control, user=second, sample_rate=0.25)
+        self.expose(self.treatment, user=third)
+        self.rollup.run(until=now())
+
+        # A unit is weighted by the highest rate it was logged with
+        self.assertMatchesAttribution()
+        self.assertEqual(self.results()[self.control.pk].estimated_exposures, 6.0)
+
+        self.expose(self.treatment, user=fourth, sample_rate=0.5)
+        self.rollup.run(until=now())
+
+        self.assertMatchesAttribution()
+        treatment = self.results()[self.treatment.pk]
+        self.assertEqual((treatment.total_exposures, treatment.estimated_exposures), (2, 3.0))
+
+    def test_only_new_events_are_read(self):
+        self.expose(self.control, user=self.users[0])
+        watermark = self.rollup.run(until=now())
+
+        self.assertEqual(RollupState.objects.get(name=self.rollup.name).watermark, watermark)
+
+        # Nothing created since the watermark, running again is a no-op
+        self.rollup.run(until=now())
+        self.assertEqual(self.results()[self.control.pk].total_exposures, 1)
+
+        # Events stamped before the watermark are not picked up
+        self.expose(self.control, user=self.users[1])
+        Exposure.objects.filter(event_user=self.users[1]).update(created=watermark - timedelta(seconds=1))
+        self.rollup.run(until=now())
+        self.assertEqual(self.results()[self.control.pk].total_exposures, 1)
+
+        self.rollup.run(until=now(), rebuild=True)
+        self.assertEqual(self.results()[self.control.pk].total_exposures, 2)
+
+    def test_run_does_not_write_history(self):
+        self.expose(self.control, user=self.users[0])
+        self.rollup.run(until=now())
+        self.expose(self.control, user=self.users[1])
+        self.rollup.run(until=now())
+
+        self.assertEqual(ExperimentResult.history.count(), 0)
+
+    def test_lag(self):
+        self.expose(self.control, user=self.users[0])
+
+        with self.settings(PLANOUT_EXPERIMENTS_ROLLUP_LAG=60):
+            self.rollup.run()
+
+        self.assertEqual(self.results(), {})
+
+    def test_command(self):
+        self.expose(self.control, user=self.users[0])
+        self.achieve(user=self.users[0])
+
+        out = StringIO()
+        call_command('run_rollups', 'experiment_results', until=now().isoformat(), stdout=out)
+
+        self.assertIn('experiment_results processed up to', out.getvalue())
+        self.assertMatchesAttribution()
+
+    def test_command_accepts_naive_until(self):
+        self.expose(self.control, user=self.users[0])
+        until = (localtime() + timedelta(minutes=1)).replace(tzinfo=None).isoformat()
+
+        # The second run compares against the stored watermark
+        for _ in range(2):
+            call_command('run_rollups', 'experiment_results', until=until, stdout=StringIO())
+
+        self.assertIsNotNone(RollupState.objects.get(name='experiment_results').watermark.tzinfo)
+        self.assertMatchesAttribution()
+
+    def test_run_rejects_naive_until(self):
+        with self.assertRaises(ValueError):
+            self.rollup.run(until=now().replace(tzinfo=None))
+
+
+class TimeSeriesRollupTests(TestCase):
+    def setUp(self):
+        self.goal = Goal.objects.create(name='purchase', description='User bought something')
+        self.experiment = Experiment.objects.create(name='Series Experiment')
+        self.experiment.goals.add(self.goal)
+        self.control = Variation.objects.create(experiment=self.experiment, key='color', value='red')
+        self.treatment = Variation.objects.create(experiment=self.experiment, key='color', value='blue')
+        self.users = [User.objects.create_user(username='user_{}'.format(i)) for i in range(3)]
+        self.hourly = TimeSeriesRollup('hour')
+        self.start = now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=2)
+
+    def at(self, hours, minutes=10):
+        return self.start + timedelta(hours=hours, minutes=minutes)
+
+    def expose(self, variation, seen_at, user=None, identifier=None, sample_rate=1.0):
+        exposure = Exposure.objects.create(
+            experiment=self.experiment,
+            variation=variation,
+            event_user=user,
+            event_user_identifier=identifier,
+            event_user_identifier_type=DJANGO_USER_DB_ID if identifier is None else 'device_id',
+            sample_rate=sample_rate
+        )
+        Exposure.objects.filter(pk=exposure.pk).update(seen_at=seen_at)
+
+    def achieve(self, seen_at, value=1.0, user=None, identifier=None):
+        achievement = GoalAchievement.objects.create(
+            goal=self.goal,
+            value=value,
+            event_user=user,
+            event_user_identifier=identifier,
+            event_user_identifier_type=None if identifier is None else 'device_id'
+        )
+        GoalAchievement.objects.filter(pk=achievement.pk).update(seen_at=seen_at)
+
+    def exposure_series(self, granularity='hour'):
+        return [
+            (row.bucket, row.variation_id, row.exposures)
+            for row in self.experiment.get_exposure_series(granularity)
+        ]
+
+    def goal_series(self, granularity='hour'):
+        return [
+            (row.bucket, row.variation_id, row.achievements, row.value)
+            for row in self.experiment.get_goal_series(self.goal, granularity)
+        ]
+
+    def test_buckets(self):
+        first, second, third = self.users
+
+        self.expose(self.control, self.at(0), user=first)
+        self.expose(self.control, self.at(0, 50), user=second)
+        self.expose(self.treatment, self.at(1), identifier='device-1')
+        self.achieve(self.at(1), 2.0, user=first)
+        self.achieve(self.at(2), 3.0, identifier='device-1')
+        self.achieve(self.at(2), user=third)
+        self.hourly.run(until=now())
+
+        self.assertEqual(self.exposure_series(), [
+            (self.at(0, 0), self.control.pk, 2),
+            (self.at(1, 0), self.treatment.pk, 1),
+        ])
+        self.assertEqual(self.goal_series(), [
+            (self.at(1, 0), self.control.pk, 1, 2.0),
+            (self.at(2, 0), self.treatment.pk, 1, 3.0),
+        ])
+
+        TimeSeriesRollup('day').run(until=now())
+
+        self.assertEqual(self.exposure_series('day'), [
+            (self.start, self.treatment.pk, 1),
+            (self.start, self.control.pk, 2),
+        ])
+        self.assertEqual(self.goal_series('day'), [
+            (self.start, self.treatment.pk, 1, 3.0),
+            (self.start, self.control.pk, 1, 2.0),
+        ])
+
+    def test_incremental_runs_are_idempotent(self):
+        first, second, third = self.users
+
+        self.expose(self.control, self.at(0), user=first)
+        self.achieve(self.at(3), user=second)
+        self.hourly.run(until=now())
+
+        # A late exposure for an old hour, and the exposure of a unit that
+        # achieved the goal before this run
+        self.expose(self.control, self.at(0, 30), user=third)
+        self.expose(self.treatment, self.at(4), user=second)
+        self.hourly.run(until=now())
+
+        incremental = (self.exposure_series(), self.goal_series())
+
+        self.assertEqual(incremental[0], [
+            (self.at(0, 0), self.control.pk, 2),
+            (self.at(4, 0), self.treatment.pk, 1),
+        ])
+        self.assertEqual(incremental[1], [(self.at(3, 0), self.treatment.pk, 1, 1.0)])
+
+        self.hourly.run(until=now())
+        self.assertEqual((self.exposure_series(), self.goal_series()), incremental)
+
+        self.hourly.run(until=now(), rebuild=True)
+        self.assertEqual((self.exposure_series(), self.goal_series()), incremental)
+
+    def test_estimated_exposures(self):
+        first, second, third = self.users
+
+        self.expose(self.control, self.at(0), user=first, sample_rate=0.25)
+        self.expose(self.control, self.at(0, 20), user=second, sample_rate=0.5)
+        self.expose(self.treatment, self.at(1), user=third)
+        self.hourly.run(until=now())
+
+        self.assertEqual(
+            [
+                (row.bucket, row.variation_id, row.exposures, row.estimated_exposures)
+                for row in self.experiment.get_exposure_series('hour')
+            ],
+            [
+                (self.at(0, 0), self.control.pk, 2, 6.0),
+                (self.at(1, 0), self.treatment.pk, 1, 1.0),
+            ]
+        )
+
+    def test_invalid_granularity(self):
+        with self.assertRaises(ValueError):
+            TimeSeriesRollup('minute')
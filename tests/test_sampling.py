@@ -0,0 +1,167 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from planout_experiments.models import DJANGO_USER_DB_ID, Experiment, Exposure, Variation
+from planout_experiments.sampling import ExposureRateLimiter, rate_limiter, unit_in_sample
+from planout_experiments.sinks import write_exposures
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+from .test_registry import FakeTimer
+
+
+class UnitSamplingTests(TestCase):
+    def test_sampling_is_deterministic(self):
+        sampled = [unit for unit in range(1000) if unit_in_sample('salt', unit, 0.2)]
+
+        self.assertEqual(sampled, [unit for unit in range(1000) if unit_in_sample('salt', unit, 0.2)])
+        self.assertAlmostEqual(len(sampled) / 1000, 0.2, delta=0.05)
+
+    def test_lower_rates_are_subsets(self):
+        low = {unit for unit in range(1000) if unit_in_sample('salt', unit, 0.1)}
+        high = {unit for unit in range(1000) if unit_in_sample('salt', unit, 0.5)}
+
+        self.assertTrue(low < high)
+
+    def test_full_rate_keeps_every_unit(self):
+        self.assertTrue(all(unit_in_sample('salt', unit, 1.0) for unit in range(100)))
+
+
+class ExposureRateLimiterTests(TestCase):
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.limiter = ExposureRateLimiter(timer=self.timer)
+
+    def test_under_budget_admits_everything(self):
+        self.assertEqual([self.limiter.admit_probability(1, 5) for _ in range(5)], [1.0] * 5)
+
+    def test_over_budget_scales_down(self):
+        probabilities = [self.limiter.admit_probability(1, 5) for _ in range(10)]
+        self.assertEqual(probabilities[-1], 0.5)
+
+        # The busy previous second keeps throttling the next one
+        self.timer.now = 1.5
+        self.assertEqual(self.limiter.admit_probability(1, 5), 0.5)
+
+        self.timer.now = 3
+        self.assertEqual(self.limiter.admit_probability(1, 5), 1.0)
+
+    def test_counts_every_exposure_row(self):
+        self.assertEqual(self.limiter.admit_probability(1, 5, count=5), 1.0)
+        self.assertEqual(self.limiter.admit_probability(1, 5, count=5), 0.5)
+
+    def test_experiments_have_separate_budgets(self):
+        for _ in range(10):
+            self.limiter.admit_probability(1, 5)
+
+        self.assertEqual(self.limiter.admit_probability(2, 5), 1.0)
+
+
+class ExposureSamplingTests(TestCase):
+    def setUp(self):
+        rate_limiter.clear()
+        self.addCleanup(rate_limiter.clear)
+
+        # Every exposure falls into one rate limiting window
+        timer = mock.patch.object(rate_limiter, '_timer', FakeTimer())
+        timer.start()
+        self.addCleanup(timer.stop)
+
+        self.users = [User.objects.create_user(username='user_{}'.format(i)) for i in range(200)]
+        self.experiment = Experiment.objects.create(name='Sampled', planout_json=EXAMPLE_EXPERIMENT_JSON)
+
+    def expose_all(self):
+        for user in self.users:
+            self.experiment.get_trial_for_user(user).get_params()
+
+    def test_unit_sampling(self):
+        self.experiment.exposure_sample_rate = 0.25
+        self.expose_all()
+
+        exposed_units = set(Exposure.objects.values_list('event_user', flat=True))
+        expected = {user.pk for user in self.users if unit_in_sample(self.experiment.salt, user.pk, 0.25)}
+
+        self.assertEqual(exposed_units, expected)
+        self.assertEqual(set(Exposure.objects.values_list('sample_rate', flat=True)), {0.25})
+
+        Variation.reconcile_exposure_counts(self.experiment)
+        self.assertEqual(sum(self.experiment.get_estimated_exposures().values()), Exposure.objects.count() * 4)
+
+    def test_zero_rate_logs_nothing(self):
+        self.experiment.exposure_sample_rate = 0
+        self.expose_all()
+
+        self.assertFalse(Exposure.objects.exists())
+
+    def test_rate_limit(self):
+        self.experiment.max_exposures_per_second = 50
+
+        with mock.patch('planout_experiments.sampling.random.random', return_value=0.0):
+            self.expose_all()
+
+        rates = list(Exposure.objects.order_by('pk').values_list('sample_rate', flat=True))
+        self.assertEqual(rates[0], 1.0)
+        self.assertLess(rates[-1], 1.0)
+
+    def full_rate_units(self, budget):
+        """
+        How many leading units fit into ``budget`` exposure rows, each
+        unit logs one row per parameter it is assigned
+        """
+        rows = 0
+
+        for units, assignment in enumerate(self.experiment.assign_units([user.pk for user in self.users])):
+            rows += len(assignment.params)
+
+            if rows > budget:
+                return units
+
+        return len(self.users)
+
+    def test_rate_limit_counts_exposure_rows(self):
+        self.experiment.max_exposures_per_second = 20
+        expected = self.full_rate_units(20)
+
+        with mock.patch('planout_experiments.sampling.random.random', return_value=0.0):
+            self.expose_all()
+
+        self.assertLess(expected, 20)
+        self.assertEqual(Exposure.objects.filter(sample_rate=1.0).values('event_user').distinct().count(), expected)
+
+    def test_bulk_assignment_is_sampled(self):
+        self.experiment.exposure_sample_rate = 0.25
+        user_ids = [user.pk for user in self.users]
+
+        list(self.experiment.assign_units(user_ids, log_exposures=True))
+
+        exposed_units = set(Exposure.objects.values_list('event_user', flat=True))
+        self.assertEqual(exposed_units, {pk for pk in user_ids if unit_in_sample(self.experiment.salt, pk, 0.25)})
+        self.assertEqual(set(Exposure.objects.values_list('sample_rate', flat=True)), {0.25})
+
+    def test_bulk_assignment_is_rate_limited(self):
+        self.experiment.max_exposures_per_second = 20
+        expected = self.full_rate_units(20)
+
+        with mock.patch('planout_experiments.sampling.random.random', return_value=0.0):
+            list(self.experiment.assign_units([user.pk for user in self.users], log_exposures=True))
+
+        self.assertEqual(Exposure.objects.filter(sample_rate=1.0).values('event_user').distinct().count(), expected)
+        self.assertEqual(Exposure.objects.values('event_user').distinct().count(), len(self.users))
+
+    def test_counters_are_estimated(self):
+        variation = Variation.objects.create(experiment=self.experiment, key='color', value='red')
+
+        write_exposures([
+            Exposure(
+                experiment=self.experiment,
+                variation=variation,
+                event_user=user,
+                event_user_identifier_type=DJANGO_USER_DB_ID,
+                sample_rate=0.25
+            )
+            for user in self.users[:3]
+        ])
+
+        variation.refresh_from_db()
+        self.assertEqual((variation.num_exposures, variation.estimated_exposures), (3, 12.0))
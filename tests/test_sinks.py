@@ -0,0 +1,97 @@
+import time
+
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+
+from planout_experiments.models import Experiment, Exposure, Variation
+from planout_experiments.sinks import (
+    BufferedExposureSink,
+    SynchronousExposureSink,
+    get_exposure_sink
+)
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON
+
+
+class BufferedExposureSinkTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.experiment = Experiment.objects.create(name='Sink Experiment', planout_json=EXAMPLE_EXPERIMENT_JSON)
+        self.variation = Variation.objects.create(experiment=self.experiment, key='button_text', value='blue')
+
+    def build_exposures(self, count):
+        return [
+            Exposure(experiment=self.experiment, variation=self.variation, event_user=self.user)
+            for _ in range(count)
+        ]
+
+    def test_flush_writes_queued_exposures(self):
+        sink = BufferedExposureSink(batch_size=10, flush_interval=60)
+        self.addCleanup(sink.close)
+
+        sink.submit(self.build_exposures(25))
+        sink.flush()
+
+        self.assertEqual(Exposure.objects.count(), 25)
+
+    def test_close_drains_queue(self):
+        sink = BufferedExposureSink(batch_size=100, flush_interval=60)
+
+        sink.submit(self.build_exposures(3))
+        sink.close()
+
+        self.assertEqual(Exposure.objects.count(), 3)
+        self.assertFalse(sink._worker.is_alive())
+
+    def test_full_queue_drops_exposures(self):
+        sink = BufferedExposureSink(max_queue_size=2, backpressure='drop')
+        self.addCleanup(sink.close)
+
+        # Keep the worker from draining the queue while we fill it
+        with mock.patch.object(sink, '_next_batch', side_effect=lambda q: ([], None)):
+            sink.submit(self.build_exposures(5))
+
+        self.assertEqual(sink.dropped, 3)
+
+    def test_block_timeout_covers_whole_submit(self):
+        sink = BufferedExposureSink(max_queue_size=1, backpressure='block', block_timeout=0.2)
+        self.addCleanup(sink.close)
+
+        with mock.patch.object(sink, '_next_batch', side_effect=lambda q: ([], None)):
+            started = time.monotonic()
+            sink.submit(self.build_exposures(10))
+            elapsed = time.monotonic() - started
+
+        # One item fits, the rest share a single timeout instead of one each
+        self.assertEqual(sink.dropped, 9)
+        self.assertLess(elapsed, 1.0)
+
+    def test_invalid_backpressure(self):
+        with self.assertRaises(ValueError):
+            BufferedExposureSink(backpressure='wait_forever')
+
+    @override_settings(
+        PLANOUT_EXPERIMENTS_EXPOSURE_SINK='planout_experiments.sinks.BufferedExposureSink',
+        PLANOUT_EXPERIMENTS_EXPOSURE_SINK_OPTIONS={'flush_interval': 60}
+    )
+    def test_trial_exposures_go_through_configured_sink(self):
+        sink = get_exposure_sink()
+        self.addCleanup(sink.close)
+        self.assertIsInstance(sink, BufferedExposureSink)
+
+        trial = self.experiment.get_trial_for_user(self.user)
+        self.assertEqual(trial.get('button_text'), 'blue')
+        self.assertEqual(Exposure.objects.count(), 0)
+
+        sink.flush()
+        self.assertEqual(
+            Exposure.objects.count(),
+            len(trial.get_params())
+        )
+
+
+class SynchronousExposureSinkTests(TestCase):
+    def test_default_sink(self):
+        self.assertIsInstance(get_exposure_sink(), SynchronousExposureSink)
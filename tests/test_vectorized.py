@@ -0,0 +1,85 @@
+from unittest import skipIf
+
+from django.test import TestCase
+
+from planout_experiments.models import Experiment, SingleTrial
+from planout_experiments.vectorized import np, assign_unit_array, get_vectorized_script
+
+from .test_models import EXAMPLE_EXPERIMENT_JSON, WEIGHTED_CHOICE_JSON
+
+
+def unit(var='user_id'):
+    return {"op": "get", "var": var}
+
+
+VECTORIZABLE_SCRIPT = {
+    "op": "seq",
+    "seq": [
+        {"op": "set", "var": "color", "value": {
+            "op": "uniformChoice", "choices": ["red", "green", "blue", [1, 2]], "unit": unit()
+        }},
+        {"op": "set", "var": "weighted", "value": {
+            "op": "weightedChoice", "choices": ["a", "b", "c"], "weights": [0.001, 7, 2.5], "unit": unit()
+        }},
+        {"op": "set", "var": "enrolled", "value": {"op": "bernoulliTrial", "p": 0.35, "unit": unit()}},
+        {"op": "set", "var": "offset", "value": {"op": "randomInteger", "min": -20, "max": 20, "unit": unit()}},
+        {"op": "set", "var": "discount", "value": {"op": "randomFloat", "min": 0.05, "max": 0.5, "unit": unit()}},
+        {"op": "set", "var": "shared", "value": {
+            "op": "bernoulliTrial", "p": 0.5, "salt": "shared_salt", "unit": unit()
+        }},
+        {"op": "set", "var": "dice", "value": {
+            "op": "randomInteger", "min": 1, "max": 6, "full_salt": "global_dice", "unit": unit()
+        }},
+        {"op": "set", "var": "by_country", "value": {
+            "op": "uniformChoice",
+            "choices": {"op": "array", "values": [1, 2, 3]},
+            "unit": [unit('country'), unit()]
+        }},
+        {"op": "set", "var": "button_text", "value": "blue"},
+    ]
+}
+
+
+@skipIf(np is None, "numpy is not installed")
+class VectorizedParityTests(TestCase):
+    def assertParity(self, planout_json, vectorized=True):
+        experiment = Experiment.objects.create(name='Vectorized Experiment', planout_json=planout_json)
+        units = list(range(500)) + ['device-{}'.format(i) for i in range(100)]
+
+        self.assertEqual(get_vectorized_script(experiment.get_compiled_script()) is not None, vectorized)
+
+        result = assign_unit_array(experiment, units, inputs={'country': 'NZ'})
+
+        for index, user_id in enumerate(units):
+            trial = SingleTrial(db_experiment=experiment, user_id=user_id, country='NZ')
+            trial.set_auto_exposure_logging(False)
+            expected = trial.get_params()
+
+            for name, value in expected.items():
+                self.assertEqual(result.params[name][index], value, (name, user_id))
+
+            self.assertEqual(bool(result.in_experiment[index]), trial.in_experiment)
+
+    def test_common_operators(self):
+        self.assertParity(VECTORIZABLE_SCRIPT)
+
+    def test_weighted_choice(self):
+        self.assertParity(WEIGHTED_CHOICE_JSON)
+
+    def test_unsupported_script_falls_back(self):
+        self.assertParity(EXAMPLE_EXPERIMENT_JSON, vectorized=False)
+
+    def test_unit_depending_on_script_variable_falls_back(self):
+        self.assertParity({"op": "seq", "seq": [
+            {"op": "set", "var": "bucket", "value": {"op": "randomInteger", "min": 0, "max": 9, "unit": unit()}},
+            {"op": "set", "var": "arm", "value": {"op": "uniformChoice", "choices": [1, 2], "unit": unit('bucket')}},
+        ]}, vectorized=False)
+
+    def test_returns_columns(self):
+        experiment = Experiment.objects.create(name='Vectorized Experiment', planout_json=VECTORIZABLE_SCRIPT)
+        result = assign_unit_array(experiment, range(10))
+
+        self.assertEqual(result.units, list(range(10)))
+        self.assertEqual(len(result.params['color']), 10)
+        self.assertEqual(result.params['enrolled'].dtype, np.int64)
+        self.assertTrue(result.in_experiment.all())